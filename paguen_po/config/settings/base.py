@@ -61,6 +61,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE_CLASSES = [
+    # Disabled unless PROFILING_ENABLED is True.
+    'core.middleware.ProfilingMiddleware',
+    # Disabled unless DATABASE_REPLICAS is not empty. Must come before the middleware that write,
+    # like SessionMiddleware, to see their writes.
+    'core.middleware.ReplicaPinningMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -103,6 +108,8 @@ DATABASES = {
         'PASSWORD': get_secret("db_pass"),
         'HOST': get_secret("db_host"),
         'PORT': get_secret("db_port"),
+        # Keep connections open across requests, see core.db.
+        'CONN_MAX_AGE': 10 * 60,
         'TEST': {
             'NAME': 'mytestdatabase',
         }
@@ -110,6 +117,89 @@ DATABASES = {
 }
 # https://docs.djangoproject.com/en/1.9/ref/settings/#databases
 
+# Read replicas, as a list of {"host": ..., "port": ...} under "db_replicas" in the secrets file;
+# they share the name and credentials of the primary. Tests read them from the primary.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(secrets.get("db_replicas", [])):
+    alias = 'replica_{}'.format(number)
+    DATABASES[alias] = dict(
+        DATABASES['default'], HOST=replica['host'], PORT=replica['port'], TEST={'MIRROR': 'default'}
+    )
+    DATABASE_REPLICAS.append(alias)
+DATABASE_ROUTERS = ['core.db.ReplicaRouter']
+# Seconds a client that wrote reads from the primary, maximum replication lag in seconds of a
+# replica that is read from, and seconds between the health checks of each replica.
+DATABASE_REPLICA_PIN_SECONDS = 5
+DATABASE_REPLICA_MAX_LAG = 5
+DATABASE_REPLICA_CHECK_INTERVAL = 10
+# Seconds between the pings of each persistent connection, made when a request starts.
+DATABASE_HEALTH_CHECK_INTERVAL = 30
+
+
+# Cache
+# https://docs.djangoproject.com/en/1.11/topics/cache/
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+# Cache alias and timeout (in seconds) of the households each user belongs to.
+MEMBERSHIP_CACHE = 'default'
+MEMBERSHIP_CACHE_TIMEOUT = 60 * 60
+
+# Days after which the purge_removed command deletes removed households and roommates for good.
+HOUSEHOLDS_PURGE_AFTER_DAYS = 90
+
+# Days the expense change log is kept by the prune_changes command. Clients that have not synced
+# for longer fetch the full list again (see expenses.changes).
+EXPENSES_CHANGES_RETENTION_DAYS = 30
+
+# Cache alias of the version stamps used to answer conditional GET requests.
+VERSION_CACHE = 'default'
+
+# Seconds between checks of the categories version stamp, and maximum age in seconds of the copy
+# of the categories each process keeps (see expenses.categories).
+CATEGORY_CATALOGUE_CHECK = 5
+CATEGORY_CATALOGUE_MAX_AGE = 60 * 60
+
+
+# Real-time events (see core.events). InProcessBroker only reaches the subscribers of the same
+# process; use core.events.RedisBroker when several processes serve the API.
+EVENTS_BROKER = 'core.events.InProcessBroker'
+EVENTS_REDIS_URL = 'redis://localhost:6379/0'
+# Messages kept for each subscriber that falls behind, and seconds between keepalive comments.
+EVENTS_QUEUE_SIZE = 100
+EVENTS_KEEPALIVE = 15
+
+
+# Admin change lists estimate their row count on PostgreSQL instead of counting, when the estimate is
+# above this many rows (see core.admin).
+ADMIN_EXACT_COUNT_LIMIT = 10000
+
+
+# Partition the expenses table by month (PostgreSQL 11 or newer). Takes effect when migrating;
+# see expenses.partitions and the partition_expenses command.
+EXPENSES_PARTITIONED = False
+
+
+# Background tasks (see core.tasks and the run_tasks command). Attempts per task by default,
+# seconds before the first retry (doubled on every retry), tasks of a household that may run at
+# once, seconds between the heartbeats of a running task, seconds without a heartbeat after which
+# a running task is presumed lost, and seconds idle workers wait between looks at the queue.
+TASKS_MAX_ATTEMPTS = 3
+TASKS_RETRY_DELAY = 30
+TASKS_HOUSEHOLD_CONCURRENCY = 1
+TASKS_HEARTBEAT_INTERVAL = 30
+TASKS_TIMEOUT = 5 * 60
+TASKS_POLL_INTERVAL = 1
+
+
+# Per-request profiling (see core.middleware.ProfilingMiddleware), exposed at /api/_metrics.
+PROFILING_ENABLED = False
+# Requests slower than this many seconds are logged with their SQL; None disables the log.
+PROFILING_SLOW_REQUEST = None
+
 
 # Password validation
 # https://docs.djangoproject.com/en/1.9/ref/settings/#auth-password-validators
@@ -174,6 +264,14 @@ JS_REVERSE_JS_GLOBAL_OBJECT_NAME = 'window'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 MEDIA_URL = '/media/'
 
+# Uploads waiting to be imported and exports, downloaded through the API only (see core.files).
+# Outside MEDIA_ROOT, which nginx serves to anyone. PRIVATE_MEDIA_ACCEL_REDIRECT is the internal
+# nginx location of PRIVATE_MEDIA_ROOT, None to send the files from Django. Files are deleted
+# after PRIVATE_FILES_MAX_AGE seconds by the prune_private_files command.
+PRIVATE_MEDIA_ROOT = os.path.join(BASE_DIR, 'private')
+PRIVATE_MEDIA_ACCEL_REDIRECT = None
+PRIVATE_FILES_MAX_AGE = 24 * 60 * 60
+
 NOSE_ARGS = ['--nocapture', '--nologcapture', ]
 
 CRISPY_TEMPLATE_PACK = 'bootstrap3'
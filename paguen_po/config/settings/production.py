@@ -10,3 +10,23 @@ ALLOWED_HOSTS = ["*"]
 # AWS_ACCESS_KEY_ID = get_secret("aws_access_key_id")
 # AWS_SECRET_ACCESS_KEY = get_secret("aws_secret_access_key")
 DEBUG = False
+
+# Content-hashed and precompressed static files, cached for good by nginx (see core.storage).
+STATICFILES_STORAGE = 'core.storage.CompressedManifestStaticFilesStorage'
+
+# nginx sends the private files from its internal /private/ location (see config/docker/django.conf).
+PRIVATE_MEDIA_ACCEL_REDIRECT = '/private/'
+
+# The web, worker and events containers must share the cache, so the version stamps and the
+# membership invalidations of any process (background tasks included) reach every other one.
+CACHES = {
+    'default': {
+        'BACKEND': 'django_redis.cache.RedisCache',
+        'LOCATION': get_secret("redis_url"),
+        'KEY_PREFIX': 'paguenpo',
+    }
+}
+
+# Events are published by the web workers and streamed by the events server (config.wsgi_events).
+EVENTS_BROKER = 'core.events.RedisBroker'
+EVENTS_REDIS_URL = get_secret("redis_url")
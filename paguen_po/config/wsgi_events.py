@@ -0,0 +1,21 @@
+"""
+WSGI config for the real-time event streams (/api/gastos/feed/).
+
+Server-Sent Event connections stay open for as long as the client is listening, so this entry
+point runs under uWSGI's gevent loop (``uwsgi --gevent N``), where each idle connection costs a
+greenlet instead of a whole worker. The standard library is monkey patched before Django loads, so
+broker reads and sleeps yield to other connections. psycopg2 is a C extension that monkey patching
+does not reach: psycogreen makes it wait for the database through gevent too, so the queries of the
+authentication and membership checks do not stall every other stream.
+"""
+from gevent import monkey
+monkey.patch_all()
+
+from psycogreen.gevent import patch_psycopg  # noqa
+patch_psycopg()
+
+import os  # noqa
+os.environ.setdefault("DJANGO_SETTINGS_MODULE", "paguen_po.config.settings.production")
+
+from django.core.wsgi import get_wsgi_application  # noqa
+application = get_wsgi_application()
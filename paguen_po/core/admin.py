@@ -1,3 +1,114 @@
+import json
+
+from django.conf import settings
 from django.contrib import admin
+from django.contrib.admin.views.main import ORDER_VAR, PAGE_VAR, ChangeList
+from django.core.paginator import Paginator
+from django.db import connections
+from django.utils.functional import cached_property
+
+from . import tasks
+from .models import Task
+
+# Query parameter of the keyset pages of the change lists (see KeysetChangeList).
+KEYSET_VAR = 'pk__lt'
+
+
+def estimate_count(queryset):
+    """Returns the planner's estimate of the number of rows of `queryset` on PostgreSQL, or None.
+
+    Unfiltered querysets read the statistics of the table, and of its partitions if it has any,
+    from pg_class; filtered ones ask EXPLAIN.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    with connection.cursor() as cursor:
+        if not queryset.query.where:
+            table = queryset.model._meta.db_table
+            cursor.execute(
+                "SELECT coalesce(sum(greatest(reltuples, 0)), 0) FROM pg_class WHERE oid = %s::regclass "
+                "OR oid IN (SELECT inhrelid FROM pg_inherits WHERE inhparent = %s::regclass)", [table, table]
+            )
+            return int(cursor.fetchone()[0])
+        sql, params = queryset.query.sql_with_params()
+        cursor.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+        plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows'])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator that takes the planner's estimate of the row count instead of running COUNT(*),
+    when it is above ADMIN_EXACT_COUNT_LIMIT.
+    """
+    estimated = False
+
+    @cached_property
+    def count(self):
+        estimate = estimate_count(self.object_list)
+        if estimate is not None and estimate > settings.ADMIN_EXACT_COUNT_LIMIT:
+            self.estimated = True
+            return estimate
+        return self.object_list.count()
+
+
+class KeysetChangeList(ChangeList):
+    """Change list that, in its default newest first order, pages forward from the last row shown
+    (`pk__lt`) instead of with an OFFSET, so every page costs the same.
+
+    Sorting by a column falls back to numbered pages.
+    """
+
+    def get_results(self, request):
+        super(KeysetChangeList, self).get_results(request)
+        self.count_estimated = getattr(self.paginator, 'estimated', False)
+        self.keyset = ORDER_VAR not in self.params
+        self.first_page_url = None
+        if KEYSET_VAR in self.params:
+            self.first_page_url = self.get_query_string(remove=[KEYSET_VAR, PAGE_VAR])
+        self.next_page_url = None
+        if self.keyset and self.multi_page and not self.show_all:
+            self.result_list = list(self.result_list)
+            if len(self.result_list) == self.list_per_page:
+                self.next_page_url = self.get_query_string({KEYSET_VAR: self.result_list[-1].pk}, [PAGE_VAR])
+
+
+class ScalableAdminMixin(object):
+    """Admin options for tables too big to count or to page through with offsets.
+
+    Row counts are estimated (see EstimatedCountPaginator), the total without filters is not
+    counted, and the change list pages by primary key (see KeysetChangeList). Set
+    list_select_related for what list_display shows, and raw_id_fields for foreign keys to big
+    tables.
+    """
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+    ordering = ('-pk',)
+    change_list_template = 'admin/keyset_change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+
+class TaskNameFilter(admin.SimpleListFilter):
+    """Lists the registered task names instead of reading the distinct names of the table."""
+    title = 'nombre'
+    parameter_name = 'name'
+
+    def lookups(self, request, model_admin):
+        return [(name, name) for name in sorted(tasks.REGISTRY)]
+
+    def queryset(self, request, queryset):
+        return queryset.filter(name=self.value()) if self.value() else queryset
+
+
+class TaskAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('name', 'household', 'status', 'attempts', 'created', 'started', 'finished', 'worker')
+    list_filter = ('status', TaskNameFilter)
+    list_select_related = ('household',)
+    raw_id_fields = ('household', 'user')
+    readonly_fields = ('uuid', 'attempts', 'started', 'heartbeat', 'finished', 'worker', 'result', 'error')
 
-# Register your models here.
+admin.site.register(Task, TaskAdmin)
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from django.conf.urls import url
+from core import views as core_views
 from expenses import views as expenses_views
 from households import views as households_views
 
@@ -8,7 +9,24 @@ urlpatterns = [
 
     url(r'^gastos/$', expenses_views .ExpensesList.as_view(), name="expenses"),
     url(r'^gastos/categorias/$', expenses_views .CategoryList.as_view(), name="categories"),
+    url(r'^gastos/search/$', expenses_views.ExpenseSearch.as_view(), name="expenses_search"),
+    url(r'^gastos/changes/$', expenses_views.ExpenseChanges.as_view(), name="expense_changes"),
+    url(r'^gastos/feed/$', expenses_views.ExpenseFeed.as_view(), name="expense_feed"),
+    url(r'^gastos/settle/$', expenses_views.ExpenseSettle.as_view(), name="expenses_settle"),
+    url(r'^gastos/(?P<pk>\d+)/division/$', expenses_views.ExpenseSplit.as_view(), name="expense_split"),
+    url(r'^gastos/import/$', expenses_views.ExpenseImport.as_view(), name="expenses_import"),
+    url(r'^gastos/export\.(?P<export_format>csv|ndjson)$', expenses_views.ExpenseExport.as_view(),
+        name="expenses_export"),
 
-    url(r'^viviendas/', households_views.HouseholdList.as_view(), name="households")
+    url(r'^viviendas/(?P<pk>\d+)/balance/$', households_views.HouseholdBalance.as_view(), name="household_balance"),
+    url(r'^viviendas/', households_views.HouseholdList.as_view(), name="households"),
+
+    url(r'^bootstrap/$', core_views.Bootstrap.as_view(), name="bootstrap"),
+
+    url(r'^tareas/$', core_views.TaskList.as_view(), name="tasks"),
+    url(r'^tareas/(?P<uuid>[0-9a-f-]{36})/$', core_views.TaskDetail.as_view(), name="task"),
+    url(r'^tareas/(?P<uuid>[0-9a-f-]{36})/descarga/$', core_views.TaskDownload.as_view(), name="task_download"),
+
+    url(r'^_metrics$', core_views.Metrics.as_view(), name="metrics")
 
 ]
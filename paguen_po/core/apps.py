@@ -1,5 +1,11 @@
 from django.apps import AppConfig
+from django.utils.module_loading import autodiscover_modules
 
 
 class CoreConfig(AppConfig):
     name = 'core'
+
+    def ready(self):
+        from . import checks, db  # noqa
+        # Register the background tasks of every app (see core.tasks).
+        autodiscover_modules('tasks')
@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""Benchmark of the REST API (see the benchmark_api management command).
+
+Seeds synthetic households, roommates, categories and expenses, then measures the latency, the
+number of queries and the peak memory of every endpoint in core.api.
+"""
+import math
+import time
+import tracemalloc
+from collections import OrderedDict
+from itertools import islice
+
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from core import api, tasks
+from expenses import rollups, shares
+from expenses.models import Category, Expense
+from households.models import Household, Roommate
+
+BATCH_SIZE = 5000
+DESCRIPTIONS = ('luz', 'agua', 'gas', 'internet', 'supermercado', 'farmacia', 'arriendo')
+
+
+class Dataset(object):
+    """Ids of the seeded rows the requests point to."""
+
+    def __init__(self, user, household_id, task_id, expense_id):
+        self.user = user
+        self.household_id = household_id
+        self.task_id = task_id
+        self.expense_id = expense_id
+
+
+def seed(households, roommates, categories, expenses):
+    """Creates the synthetic data and returns a Dataset.
+
+    `expenses` rows are spread evenly over the households, their roommates, the categories and the
+    last months. Signals are skipped (bulk_create), so the rollups and shares are rebuilt at the
+    end.
+    """
+    category_ids = [
+        category.pk for category in Category.objects.bulk_create(
+            Category(name="bench-category-{}".format(number)) for number in range(categories)
+        )
+    ] or list(Category.objects.values_list('id', flat=True))
+    Household.objects.bulk_create(Household(name="bench-{}".format(number)) for number in range(households))
+    household_ids = list(Household.objects.filter(name__startswith="bench-").values_list('id', flat=True))
+    User.objects.bulk_create(
+        User(username="bench-{}-{}".format(household_id, number), password='!')
+        for household_id in household_ids for number in range(roommates)
+    )
+    users = {user.username: user.pk for user in User.objects.filter(username__startswith="bench-")}
+    Roommate.objects.bulk_create(
+        Roommate(household_id=household_id, user_id=users["bench-{}-{}".format(household_id, number)])
+        for household_id in household_ids for number in range(roommates)
+    )
+    roommates = list(Roommate.objects.filter(household_id__in=household_ids).values_list('id', 'household_id'))
+
+    def rows():
+        for number in range(expenses):
+            months_ago = number // len(roommates) % 120
+            roommate_id, household_id = roommates[number % len(roommates)]
+            yield Expense(
+                amount=1000 + number % 50000,
+                description="{} {}".format(DESCRIPTIONS[number % len(DESCRIPTIONS)], number),
+                category_id=category_ids[number % len(category_ids)] if category_ids else None,
+                roommate_id=roommate_id,
+                household_id=household_id,
+                year=2017 - months_ago // 12,
+                month=12 - months_ago % 12,
+                status=Expense.STATUS.PAID if number % 3 else Expense.STATUS.PENDING
+            )
+
+    rows = rows()
+    while True:
+        batch = list(islice(rows, BATCH_SIZE))
+        if not batch:
+            break
+        Expense.objects.bulk_create(batch)
+    rollups.rebuild()
+    shares.recompute()
+
+    household_id = household_ids[0]
+    user = User.objects.get(username="bench-{}-0".format(household_id))
+    task = tasks.enqueue('expenses.rebuild_rollups', household_id, user)
+    expense_id = Expense.objects.filter(household_id=household_id).values_list('id', flat=True).first()
+    return Dataset(user, household_id, task.uuid, expense_id)
+
+
+def import_file(dataset):
+    lines = ["amount,category,roommate,year,month"]
+    lines.extend("{},,{},2017,1".format(number + 1, dataset.user.username) for number in range(100))
+    return SimpleUploadedFile("bench.csv", "\n".join(lines).encode('utf-8'))
+
+
+# How to request each endpoint of core.api: a function of the Dataset returning
+# (method, URL kwargs, query parameters or form data), or None to skip the endpoint.
+ENDPOINTS = OrderedDict([
+    ('expenses', lambda data: ('get', {}, {'household': data.household_id})),
+    ('categories', lambda data: ('get', {}, {})),
+    ('expenses_search', lambda data: ('get', {}, {'household': data.household_id, 'q': 'luz'})),
+    ('expense_changes', lambda data: ('get', {}, {'household': data.household_id, 'since': 0})),
+    ('expense_feed', None),  # Streams until the client disconnects.
+    ('expenses_import', lambda data: (
+        'post', {}, {'household': data.household_id, 'file': import_file(data)}
+    )),
+    # Only the warm-up request changes expenses; the measured ones find them settled already.
+    ('expenses_settle', lambda data: ('post', {}, {'household': data.household_id, 'status': 'PAID'})),
+    ('expense_split', lambda data: (
+        'post', {'pk': data.expense_id}, {'household': data.household_id, 'split': 'EQUAL'}
+    )),
+    ('expenses_export', lambda data: ('get', {'export_format': 'ndjson'}, {'household': data.household_id})),
+    ('household_balance', lambda data: ('get', {'pk': data.household_id}, {})),
+    ('households', lambda data: ('get', {}, {})),
+    ('bootstrap', lambda data: ('get', {}, {'household': data.household_id})),
+    ('tasks', lambda data: ('get', {}, {'household': data.household_id})),
+    ('task', lambda data: ('get', {'uuid': data.task_id}, {})),
+    ('task_download', None),  # The seeded task writes no file.
+    ('metrics', None),  # Staff only.
+])
+
+
+def percentile(values, fraction):
+    """Returns the nearest-rank percentile of a list of numbers."""
+    values = sorted(values)
+    return values[max(0, int(math.ceil(fraction * len(values))) - 1)]
+
+
+def request(client, name, spec, dataset):
+    method, kwargs, data = spec(dataset)
+    response = getattr(client, method)(reverse('api:{}'.format(name), kwargs=kwargs), data)
+    if response.streaming:
+        for _ in response.streaming_content:
+            pass
+    return response
+
+
+def measure(name, spec, dataset, repeat):
+    """Returns the measurements of an endpoint, after a warm-up request."""
+    client = Client()
+    client.force_login(dataset.user)
+    request(client, name, spec, dataset)
+
+    latencies = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        request(client, name, spec, dataset)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+    # Queries and memory are measured apart, so their overhead does not skew the latencies.
+    tracemalloc.start()
+    try:
+        with CaptureQueriesContext(connection) as queries:
+            response = request(client, name, spec, dataset)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return OrderedDict([
+        ('status', response.status_code),
+        ('p50_ms', round(percentile(latencies, 0.50), 3)),
+        ('p95_ms', round(percentile(latencies, 0.95), 3)),
+        ('queries', len(queries)),
+        ('peak_memory_kb', round(peak / 1024.0, 1)),
+    ])
+
+
+def endpoint_names():
+    """Returns the names of the endpoints in core.api."""
+    return [pattern.name for pattern in api.urlpatterns if pattern.name]
+
+
+def check_budgets(results, budgets):
+    """Returns a message for every measurement above its budget.
+
+    `budgets` maps endpoint names to {measurement: maximum}; an unexpected status is a violation
+    too.
+    """
+    violations = []
+    for name, measurements in results.items():
+        if measurements is None:
+            continue
+        if measurements['status'] >= 400:
+            violations.append("{}: answered {}".format(name, measurements['status']))
+        for key, maximum in sorted(budgets.get(name, {}).items()):
+            if measurements[key] > maximum:
+                violations.append("{}: {} is {}, over the budget of {}".format(name, key, measurements[key], maximum))
+    return violations
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""System checks of the static assets referenced by the project templates.
+
+Templates must link static files with the `static` tag, so the hashed name is used once
+collectstatic has run (see core.storage). A hard-coded STATIC_URL path would point to a name that
+nginx does not let browsers cache for good, and that may be stale. When the manifest of the
+hashed files is there, every file the templates name must be in it.
+"""
+import os
+import re
+
+from django.apps import apps
+from django.conf import settings
+from django.contrib.staticfiles.storage import ManifestFilesMixin, staticfiles_storage
+from django.core.checks import Error, Tags, register
+
+STATIC_TAG = re.compile(r"""{%\s*static\s+(['"])(?P<path>[^'"]+)\1""")
+
+
+def template_files():
+    """Yields the paths of the templates of the project and its apps, leaving out third parties."""
+    directories = [directory for engine in settings.TEMPLATES for directory in engine.get('DIRS', [])]
+    directories.extend(
+        os.path.join(app_config.path, 'templates') for app_config in apps.get_app_configs()
+        if app_config.path.startswith(settings.BASE_DIR + os.sep)
+    )
+    for directory in directories:
+        for root, _, names in os.walk(directory):
+            for name in sorted(names):
+                if name.endswith(('.html', '.txt', '.xml')):
+                    yield os.path.join(root, name)
+
+
+@register(Tags.templates)
+def check_static_references(app_configs, **kwargs):
+    hard_coded = re.compile(r"""(?:src|href)\s*=\s*["']{}|STATIC_URL""".format(re.escape(settings.STATIC_URL)))
+    manifest = isinstance(staticfiles_storage, ManifestFilesMixin) and bool(staticfiles_storage.hashed_files)
+    errors = []
+    for path in template_files():
+        with open(path, encoding='utf-8') as template:
+            lines = template.read().splitlines()
+        for number, line in enumerate(lines, 1):
+            location = "{}:{}".format(os.path.relpath(path, settings.BASE_DIR), number)
+            if hard_coded.search(line):
+                errors.append(Error(
+                    "{} links a static file without the static tag, so its name is not hashed.".format(location),
+                    hint="Use {% static '<path>' %}.",
+                    id='core.E001',
+                ))
+            if not manifest:
+                continue
+            for match in STATIC_TAG.finditer(line):
+                try:
+                    staticfiles_storage.stored_name(match.group('path'))
+                except ValueError:
+                    errors.append(Error(
+                        "{} links '{}', which is not in the static files manifest.".format(
+                            location, match.group('path')
+                        ),
+                        hint="Fix the path, or run collectstatic.",
+                        id='core.E002',
+                    ))
+    return errors
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Conditional GET (ETag) support for API views.
+
+Each cacheable resource has a version scope (for example 'expenses:<household id>') whose stamp,
+the time of its last change, is kept in the cache named by VERSION_CACHE. Writers bump the stamp,
+and views answer 304 Not Modified when the client already has the current one, without running
+their query or serializer.
+
+There is no Last-Modified header: it only has whole seconds, so a client that read a resource
+would be told it had not changed by a change made within the same second.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.views.decorators.http import condition
+
+
+def _cache():
+    return caches[settings.VERSION_CACHE]
+
+
+def _cache_key(scope):
+    return 'version:{}'.format(scope)
+
+
+def get_version(scope):
+    """Returns the stamp of a scope, starting a new one if the cache has none."""
+    cache = _cache()
+    key = _cache_key(scope)
+    stamp = cache.get(key)
+    if stamp is None:
+        # A missing stamp may hide changes, so it is replaced with the current time.
+        cache.add(key, time.time(), None)
+        stamp = cache.get(key)
+    return stamp
+
+
+def now_and_on_commit(function):
+    """Calls `function` now and, inside a transaction, again once it commits.
+
+    The first call serves the rest of the transaction. Until the commit, other requests still
+    read the data as it was, and may cache it or tag it with the new stamp; the second call
+    undoes that.
+    """
+    function()
+    if transaction.get_connection().in_atomic_block:
+        transaction.on_commit(function)
+
+
+def bump_version(*scopes):
+    """Marks the given scopes as changed now, and again once the current transaction commits."""
+    keys = [_cache_key(scope) for scope in scopes]
+    now_and_on_commit(lambda: _cache().set_many({key: time.time() for key in keys}, None))
+
+
+class ConditionalGetMixin(object):
+    """Adds an ETag header to GET responses and answers 304 when it matches.
+
+    Subclasses define get_version_scope(). The ETag covers the scope stamp, the full path and the
+    Accept header, so each page and representation of a resource gets its own tag.
+    """
+
+    def get_version_scope(self):
+        raise NotImplementedError("ConditionalGetMixin requires get_version_scope().")
+
+    def get_version_stamp(self):
+        """Returns the stamp of the view's scope, read once per request."""
+        if not hasattr(self, '_version_stamp'):
+            self._version_stamp = get_version(self.get_version_scope())
+        return self._version_stamp
+
+    def get(self, request, *args, **kwargs):
+        stamp = self.get_version_stamp()
+
+        def etag(request, *args, **kwargs):
+            key = "{!r}:{}:{}".format(stamp, request.get_full_path(), request.META.get('HTTP_ACCEPT', ''))
+            return hashlib.md5(key.encode('utf-8')).hexdigest()
+
+        view = condition(etag_func=etag)(super(ConditionalGetMixin, self).get)
+        return view(request, *args, **kwargs)
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Read replicas and persistent connections.
+
+Writes always go to the `default` (primary) database. Views that opt in with ReplicaReadsMixin
+read from one of the DATABASE_REPLICAS aliases while answering safe requests, unless:
+
+- the request wrote something, or its client did in the last DATABASE_REPLICA_PIN_SECONDS (see
+  core.middleware.ReplicaPinningMiddleware), so clients read their own writes;
+- the version stamp of the resource (see core.conditional) is younger than
+  DATABASE_REPLICA_MAX_LAG, so an ETag is never paired with data older than its stamp;
+- no replica passed its last health check: it must answer and lag DATABASE_REPLICA_MAX_LAG
+  seconds at most. Replicas are checked at most every DATABASE_REPLICA_CHECK_INTERVAL seconds.
+
+Connections are persistent (CONN_MAX_AGE), so each worker thread keeps one per database open
+across requests. When a request starts, the ones not checked in the last
+DATABASE_HEALTH_CHECK_INTERVAL seconds are pinged, and discarded if they no longer answer.
+"""
+import random
+import threading
+import time
+
+from django.conf import settings
+from django.core.signals import request_started
+from django.db import DEFAULT_DB_ALIAS, DatabaseError, connections
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework.permissions import SAFE_METHODS
+
+from .metrics import registry
+
+_state = threading.local()
+_health_lock = threading.Lock()
+# (healthy, time of the check) by replica alias, shared by the threads of the process.
+_health = {}
+
+
+def reset(pinned=False):
+    """Starts routing a new request, reading from the primary."""
+    _state.replica = None
+    _state.pinned = pinned
+    _state.wrote = False
+
+
+def wrote():
+    """Returns True if the current request wrote to the database."""
+    return getattr(_state, 'wrote', False)
+
+
+def read_from_replica(stamp=None):
+    """Sends the next reads of the current request to a healthy replica, if any.
+
+    `stamp` is the version stamp of the resource being read, if it has one. Returns the alias
+    reads go to.
+    """
+    alias = DEFAULT_DB_ALIAS
+    recent = stamp is not None and time.time() - stamp < settings.DATABASE_REPLICA_MAX_LAG
+    if not getattr(_state, 'pinned', False) and not recent:
+        replicas = healthy_replicas()
+        if replicas:
+            alias = random.choice(replicas)
+    _state.replica = alias if alias != DEFAULT_DB_ALIAS else None
+    registry.increment('paguenpo_db_replica_requests_total', alias=alias)
+    return alias
+
+
+def read_from_primary():
+    _state.replica = None
+
+
+def replication_lag(cursor):
+    """Returns how many seconds the server of `cursor` lags behind its primary, 0 if it is not a
+    replica or has replayed everything it received.
+    """
+    if cursor.db.vendor != 'postgresql':
+        return 0
+    if cursor.db.pg_version >= 100000:
+        received, replayed = 'pg_last_wal_receive_lsn()', 'pg_last_wal_replay_lsn()'
+    else:
+        received, replayed = 'pg_last_xlog_receive_location()', 'pg_last_xlog_replay_location()'
+    cursor.execute(
+        "SELECT CASE WHEN NOT pg_is_in_recovery() OR {} = {} THEN 0 "
+        "ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()) END".format(received, replayed)
+    )
+    return float(cursor.fetchone()[0] or 0)
+
+
+def check_replica(alias):
+    """Returns True if a replica answers and lags DATABASE_REPLICA_MAX_LAG seconds at most."""
+    try:
+        with connections[alias].cursor() as cursor:
+            lag = replication_lag(cursor)
+    except DatabaseError:
+        connections[alias].close()
+        healthy = False
+    else:
+        registry.observe('paguenpo_db_replica_lag_seconds', lag, alias=alias)
+        healthy = lag <= settings.DATABASE_REPLICA_MAX_LAG
+    if not healthy:
+        registry.increment('paguenpo_db_replica_checks_failed_total', alias=alias)
+    return healthy
+
+
+def healthy_replicas():
+    """Returns the aliases of the replicas that passed their last health check, checking again the
+    ones whose check is older than DATABASE_REPLICA_CHECK_INTERVAL.
+    """
+    now = time.monotonic()
+    healthy = []
+    for alias in settings.DATABASE_REPLICAS:
+        with _health_lock:
+            status, checked = _health.get(alias, (False, None))
+        if checked is None or now - checked > settings.DATABASE_REPLICA_CHECK_INTERVAL:
+            status = check_replica(alias)
+            with _health_lock:
+                _health[alias] = (status, now)
+        if status:
+            healthy.append(alias)
+    return healthy
+
+
+class ReplicaRouter(object):
+    """Sends the reads of the requests allowed to use a replica to it, and everything else to the
+    primary. The first write of a request pins the rest of it to the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if getattr(_state, 'pinned', False):
+            return DEFAULT_DB_ALIAS
+        return getattr(_state, 'replica', None) or DEFAULT_DB_ALIAS
+
+    def db_for_write(self, model, **hints):
+        _state.pinned = True
+        _state.wrote = True
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Replicas hold the same rows as the primary.
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        return db == DEFAULT_DB_ALIAS
+
+
+class ReplicaReadsMixin(object):
+    """Lets an API view read from a replica when answering safe requests.
+
+    Authentication and permission checks still read from the primary. Views with a version scope
+    (see core.conditional.ConditionalGetMixin) read from the primary while the stamp is recent.
+    """
+
+    def initial(self, request, *args, **kwargs):
+        super(ReplicaReadsMixin, self).initial(request, *args, **kwargs)
+        if request.method in SAFE_METHODS:
+            stamp = self.get_version_stamp() if hasattr(self, 'get_version_stamp') else None
+            read_from_replica(stamp)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        read_from_primary()
+        return super(ReplicaReadsMixin, self).finalize_response(request, response, *args, **kwargs)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    connection.health_checked = time.monotonic()
+    registry.increment('paguenpo_db_connections_opened_total', alias=connection.alias)
+
+
+@receiver(request_started)
+def check_connections(**kwargs):
+    """Discards the persistent connections that stopped answering since their last check."""
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None or connection.in_atomic_block:
+            continue
+        if now - getattr(connection, 'health_checked', now) < settings.DATABASE_HEALTH_CHECK_INTERVAL:
+            continue
+        connection.health_checked = now
+        if not connection.is_usable():
+            connection.close()
+            registry.increment('paguenpo_db_connections_discarded_total', alias=connection.alias)
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""Publish/subscribe of real-time events.
+
+Events are published to named channels once the transaction that caused them commits. The broker
+is set with EVENTS_BROKER: InProcessBroker only reaches subscribers of the same process, which is
+enough for runserver; RedisBroker fans out across processes and servers.
+"""
+import json
+import logging
+import queue
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessBroker(object):
+    """Delivers messages to the subscribers of the current process."""
+
+    class Subscription(object):
+        def __init__(self, broker, channel):
+            self.broker = broker
+            self.channel = channel
+            self.queue = queue.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+
+        def get(self, timeout):
+            """Returns the next message, or None if none arrives within `timeout` seconds."""
+            try:
+                return self.queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+
+        def close(self):
+            self.broker._unsubscribe(self)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._subscriptions = defaultdict(set)
+
+    def publish(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            try:
+                subscription.queue.put_nowait(message)
+            except queue.Full:
+                # A subscriber that does not keep up loses messages instead of blocking publishers.
+                pass
+
+    def subscribe(self, channel):
+        subscription = self.Subscription(self, channel)
+        with self._lock:
+            self._subscriptions[channel].add(subscription)
+        return subscription
+
+    def _unsubscribe(self, subscription):
+        with self._lock:
+            self._subscriptions[subscription.channel].discard(subscription)
+            if not self._subscriptions[subscription.channel]:
+                del self._subscriptions[subscription.channel]
+
+
+class RedisBroker(InProcessBroker):
+    """Delivers messages through Redis pub/sub, to subscribers in any process.
+
+    Each process keeps a single Redis connection, read by a background thread that hands the
+    messages to the local subscribers. A process only receives the events of the households its
+    clients follow. Requires the `redis` package and EVENTS_REDIS_URL.
+
+    redis-py's PubSub is not thread safe, so only the listener thread uses it: between two reads it
+    subscribes to the channels local subscribers joined and unsubscribes from those they all
+    left. A new subscriber may miss the events of its first `poll_interval` seconds; clients catch
+    up with /api/gastos/changes/.
+    """
+    # Seconds the listener waits for a message before it looks at the subscriptions again.
+    poll_interval = 0.1
+
+    def __init__(self):
+        import redis
+        super(RedisBroker, self).__init__()
+        self.client = redis.StrictRedis.from_url(settings.EVENTS_REDIS_URL)
+        self._listener = None
+        self._listener_lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self.client.publish(channel, message)
+
+    def subscribe(self, channel):
+        with self._listener_lock:
+            if self._listener is None:
+                self._listener = threading.Thread(target=self._listen, name='events-listener')
+                self._listener.daemon = True
+                self._listener.start()
+        return super(RedisBroker, self).subscribe(channel)
+
+    def _listen(self):
+        while True:
+            pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+            subscribed = set()
+            try:
+                while True:
+                    with self._lock:
+                        wanted = set(self._subscriptions)
+                    if wanted - subscribed:
+                        pubsub.subscribe(*(wanted - subscribed))
+                    if subscribed - wanted:
+                        pubsub.unsubscribe(*(subscribed - wanted))
+                    subscribed = wanted
+                    if not subscribed:
+                        time.sleep(self.poll_interval)
+                        continue
+                    message = pubsub.get_message(timeout=self.poll_interval)
+                    if message is not None and message['type'] == 'message':
+                        super(RedisBroker, self).publish(
+                            message['channel'].decode('utf-8'), message['data'].decode('utf-8')
+                        )
+            except Exception:
+                logger.exception("Lost the Redis events subscription, reconnecting.")
+                try:
+                    pubsub.close()
+                except Exception:
+                    pass
+                time.sleep(1)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    """Returns the broker set in EVENTS_BROKER, created on first use."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = import_string(settings.EVENTS_BROKER)()
+        return _broker
+
+
+def household_channel(household_id):
+    return 'household:{}'.format(household_id)
+
+
+def publish(channel, message):
+    """Publishes a message, logging the errors of the broker instead of raising them.
+
+    Events are best-effort: the write they announce has committed already, and clients catch up
+    with /api/gastos/changes/.
+    """
+    try:
+        get_broker().publish(channel, message)
+    except Exception:
+        logger.exception("Could not publish an event to %s.", channel)
+
+
+def publish_on_commit(channel, event, data):
+    """Publishes an event once the current transaction commits (right away outside of one)."""
+    message = json.dumps({'event': event, 'data': data}, cls=DjangoJSONEncoder)
+    transaction.on_commit(lambda: publish(channel, message))
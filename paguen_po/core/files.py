@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""Private files: uploads waiting to be imported and the files written by background tasks.
+
+They are kept under PRIVATE_MEDIA_ROOT, outside MEDIA_ROOT, so nginx never serves them on its
+own, and named after a random uuid. The API hands them out after checking who asks (see
+core.views.TaskDownload): with PRIVATE_MEDIA_ACCEL_REDIRECT set, the response only tells nginx
+which file to send from its internal location. Files older than PRIVATE_FILES_MAX_AGE seconds are
+deleted by the prune_private_files command.
+"""
+import os
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.http import FileResponse, HttpResponse
+from django.utils import timezone
+
+# Directories of the private files, by what they hold.
+DIRECTORIES = ('imports', 'exports')
+
+
+def storage():
+    return FileSystemStorage(location=settings.PRIVATE_MEDIA_ROOT, base_url=None)
+
+
+def save(directory, extension, content):
+    """Saves a file under an unguessable name in one of DIRECTORIES and returns its name."""
+    return storage().save('{}/{}.{}'.format(directory, uuid.uuid4().hex, extension), content)
+
+
+def delete(name):
+    storage().delete(name)
+
+
+def download(name, filename, content_type='application/octet-stream'):
+    """Returns a response that sends a private file as an attachment named `filename`."""
+    if settings.PRIVATE_MEDIA_ACCEL_REDIRECT:
+        response = HttpResponse(content_type=content_type)
+        response['X-Accel-Redirect'] = settings.PRIVATE_MEDIA_ACCEL_REDIRECT + name
+    else:
+        response = FileResponse(storage().open(name, 'rb'), content_type=content_type)
+    response['Content-Disposition'] = 'attachment; filename="{}"'.format(filename)
+    return response
+
+
+def prune(max_age=None):
+    """Deletes the private files older than `max_age` seconds (PRIVATE_FILES_MAX_AGE by default).
+
+    Returns how many were deleted.
+    """
+    private = storage()
+    cutoff = timezone.now() - timedelta(seconds=settings.PRIVATE_FILES_MAX_AGE if max_age is None else max_age)
+    deleted = 0
+    for directory in DIRECTORIES:
+        if not private.exists(directory):
+            continue
+        for name in private.listdir(directory)[1]:
+            path = os.path.join(directory, name)
+            if private.get_modified_time(path) < cutoff:
+                private.delete(path)
+                deleted += 1
+    return deleted
@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+import json
+from collections import OrderedDict
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from django.test.utils import setup_databases, teardown_databases
+
+from core import benchmark
+
+# Maximum measurements per endpoint, checked on every run. Query counts include the session and
+# user lookups, and must not grow with the size of the data.
+BUDGETS = {
+    'expenses': {'queries': 3},
+    'categories': {'queries': 2},
+    'expenses_search': {'queries': 4},
+    'expense_changes': {'queries': 5},
+    'expenses_settle': {'queries': 4},
+    'expense_split': {'queries': 12},
+    'expenses_import': {'queries': 7},
+    'expenses_export': {'queries': 3},
+    'household_balance': {'queries': 5},
+    'households': {'queries': 3},
+    'bootstrap': {'queries': 4},
+    'tasks': {'queries': 3},
+    'task': {'queries': 3},
+}
+
+
+class Command(BaseCommand):
+    help = ("Seeds a throwaway test database with synthetic data and measures the latency, query count "
+            "and peak memory of every API endpoint. Fails if a measurement is over its budget.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--households', type=int, default=10)
+        parser.add_argument('--roommates', type=int, default=4, help="Roommates per household.")
+        parser.add_argument('--categories', type=int, default=20)
+        parser.add_argument('--expenses', type=int, default=1000, help="Expenses in total.")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed requests per endpoint.")
+        parser.add_argument('--output', help="Write the results to this JSON file.")
+        parser.add_argument('--budgets', help="JSON file of budgets, merged over the default ones.")
+        parser.add_argument('--compare', help="Results JSON of a previous run to compare with.")
+        parser.add_argument(
+            '--tolerance', type=float, default=20.0,
+            help="Allowed p95 latency increase over --compare, in percent."
+        )
+
+    def handle(self, *args, **options):
+        budgets = {name: dict(budget) for name, budget in BUDGETS.items()}
+        if options['budgets']:
+            with open(options['budgets']) as budgets_file:
+                for name, budget in json.load(budgets_file).items():
+                    budgets.setdefault(name, {}).update(budget)
+
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            self.stdout.write("Seeding {expenses} expenses in {households} households...".format(**options))
+            dataset = benchmark.seed(
+                options['households'], options['roommates'], options['categories'], options['expenses']
+            )
+            results = OrderedDict()
+            for name in benchmark.endpoint_names():
+                spec = benchmark.ENDPOINTS.get(name, False)
+                if spec is False:
+                    raise CommandError("No benchmark defined for the '{}' endpoint.".format(name))
+                if spec is None:
+                    self.stdout.write("{:<20} skipped".format(name))
+                    results[name] = None
+                    continue
+                results[name] = benchmark.measure(name, spec, dataset, options['repeat'])
+                self.stdout.write("{:<20} {}".format(name, json.dumps(results[name])))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+            connections.close_all()
+
+        report = OrderedDict([
+            ('scale', OrderedDict(
+                (key, options[key]) for key in ('households', 'roommates', 'categories', 'expenses', 'repeat')
+            )),
+            ('endpoints', results),
+        ])
+        if options['output']:
+            with open(options['output'], 'w') as output:
+                json.dump(report, output, indent=2)
+
+        violations = benchmark.check_budgets(results, budgets)
+        if options['compare']:
+            with open(options['compare']) as previous:
+                violations.extend(self.compare(json.load(previous)['endpoints'], results, options['tolerance']))
+        for violation in violations:
+            self.stderr.write(violation)
+        if violations:
+            raise CommandError("{} benchmark budgets exceeded.".format(len(violations)))
+
+    def compare(self, previous, results, tolerance):
+        """Returns a message for every endpoint slower or chattier than in the previous run."""
+        regressions = []
+        for name, measurements in results.items():
+            before = previous.get(name)
+            if not measurements or not before:
+                continue
+            if measurements['p95_ms'] > before['p95_ms'] * (1 + tolerance / 100.0):
+                regressions.append("{}: p95 went from {} to {} ms".format(
+                    name, before['p95_ms'], measurements['p95_ms']))
+            if measurements['queries'] > before['queries']:
+                regressions.append("{}: queries went from {} to {}".format(
+                    name, before['queries'], measurements['queries']))
+        return regressions
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from core import files
+
+
+class Command(BaseCommand):
+    help = ("Deletes the private files (uploads left by failed imports, exports) older than PRIVATE_FILES_MAX_AGE. "
+            "Run it hourly.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-age', type=int, default=settings.PRIVATE_FILES_MAX_AGE,
+            help="Only delete the files written more than this many seconds ago."
+        )
+
+    def handle(self, *args, **options):
+        deleted = files.prune(options['max_age'])
+        self.stdout.write(self.style.SUCCESS("{} private files deleted.".format(deleted)))
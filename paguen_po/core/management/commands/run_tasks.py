@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+import logging
+import multiprocessing
+import signal
+import threading
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import DatabaseError, close_old_connections, connections
+
+from core import tasks
+
+logger = logging.getLogger(__name__)
+
+# Seconds between looks for the tasks of dead workers, per worker.
+REQUEUE_INTERVAL = 60
+
+
+def work(stop, poll, burst):
+    """Runs queued tasks until `stop` is set, or until none are due if `burst` is true."""
+    name = tasks.worker_name()
+    last_requeue = 0
+    while not stop.is_set():
+        try:
+            if time.monotonic() - last_requeue > REQUEUE_INTERVAL:
+                tasks.requeue_lost()
+                last_requeue = time.monotonic()
+            task = tasks.claim(name)
+        except DatabaseError:
+            # Keep the worker alive through a lost connection or a lock timeout.
+            logger.exception("Worker %s could not read the task queue.", name)
+            connections.close_all()
+            stop.wait(poll)
+            continue
+        if task is None:
+            if burst:
+                return
+            stop.wait(poll)
+        else:
+            tasks.run(task)
+        close_old_connections()
+
+
+class Command(BaseCommand):
+    help = ("Runs the queued background tasks with a pool of worker processes. "
+            "SIGTERM or Ctrl-C lets every worker finish its current task, then stops.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help="Worker processes; 1 works in this process.")
+        parser.add_argument(
+            '--poll', type=float, default=None,
+            help="Seconds idle workers wait between looks at the queue, TASKS_POLL_INTERVAL by default."
+        )
+        parser.add_argument('--burst', action='store_true', help="Stop once there are no due tasks left.")
+
+    def handle(self, *args, **options):
+        poll = options['poll'] if options['poll'] is not None else settings.TASKS_POLL_INTERVAL
+        processes = max(1, options['processes'])
+        stop = threading.Event() if processes == 1 else multiprocessing.Event()
+
+        def request_stop(signum, frame):
+            stop.set()
+
+        signal.signal(signal.SIGTERM, request_stop)
+        signal.signal(signal.SIGINT, request_stop)
+
+        if processes == 1:
+            work(stop, poll, options['burst'])
+            return
+
+        # Forked workers must open their own database connections.
+        connections.close_all()
+        pool = [
+            multiprocessing.Process(target=work, args=(stop, poll, options['burst']), name='worker-{}'.format(number))
+            for number in range(processes)
+        ]
+        for process in pool:
+            process.start()
+        self.stdout.write("Started {} workers.".format(processes))
+        for process in pool:
+            process.join()
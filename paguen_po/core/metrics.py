@@ -0,0 +1,127 @@
+# -*- coding: utf-8 -*-
+"""In-process histograms of the request profile and counters of the database connections, exposed
+in the Prometheus text format.
+
+Histograms are cumulative, as Prometheus expects: rolling percentiles are computed on the
+Prometheus side, e.g. `histogram_quantile(0.95, rate(paguenpo_http_request_duration_seconds_bucket[5m]))`.
+Every process keeps its own histograms, so scrape each process or run a single one.
+"""
+import threading
+from bisect import bisect_left
+from collections import OrderedDict
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100, 500)
+SIZE_BUCKETS = (100, 1000, 10000, 100000, 1000000, 10000000)
+
+# Name, help text and buckets of every histogram. The request histograms are labelled by view and
+# method, the database ones by connection alias.
+HISTOGRAMS = OrderedDict([
+    ('paguenpo_http_request_duration_seconds', ("Time spent answering requests.", DURATION_BUCKETS)),
+    ('paguenpo_http_request_db_duration_seconds', ("Time spent in database queries.", DURATION_BUCKETS)),
+    ('paguenpo_http_response_encode_duration_seconds', (
+        "Time spent encoding serialized responses with their renderer.", DURATION_BUCKETS
+    )),
+    ('paguenpo_http_request_queries', ("Database queries per request.", COUNT_BUCKETS)),
+    ('paguenpo_http_request_duplicate_queries', (
+        "Queries per request repeating the SQL of a previous one with other parameters (N+1).", COUNT_BUCKETS
+    )),
+    ('paguenpo_http_response_size_bytes', ("Size of the response bodies.", SIZE_BUCKETS)),
+    ('paguenpo_db_replica_lag_seconds', ("Replication lag measured by the replica health checks.", DURATION_BUCKETS)),
+])
+
+# Name and help text of every counter, all of them labelled by connection alias.
+COUNTERS = OrderedDict([
+    ('paguenpo_db_connections_opened_total', "Database connections opened."),
+    ('paguenpo_db_connections_discarded_total', "Persistent connections closed by a failed health check."),
+    ('paguenpo_db_replica_checks_failed_total', "Replica health checks that failed or found too much lag."),
+    ('paguenpo_db_replica_requests_total', "Requests allowed to read from a replica, by the alias they read from."),
+])
+
+
+class Histogram(object):
+    """Counts observations into buckets, keeping their sum and count."""
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """Returns (upper bound, observations at or below it) for every bucket, ending with +Inf."""
+        total = 0
+        bounds = [format_value(bound) for bound in self.buckets] + ['+Inf']
+        for bound, count in zip(bounds, self.counts):
+            total += count
+            yield bound, total
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_labels(labels, **extra):
+    pairs = list(labels) + sorted(extra.items())
+    return '{' + ','.join(
+        '{}="{}"'.format(name, str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n'))
+        for name, value in pairs
+    ) + '}'
+
+
+class Registry(object):
+    """Thread-safe set of the histograms in HISTOGRAMS and the counters in COUNTERS, one per
+    combination of labels.
+    """
+
+    def __init__(self, histograms=HISTOGRAMS, counters=COUNTERS):
+        self.definitions = histograms
+        self.counter_definitions = counters
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.series = {name: {} for name in self.definitions}
+            self.counters = {name: {} for name in self.counter_definitions}
+
+    def observe(self, name, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            series = self.series[name]
+            if key not in series:
+                series[key] = Histogram(self.definitions[name][1])
+            series[key].observe(value)
+
+    def increment(self, name, value=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            counters = self.counters[name]
+            counters[key] = counters.get(key, 0) + value
+
+    def render(self):
+        """Returns every histogram and counter in the Prometheus text exposition format."""
+        lines = []
+        with self.lock:
+            for name, (help_text, _) in self.definitions.items():
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} histogram'.format(name))
+                for labels, histogram in sorted(self.series[name].items()):
+                    for bound, count in histogram.cumulative_counts():
+                        lines.append('{}_bucket{} {}'.format(name, format_labels(labels, le=bound), count))
+                    lines.append('{}_sum{} {}'.format(name, format_labels(labels), format_value(histogram.sum)))
+                    lines.append('{}_count{} {}'.format(name, format_labels(labels), histogram.count))
+            for name, help_text in self.counter_definitions.items():
+                lines.append('# HELP {} {}'.format(name, help_text))
+                lines.append('# TYPE {} counter'.format(name))
+                for labels, value in sorted(self.counters[name].items()):
+                    lines.append('{}{} {}'.format(name, format_labels(labels), format_value(value)))
+        return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
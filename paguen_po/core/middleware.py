@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+import logging
+import re
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+from . import db
+from .metrics import registry
+
+logger = logging.getLogger(__name__)
+
+# String and number literals, then the lists of placeholders they leave in IN clauses.
+LITERALS = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+PLACEHOLDER_LISTS = re.compile(r"\(\?(?:, \?)*\)")
+
+
+def fingerprint(sql):
+    """Returns the SQL of a query with its parameters replaced by placeholders."""
+    return PLACEHOLDER_LISTS.sub('(...)', LITERALS.sub('?', sql))
+
+
+class ProfilingMiddleware(MiddlewareMixin):
+    """Profiles every request and records it in core.metrics, labelled by view.
+
+    Records the number of queries, the time spent in them, how many of them repeat the SQL of a
+    previous one (the N+1 pattern), the time spent encoding the response and its size. Only
+    enabled when PROFILING_ENABLED is True, as it makes every connection log its queries. Queries
+    made while a streaming response is being sent are not counted.
+
+    Encoding is the renderer turning the data of a response into bytes (response.render()).
+    Serializers run in the view, before it, so their time is part of the request duration only.
+
+    Put it first in MIDDLEWARE_CLASSES, so it measures the work of all the other middleware and
+    starts timing the encoding right before it begins.
+    """
+
+    def __init__(self, get_response=None):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        super(ProfilingMiddleware, self).__init__(get_response)
+
+    def process_request(self, request):
+        debug_cursors = {}
+        for connection in connections.all():
+            debug_cursors[connection.alias] = connection.force_debug_cursor
+            connection.force_debug_cursor = True
+        request._profile = {'start': time.perf_counter(), 'encode': 0.0, 'debug_cursors': debug_cursors}
+
+    def process_template_response(self, request, response):
+        profile = request._profile
+        encode_start = time.perf_counter()
+
+        def encoded(response):
+            profile['encode'] = time.perf_counter() - encode_start
+
+        response.add_post_render_callback(encoded)
+        return response
+
+    def process_response(self, request, response):
+        profile = getattr(request, '_profile', None)
+        if profile is None:
+            return response
+        duration = time.perf_counter() - profile['start']
+
+        queries = []
+        for connection in connections.all():
+            # The query log is cleared by Django when every request starts.
+            queries.extend(connection.queries_log)
+            connection.force_debug_cursor = profile['debug_cursors'].get(connection.alias, False)
+        db_duration = sum(float(query['time']) for query in queries)
+        duplicates = len(queries) - len({fingerprint(query['sql']) for query in queries})
+
+        match = request.resolver_match
+        labels = {'view': match.view_name if match else '<unresolved>', 'method': request.method}
+        registry.observe('paguenpo_http_request_duration_seconds', duration, **labels)
+        registry.observe('paguenpo_http_request_db_duration_seconds', db_duration, **labels)
+        registry.observe('paguenpo_http_response_encode_duration_seconds', profile['encode'], **labels)
+        registry.observe('paguenpo_http_request_queries', len(queries), **labels)
+        registry.observe('paguenpo_http_request_duplicate_queries', duplicates, **labels)
+        if not response.streaming:
+            registry.observe('paguenpo_http_response_size_bytes', len(response.content), **labels)
+
+        slow = settings.PROFILING_SLOW_REQUEST
+        if slow is not None and duration >= slow:
+            logger.warning(
+                "Slow request %s %s (%s): %.3fs, %d queries (%d duplicated) in %.3fs, encoded in %.3fs\n%s",
+                request.method, request.get_full_path(), labels['view'], duration, len(queries), duplicates,
+                db_duration, profile['encode'],
+                '\n'.join('[{}s] {}'.format(query['time'], query['sql']) for query in queries)
+            )
+        return response
+
+
+class ReplicaPinningMiddleware(MiddlewareMixin):
+    """Pins the clients that just wrote to the primary database, so they read their own writes.
+
+    A request that writes sets a cookie for DATABASE_REPLICA_PIN_SECONDS; while it is sent, the
+    client's requests never read from a replica (see core.db). Only enabled when DATABASE_REPLICAS
+    is not empty.
+    """
+    cookie_name = 'pin_primary'
+
+    def __init__(self, get_response=None):
+        if not settings.DATABASE_REPLICAS:
+            raise MiddlewareNotUsed
+        super(ReplicaPinningMiddleware, self).__init__(get_response)
+
+    def process_request(self, request):
+        db.reset(pinned=self.cookie_name in request.COOKIES)
+
+    def process_response(self, request, response):
+        if db.wrote():
+            response.set_cookie(self.cookie_name, '1', max_age=settings.DATABASE_REPLICA_PIN_SECONDS, httponly=True)
+        db.reset()
+        return response
@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 11:59
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+import uuid
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('households', '0001_initial'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Task',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('uuid', models.UUIDField(db_index=True, default=uuid.uuid4, editable=False)),
+                ('name', models.CharField(max_length=100, verbose_name='nombre')),
+                ('arguments', models.TextField(default='{}', verbose_name='argumentos')),
+                ('status', models.CharField(choices=[('QUEUED', 'en cola'), ('RUNNING', 'en ejecución'), ('SUCCEEDED', 'terminada'), ('FAILED', 'fallida')], default='QUEUED', max_length=20, verbose_name='estado')),
+                ('attempts', models.PositiveIntegerField(default=0, verbose_name='intentos')),
+                ('max_attempts', models.PositiveIntegerField(verbose_name='máximo de intentos')),
+                ('run_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='ejecutar desde')),
+                ('started', models.DateTimeField(blank=True, null=True, verbose_name='inicio')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='fin')),
+                ('worker', models.CharField(blank=True, max_length=100, verbose_name='worker')),
+                ('result', models.TextField(blank=True, null=True, verbose_name='resultado')),
+                ('error', models.TextField(blank=True, verbose_name='error')),
+                ('household', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='households.Household')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['status', 'run_at', 'id'], name='task_queue_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='task',
+            index=models.Index(fields=['household', 'status'], name='task_household_status_idx'),
+        ),
+    ]
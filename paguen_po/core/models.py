@@ -1,7 +1,11 @@
 # -*- coding: utf-8 -*-
 import uuid as uuid_lib
 
+from django.conf import settings
 from django.db import models
+from django.utils import timezone
+from model_utils import Choices
+from model_utils.models import TimeStampedModel
 
 
 class UUIDModel(models.Model):
@@ -15,3 +19,43 @@ class UUIDModel(models.Model):
         default=uuid_lib.uuid4,
         editable=False
     )
+
+
+class Task(UUIDModel, TimeStampedModel):
+    """A unit of background work, queued in the database and run by the run_tasks command.
+
+    See core.tasks. The uuid is the public id of the task, used to poll for its status.
+    """
+    STATUS = Choices(
+        ('QUEUED', 'en cola'),
+        ('RUNNING', 'en ejecución'),
+        ('SUCCEEDED', 'terminada'),
+        ('FAILED', 'fallida')
+    )
+
+    name = models.CharField("nombre", max_length=100)
+    arguments = models.TextField("argumentos", default='{}')
+    # Tasks of a household count toward its concurrency limit, and its roommates can poll them.
+    household = models.ForeignKey("households.Household", null=True, blank=True, on_delete=models.CASCADE)
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL)
+    status = models.CharField("estado", max_length=20, choices=STATUS, default=STATUS.QUEUED)
+    attempts = models.PositiveIntegerField("intentos", default=0)
+    max_attempts = models.PositiveIntegerField("máximo de intentos")
+    run_at = models.DateTimeField("ejecutar desde", default=timezone.now)
+    started = models.DateTimeField("inicio", null=True, blank=True)
+    # Stamped by the worker while the task runs (see core.tasks.Heartbeat).
+    heartbeat = models.DateTimeField("latido", null=True, blank=True)
+    finished = models.DateTimeField("fin", null=True, blank=True)
+    worker = models.CharField("worker", max_length=100, blank=True)
+    result = models.TextField("resultado", null=True, blank=True)
+    error = models.TextField("error", blank=True)
+
+    class Meta:
+        indexes = [
+            # Workers look for the queued tasks that are due, in order.
+            models.Index(fields=['status', 'run_at', 'id'], name='task_queue_idx'),
+            models.Index(fields=['household', 'status'], name='task_household_status_idx'),
+        ]
+
+    def __str__(self):
+        return "{} ({})".format(self.name, self.uuid)
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Migration operations shared by the apps."""
+import hashlib
+import re
+
+from django.db import migrations
+
+
+def partitions_of(schema_editor, table):
+    """Returns the partitions of `table` if it is a partitioned table on PostgreSQL, else None."""
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [table])
+        row = cursor.fetchone()
+        if row is None or row[0] != 'p':
+            return None
+        cursor.execute(
+            "SELECT inhrelid::regclass::text FROM pg_inherits WHERE inhparent = %s::regclass ORDER BY 1", [table]
+        )
+        return [name for name, in cursor.fetchall()]
+
+
+def partition_index_name(index_name, partition):
+    """Returns the name of the copy of an index on a partition, within PostgreSQL's 63 characters."""
+    return '{}_{}'.format(index_name[:50], hashlib.md5(partition.encode('utf-8')).hexdigest()[:8])
+
+
+class AddIndexConcurrently(migrations.AddIndex):
+    """Adds an index without blocking writes to the table on PostgreSQL.
+
+    PostgreSQL cannot build indexes concurrently inside a transaction, so the migration must set
+    `atomic = False`. Nor can it build them concurrently on a partitioned table: there the index is
+    created on the partitioned table alone, built concurrently on each partition, and attached.
+    Other databases add the index as AddIndex does.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if schema_editor.connection.vendor != 'postgresql' or \
+                not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return super(AddIndexConcurrently, self).database_forwards(app_label, schema_editor, from_state, to_state)
+        if schema_editor.connection.in_atomic_block:
+            raise ValueError("AddIndexConcurrently needs a migration with atomic = False.")
+        statement = self.index.create_sql(model, schema_editor)
+        table = model._meta.db_table
+        partitions = partitions_of(schema_editor, table)
+        if partitions is None:
+            # A failed concurrent build leaves an invalid index behind; drop it before retrying.
+            schema_editor.execute(
+                "DROP INDEX CONCURRENTLY IF EXISTS {}".format(schema_editor.quote_name(self.index.name))
+            )
+            schema_editor.execute(statement.replace('CREATE INDEX', 'CREATE INDEX CONCURRENTLY', 1))
+            return
+        quoted_table = schema_editor.quote_name(table)
+        schema_editor.execute(statement.replace(
+            'CREATE INDEX', 'CREATE INDEX IF NOT EXISTS', 1
+        ).replace(' ON {} '.format(quoted_table), ' ON ONLY {} '.format(quoted_table), 1))
+        for partition in partitions:
+            name = schema_editor.quote_name(partition_index_name(self.index.name, partition))
+            schema_editor.execute("DROP INDEX CONCURRENTLY IF EXISTS {}".format(name))
+            schema_editor.execute(re.sub(
+                r'^CREATE INDEX \S+ ON \S+ ',
+                lambda match: 'CREATE INDEX CONCURRENTLY {} ON {} '.format(name, partition),
+                statement
+            ))
+            schema_editor.execute("ALTER INDEX {} ATTACH PARTITION {}".format(
+                schema_editor.quote_name(self.index.name), name
+            ))
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = from_state.apps.get_model(app_label, self.model_name)
+        if schema_editor.connection.vendor != 'postgresql' or \
+                not self.allow_migrate_model(schema_editor.connection.alias, model):
+            return super(AddIndexConcurrently, self).database_backwards(app_label, schema_editor, from_state, to_state)
+        # Indexes of partitioned tables, with the copies on their partitions, cannot be dropped concurrently.
+        concurrently = '' if partitions_of(schema_editor, model._meta.db_table) is not None else ' CONCURRENTLY'
+        schema_editor.execute(
+            "DROP INDEX{} IF EXISTS {}".format(concurrently, schema_editor.quote_name(self.index.name))
+        )
+
+    def describe(self):
+        return "Create index {} concurrently on field(s) {} of model {}".format(
+            self.index.name, ", ".join(self.index.fields), self.model_name
+        )
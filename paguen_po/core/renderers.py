@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+import json
+from collections import OrderedDict
+from collections.abc import Sequence
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+try:
+    import ujson
+except ImportError:
+    ujson = None
+
+
+def dumps(data):
+    """Encodes `data` as compact UTF-8 JSON, with ujson when it is installed."""
+    if ujson is not None:
+        return ujson.dumps(data, ensure_ascii=False, escape_forward_slashes=False).encode('utf-8')
+    return json.dumps(data, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+class Rows(Sequence):
+    """Rows of values_list tuples, with the name of each column, for the fast JSON renderers.
+
+    Dotted names (e.g. 'roommate.user') are nested one level when rows are turned into objects.
+    Indexing returns the object of a row, so other renderers can still use the data. Values past
+    the last name are left out.
+    """
+
+    def __init__(self, names, rows):
+        self.names = names
+        self.rows = rows
+        self.fields = [(name.split('.', 1) if '.' in name else (name, None)) for name in names]
+
+    def __len__(self):
+        return len(self.rows)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.as_object(row) for row in self.rows[index]]
+        return self.as_object(self.rows[index])
+
+    def as_object(self, row):
+        item = {}
+        for (name, child), value in zip(self.fields, row):
+            if child is None:
+                item[name] = value
+            else:
+                item.setdefault(name, {})[child] = value
+        return item
+
+    def as_objects(self):
+        return [self.as_object(row) for row in self.rows]
+
+    def as_columns(self):
+        columns = list(zip(*self.rows)) or [()] * len(self.names)
+        return OrderedDict((name, list(values)) for name, values in zip(self.names, columns))
+
+
+class EventStreamRenderer(BaseRenderer):
+    """Lets views that stream Server-Sent Events accept `text/event-stream` requests.
+
+    The views return a StreamingHttpResponse themselves; this renderer only renders error
+    responses, as plain text.
+    """
+    media_type = 'text/event-stream'
+    format = 'sse'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return str(data).encode(self.charset)
+
+
+class PrometheusRenderer(BaseRenderer):
+    """Renders the metrics of core.metrics, already in the Prometheus text format."""
+    media_type = 'text/plain'
+    format = 'txt'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return str(data).encode(self.charset)
+
+
+class FastJSONRenderer(JSONRenderer):
+    """Renders responses holding Rows straight from their tuples, skipping the serializers.
+
+    Rows are rendered as a list of objects, shaped like the output of the view's serializer. Any
+    other data (e.g. errors) is rendered by JSONRenderer.
+    """
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if not isinstance(data, dict) or not any(isinstance(value, Rows) for value in data.values()):
+            return super(FastJSONRenderer, self).render(data, accepted_media_type, renderer_context)
+        return dumps(OrderedDict(
+            (key, self.render_rows(value) if isinstance(value, Rows) else value) for key, value in data.items()
+        ))
+
+    def render_rows(self, rows):
+        return rows.as_objects()
+
+
+class ColumnarJSONRenderer(FastJSONRenderer):
+    """Renders Rows as an object of parallel arrays, one per field, which is much smaller for
+    long lists: {"id": [1, 2], "roommate.user": [3, 4], ...}.
+    """
+    media_type = 'application/vnd.paguenpo.columnar+json'
+    format = 'columnar'
+
+    def render_rows(self, rows):
+        return rows.as_columns()
@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+import json
+
+from django.urls import reverse
+from rest_framework import serializers
+from rest_framework.permissions import SAFE_METHODS
+
+from .models import Task
+
+# Query parameter with the comma separated names of the fields a client wants.
+FIELDS_PARAM = 'fields'
+
+
+def requested_fields(request, available, param=FIELDS_PARAM):
+    """Returns the names listed in the `param` query parameter of a request, in the order of
+    `available`, or None if the request does not limit the fields.
+
+    Raises ValidationError if a name is not in `available`.
+    """
+    if request is None:
+        return None
+    names = {name.strip() for name in request.query_params.get(param, '').split(',') if name.strip()}
+    if not names:
+        return None
+    unknown = names.difference(available)
+    if unknown:
+        raise serializers.ValidationError({param: "Unknown fields: {}.".format(', '.join(sorted(unknown)))})
+    return [name for name in available if name in names]
+
+
+class SparseFieldsetMixin(object):
+    """Leaves out of a serializer the fields a safe request does not list in `fields`.
+
+    Only applies to the top-level serializer, which gets the request in its context: nested ones
+    keep all their fields, and writes are always validated against every field.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super(SparseFieldsetMixin, self).__init__(*args, **kwargs)
+        request = self.context.get('request')
+        if request is None or request.method not in SAFE_METHODS:
+            return
+        names = requested_fields(request, list(self.fields))
+        if names is not None:
+            for name in set(self.fields).difference(names):
+                self.fields.pop(name)
+
+
+class TaskSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
+    id = serializers.UUIDField(source='uuid', read_only=True)
+    result = serializers.SerializerMethodField()
+    error = serializers.SerializerMethodField()
+    download = serializers.SerializerMethodField()
+
+    class Meta:
+        model = Task
+        fields = ('id', 'name', 'household', 'status', 'attempts', 'max_attempts', 'created', 'run_at',
+                  'started', 'finished', 'result', 'error', 'download')
+
+    def get_result(self, task):
+        return json.loads(task.result) if task.result is not None else None
+
+    def get_download(self, task):
+        """Returns the path of the file the task wrote, to download from the API, or None."""
+        result = self.get_result(task)
+        if task.status != Task.STATUS.SUCCEEDED or not isinstance(result, dict) or 'file' not in result:
+            return None
+        return reverse('api:task_download', kwargs={'uuid': task.uuid})
+
+    def get_error(self, task):
+        """Returns the last line of the traceback, which names the exception."""
+        return task.error.strip().splitlines()[-1] if task.error.strip() else None
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+"""Static files storage for production: content-hashed names, precompressed.
+
+collectstatic copies every file under a name that carries the hash of its contents (e.g.
+`dist/core/index.3f2a9c1b7e4d.js`), so nginx can let browsers cache them for good (see
+config/docker/static.conf). Next to each hashed text file it writes a gzip copy (`.gz`), and a
+brotli one (`.br`) when the brotli package is installed, for nginx to serve as they are instead
+of compressing on every request.
+"""
+import gzip
+import io
+import os
+
+from django.contrib.staticfiles.storage import ManifestStaticFilesStorage
+from django.core.files.base import ContentFile
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Extensions of the files worth compressing: images and fonts other than these already are.
+COMPRESSIBLE = ('.css', '.js', '.map', '.json', '.svg', '.ico', '.txt', '.html', '.xml', '.eot', '.ttf')
+
+# Smaller files are not compressed: they fit in a packet either way.
+MIN_SIZE = 256
+
+
+def gzip_compress(content):
+    buffer = io.BytesIO()
+    # A fixed mtime keeps builds of the same files byte for byte identical.
+    with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=9, mtime=0) as gzip_file:
+        gzip_file.write(content)
+    return buffer.getvalue()
+
+
+def compressors():
+    """Returns (extension, function) for each available compression."""
+    available = [('.gz', gzip_compress)]
+    if brotli is not None:
+        available.append(('.br', brotli.compress))
+    return available
+
+
+class CompressedManifestStaticFilesStorage(ManifestStaticFilesStorage):
+    """ManifestStaticFilesStorage that also writes compressed copies of the hashed files."""
+
+    def post_process(self, paths, dry_run=False, **options):
+        for name, hashed_name, processed in super(CompressedManifestStaticFilesStorage, self).post_process(
+                paths, dry_run, **options):
+            yield name, hashed_name, processed
+        if dry_run:
+            return
+        for hashed_name in sorted(set(self.hashed_files.values())):
+            if os.path.splitext(hashed_name)[1].lower() in COMPRESSIBLE:
+                self.compress(hashed_name)
+
+    def compress(self, name):
+        """Writes the compressed copies of a file, unless they would not be smaller."""
+        with self.open(name) as original:
+            content = original.read()
+        if len(content) < MIN_SIZE:
+            return
+        for extension, compress in compressors():
+            compressed = compress(content)
+            if len(compressed) >= len(content):
+                continue
+            if self.exists(name + extension):
+                self.delete(name + extension)
+            self._save(name + extension, ContentFile(compressed))
@@ -0,0 +1,223 @@
+# -*- coding: utf-8 -*-
+"""Background tasks, queued in the Task table and run by the run_tasks command.
+
+Functions are registered with the `task` decorator in the `tasks` module of an app, and queued
+with enqueue(), usually from a view that then answers with the task id for the client to poll.
+Queuing is part of the current transaction, so a task is never run for work that rolled back.
+
+Workers claim due tasks with SELECT ... FOR UPDATE SKIP LOCKED, so any number of them can share
+the queue. At most TASKS_HOUSEHOLD_CONCURRENCY tasks of a household run at once. A failed task is
+retried after TASKS_RETRY_DELAY seconds, doubling the delay on every attempt, until it runs out
+of attempts.
+
+While a task runs, its worker stamps its `heartbeat` every TASKS_HEARTBEAT_INTERVAL seconds. A
+running task whose heartbeat is older than TASKS_TIMEOUT seconds is presumed lost with its worker
+and queued again. The worker only records the outcome of an attempt it still owns, so a worker
+that was presumed lost cannot overwrite the outcome of a later attempt.
+"""
+import json
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+
+from households import membership
+from households.models import Household
+
+from .events import household_channel, publish_on_commit
+from .models import Task
+
+logger = logging.getLogger(__name__)
+
+# Registered functions and their maximum number of attempts, by task name.
+REGISTRY = {}
+
+# Longest wait between two attempts of a task, in seconds.
+MAX_RETRY_DELAY = 60 * 60
+
+
+def task(name, max_attempts=None):
+    """Registers a function as the task `name`.
+
+    The function is called with the keyword arguments given to enqueue(), plus `household_id` for
+    the tasks of a household. Its return value must be JSON serializable; it is stored as the
+    result of the task.
+    """
+    def register(function):
+        REGISTRY[name] = (function, max_attempts or settings.TASKS_MAX_ATTEMPTS)
+        return function
+    return register
+
+
+def enqueue(name, household_id=None, user=None, delay=0, **arguments):
+    """Queues a run of the task `name` with the given keyword arguments, and returns its Task.
+
+    `household_id` subjects the task to the concurrency limit of the household and lets its
+    roommates poll it; `user` is who asked for it. The task runs `delay` seconds from now at the
+    earliest.
+    """
+    if name not in REGISTRY:
+        raise KeyError("Unknown task {!r}.".format(name))
+    return Task.objects.create(
+        name=name,
+        arguments=json.dumps(arguments, cls=DjangoJSONEncoder),
+        household_id=household_id,
+        user=user,
+        max_attempts=REGISTRY[name][1],
+        run_at=timezone.now() + timedelta(seconds=delay),
+    )
+
+
+def worker_name():
+    return '{}:{}'.format(socket.gethostname(), os.getpid())
+
+
+def claim(worker):
+    """Marks the next due task as running by `worker` and returns it, or returns None.
+
+    Tasks of a household at its concurrency limit are passed over. The household row is locked
+    while its running tasks are counted, so concurrent workers cannot both take its last slot.
+    """
+    limit = settings.TASKS_HOUSEHOLD_CONCURRENCY
+    full = set()
+    while True:
+        with transaction.atomic():
+            now = timezone.now()
+            busy = Task.objects.filter(status=Task.STATUS.RUNNING, household__isnull=False).values(
+                'household_id'
+            ).annotate(running=Count('id')).filter(running__gte=limit).values('household_id')
+            task = Task.objects.select_for_update(skip_locked=True).filter(
+                status=Task.STATUS.QUEUED, run_at__lte=now
+            ).exclude(household_id__in=busy).exclude(household_id__in=full).order_by('run_at', 'id').first()
+            if task is None:
+                return None
+            if task.household_id is not None:
+                # Lock the household, then count again: the subquery above may be stale.
+                list(Household.all_objects.select_for_update().filter(pk=task.household_id).values_list('id'))
+                if Task.objects.filter(household_id=task.household_id, status=Task.STATUS.RUNNING).count() >= limit:
+                    full.add(task.household_id)
+                    continue
+            task.status = Task.STATUS.RUNNING
+            task.attempts += 1
+            task.started = now
+            task.heartbeat = now
+            task.worker = worker
+            task.save(update_fields=['status', 'attempts', 'started', 'heartbeat', 'worker', 'modified'])
+            return task
+
+
+def owned(task):
+    """Returns a queryset of the task if the attempt of its worker is still running."""
+    return Task.objects.filter(pk=task.pk, status=Task.STATUS.RUNNING, worker=task.worker, attempts=task.attempts)
+
+
+class Heartbeat(object):
+    """Context manager that stamps the heartbeat of a running task from a background thread."""
+
+    def __init__(self, task):
+        self.task = task
+        self.stop = threading.Event()
+        self.thread = threading.Thread(target=self.beat, name='task-heartbeat')
+        self.thread.daemon = True
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stop.set()
+        self.thread.join()
+
+    def beat(self):
+        try:
+            while not self.stop.wait(settings.TASKS_HEARTBEAT_INTERVAL):
+                owned(self.task).update(heartbeat=timezone.now())
+        except Exception:
+            logger.exception("Could not stamp the heartbeat of task %s.", self.task.uuid)
+        finally:
+            # The connections of this thread.
+            connections.close_all()
+
+
+def finish(task, **fields):
+    """Saves the outcome of an attempt, if its worker still owns it. Returns whether it did."""
+    for name, value in fields.items():
+        setattr(task, name, value)
+    fields['modified'] = timezone.now()
+    if owned(task).update(**fields):
+        return True
+    logger.warning("Task %s %s was taken from worker %s; its outcome is dropped.", task.name, task.uuid, task.worker)
+    return False
+
+
+def retry_delay(attempts):
+    """Returns the seconds to wait before the next attempt of a task that failed `attempts` times."""
+    return min(settings.TASKS_RETRY_DELAY * 2 ** (attempts - 1), MAX_RETRY_DELAY)
+
+
+def run(task):
+    """Runs a claimed task and records its outcome. Returns True if it succeeded."""
+    try:
+        function, _ = REGISTRY[task.name]
+        arguments = json.loads(task.arguments)
+        if task.household_id is not None:
+            arguments['household_id'] = task.household_id
+        with Heartbeat(task):
+            result = function(**arguments)
+    except Exception:
+        logger.exception("Task %s %s failed (attempt %d of %d).", task.name, task.uuid, task.attempts,
+                         task.max_attempts)
+        fail(task, traceback.format_exc())
+        return False
+    if finish(task, status=Task.STATUS.SUCCEEDED, result=json.dumps(result, cls=DjangoJSONEncoder), error='',
+              finished=timezone.now()):
+        notify(task)
+    return True
+
+
+def fail(task, error):
+    """Queues a failed task for another attempt, or marks it as failed if it has none left."""
+    if task.attempts < task.max_attempts:
+        finish(task, status=Task.STATUS.QUEUED, error=error,
+               run_at=timezone.now() + timedelta(seconds=retry_delay(task.attempts)))
+    elif finish(task, status=Task.STATUS.FAILED, error=error, finished=timezone.now()):
+        notify(task)
+
+
+def notify(task):
+    """Tells the feed of the task's household that it finished."""
+    if task.household_id is not None:
+        publish_on_commit(household_channel(task.household_id), 'task.finished', {
+            'id': str(task.uuid), 'name': task.name, 'status': task.status
+        })
+
+
+def requeue_lost(timeout=None):
+    """Fails the attempts of the running tasks without a heartbeat for `timeout` seconds
+    (TASKS_TIMEOUT by default), whose worker presumably died, so they are retried. Returns how
+    many there were.
+    """
+    deadline = timezone.now() - timedelta(seconds=timeout or settings.TASKS_TIMEOUT)
+    lost = Task.objects.filter(
+        Q(heartbeat__lt=deadline) | Q(heartbeat__isnull=True, started__lt=deadline), status=Task.STATUS.RUNNING
+    )
+    now = timezone.now()
+    with transaction.atomic():
+        retried = lost.filter(attempts__lt=F('max_attempts')).update(
+            status=Task.STATUS.QUEUED, run_at=now, error="Lost with its worker.", modified=now
+        )
+        failed = lost.update(status=Task.STATUS.FAILED, finished=now, error="Lost with its worker.", modified=now)
+    return retried + failed
+
+
+def visible_to(user):
+    """Returns the tasks a user can poll: theirs and those of their households."""
+    return Task.objects.filter(Q(user=user) | Q(household_id__in=membership.household_ids(user.pk)))
@@ -1,3 +1,474 @@
-from django.test import TestCase
+# -*- coding: utf-8 -*-
+import gzip
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.contrib.staticfiles.storage import staticfiles_storage
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DEFAULT_DB_ALIAS
+from django.urls import reverse
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from expenses.models import Category, Expense
+from households.models import Household, Roommate
+
+from . import benchmark, checks, db, events, renderers, storage, tasks
+from .metrics import registry
+from .middleware import fingerprint
+from .management.commands.benchmark_api import BUDGETS
+from .models import Task
+
+CALLS = []
+
+
+@tasks.task('core.tests.flaky', max_attempts=2)
+def flaky(household_id=None, fail=False):
+    CALLS.append(household_id)
+    if fail:
+        raise RuntimeError("Failed on purpose.")
+    return {'household': household_id}
+
+
+@override_settings(TASKS_HOUSEHOLD_CONCURRENCY=1, TASKS_RETRY_DELAY=10)
+class TaskTests(TestCase):
+
+    def setUp(self):
+        del CALLS[:]
+        self.household = Household.objects.create(name='casa')
+
+    def test_claim_and_run(self):
+        task = tasks.enqueue('core.tests.flaky', self.household.id)
+        claimed = tasks.claim('worker')
+        self.assertEqual((claimed.pk, claimed.status, claimed.attempts), (task.pk, Task.STATUS.RUNNING, 1))
+        self.assertIsNotNone(claimed.heartbeat)
+        self.assertIsNone(tasks.claim('worker'))
+        self.assertTrue(tasks.run(claimed))
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS.SUCCEEDED)
+        self.assertEqual(CALLS, [self.household.id])
+
+    def test_unknown_task(self):
+        with self.assertRaises(KeyError):
+            tasks.enqueue('core.tests.missing')
+
+    def test_tasks_wait_for_their_time(self):
+        tasks.enqueue('core.tests.flaky', delay=60)
+        self.assertIsNone(tasks.claim('worker'))
+
+    def test_retries_with_backoff_until_out_of_attempts(self):
+        task = tasks.enqueue('core.tests.flaky', fail=True)
+        with self.assertLogs('core.tasks', 'ERROR'):
+            self.assertFalse(tasks.run(tasks.claim('worker')))
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS.QUEUED)
+        self.assertGreater(task.run_at, timezone.now() + timedelta(seconds=5))
+        self.assertIn("Failed on purpose.", task.error)
+        self.assertIsNone(tasks.claim('worker'))
+
+        Task.objects.filter(pk=task.pk).update(run_at=timezone.now())
+        with self.assertLogs('core.tasks', 'ERROR'):
+            self.assertFalse(tasks.run(tasks.claim('worker')))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.attempts), (Task.STATUS.FAILED, 2))
+
+    def test_retry_delay_doubles_up_to_a_limit(self):
+        self.assertEqual([tasks.retry_delay(attempts) for attempts in (1, 2, 3)], [10, 20, 40])
+        self.assertEqual(tasks.retry_delay(30), tasks.MAX_RETRY_DELAY)
+
+    def test_household_concurrency(self):
+        first = tasks.enqueue('core.tests.flaky', self.household.id)
+        second = tasks.enqueue('core.tests.flaky', self.household.id)
+        elsewhere = tasks.enqueue('core.tests.flaky', Household.objects.create(name='otra').id)
+        claimed = tasks.claim('worker')
+        self.assertEqual(claimed.pk, first.pk)
+        self.assertEqual(tasks.claim('worker').pk, elsewhere.pk)
+        self.assertIsNone(tasks.claim('worker'))
+        tasks.run(claimed)
+        self.assertEqual(tasks.claim('worker').pk, second.pk)
+
+    def test_lost_tasks_are_queued_again(self):
+        task = tasks.enqueue('core.tests.flaky')
+        tasks.claim('worker')
+        # Started long ago, but its heartbeat is recent.
+        Task.objects.filter(pk=task.pk).update(started=timezone.now() - timedelta(days=1))
+        self.assertEqual(tasks.requeue_lost(), 0)
+        Task.objects.filter(pk=task.pk).update(heartbeat=timezone.now() - timedelta(days=1))
+        self.assertEqual(tasks.requeue_lost(), 1)
+        self.assertEqual(Task.objects.get(pk=task.pk).status, Task.STATUS.QUEUED)
+
+    def test_outcome_is_recorded_only_by_the_owner(self):
+        task = tasks.enqueue('core.tests.flaky')
+        lost = tasks.claim('lost')
+        Task.objects.filter(pk=task.pk).update(heartbeat=timezone.now() - timedelta(days=1))
+        tasks.requeue_lost()
+        again = tasks.claim('other')
+        self.assertEqual(again.attempts, 2)
+        # The lost worker comes back and finishes: the attempt of the other worker stands.
+        with self.assertLogs('core.tasks', 'WARNING'):
+            self.assertTrue(tasks.run(lost))
+        task.refresh_from_db()
+        self.assertEqual((task.status, task.worker), (Task.STATUS.RUNNING, 'other'))
+        self.assertTrue(tasks.run(again))
+        task.refresh_from_db()
+        self.assertEqual(task.status, Task.STATUS.SUCCEEDED)
+
+
+class RendererTests(SimpleTestCase):
+
+    def setUp(self):
+        self.rows = renderers.Rows(['id', 'roommate.user', 'roommate.household'], [(1, 7, 3, 'extra'), (2, 8, 3, 'x')])
+
+    def test_rows_are_nested_objects(self):
+        self.assertEqual(len(self.rows), 2)
+        self.assertEqual(self.rows[0], {'id': 1, 'roommate': {'user': 7, 'household': 3}})
+        self.assertEqual(self.rows[1:], [{'id': 2, 'roommate': {'user': 8, 'household': 3}}])
+
+    def test_fast_json(self):
+        data = OrderedDict([('next', None), ('results', self.rows)])
+        self.assertEqual(json.loads(renderers.FastJSONRenderer().render(data).decode()), {
+            'next': None,
+            'results': [{'id': 1, 'roommate': {'user': 7, 'household': 3}},
+                        {'id': 2, 'roommate': {'user': 8, 'household': 3}}],
+        })
+        # Anything else is rendered like JSONRenderer does.
+        self.assertEqual(renderers.FastJSONRenderer().render({'detail': 'ñ'}), '{"detail":"ñ"}'.encode('utf-8'))
+
+    def test_columnar_json(self):
+        data = {'results': self.rows}
+        self.assertEqual(json.loads(renderers.ColumnarJSONRenderer().render(data).decode()), {
+            'results': {'id': [1, 2], 'roommate.user': [7, 8], 'roommate.household': [3, 3]}
+        })
+        empty = {'results': renderers.Rows(['id', 'amount'], [])}
+        self.assertEqual(
+            json.loads(renderers.ColumnarJSONRenderer().render(empty).decode()), {'results': {'id': [], 'amount': []}}
+        )
+
+
+@override_settings(DATABASE_REPLICAS=['replica_0'], DATABASE_REPLICA_MAX_LAG=5)
+class ReplicaRouterTests(SimpleTestCase):
+
+    def setUp(self):
+        self.router = db.ReplicaRouter()
+        db.reset()
+        self.addCleanup(db.reset)
+
+    def read(self, stamp=None, healthy=('replica_0',)):
+        with mock.patch('core.db.healthy_replicas', return_value=list(healthy)):
+            return db.read_from_replica(stamp)
+
+    def test_reads_go_to_the_primary_by_default(self):
+        self.assertEqual(self.router.db_for_read(Task), DEFAULT_DB_ALIAS)
+
+    def test_reads_go_to_a_healthy_replica(self):
+        self.assertEqual(self.read(), 'replica_0')
+        self.assertEqual(self.router.db_for_read(Task), 'replica_0')
+        db.read_from_primary()
+        self.assertEqual(self.router.db_for_read(Task), DEFAULT_DB_ALIAS)
+
+    def test_without_healthy_replicas(self):
+        self.assertEqual(self.read(healthy=()), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.router.db_for_read(Task), DEFAULT_DB_ALIAS)
+
+    def test_writes_pin_the_request(self):
+        self.read()
+        self.assertEqual(self.router.db_for_write(Task), DEFAULT_DB_ALIAS)
+        self.assertTrue(db.wrote())
+        self.assertEqual(self.router.db_for_read(Task), DEFAULT_DB_ALIAS)
+
+    def test_pinned_clients_read_from_the_primary(self):
+        db.reset(pinned=True)
+        self.assertEqual(self.read(), DEFAULT_DB_ALIAS)
+
+    def test_recent_versions_are_read_from_the_primary(self):
+        now = timezone.now().timestamp()
+        self.assertEqual(self.read(stamp=now), DEFAULT_DB_ALIAS)
+        self.assertEqual(self.read(stamp=now - 60), 'replica_0')
+
+    def test_migrations_only_run_on_the_primary(self):
+        self.assertTrue(self.router.allow_migrate(DEFAULT_DB_ALIAS, 'expenses'))
+        self.assertFalse(self.router.allow_migrate('replica_0', 'expenses'))
+
+    @override_settings(DATABASE_REPLICA_CHECK_INTERVAL=60)
+    def test_health_checks_are_cached(self):
+        db._health.clear()
+        self.addCleanup(db._health.clear)
+        with mock.patch('core.db.check_replica', return_value=False) as check_replica:
+            self.assertEqual(db.healthy_replicas(), [])
+            self.assertEqual(db.healthy_replicas(), [])
+        self.assertEqual(check_replica.call_count, 1)
+
+
+class FakePubSub(object):
+    """Records the threads that use it, like redis-py's PubSub it is not meant to be shared."""
+
+    def __init__(self):
+        self.threads = set()
+        self.channels = set()
+        self.messages = []
+        self.stopped = False
+
+    def use(self):
+        if self.stopped:
+            # Ends the listener thread, which only recovers from Exception.
+            raise SystemExit
+        self.threads.add(threading.get_ident())
+
+    def subscribe(self, *channels):
+        self.use()
+        self.channels.update(channels)
+
+    def unsubscribe(self, *channels):
+        self.use()
+        self.channels.difference_update(channels)
+
+    def get_message(self, timeout):
+        self.use()
+        if self.messages:
+            return self.messages.pop(0)
+        time.sleep(timeout)
+
+    def close(self):
+        pass
+
+
+class EventTests(SimpleTestCase):
+
+    def wait_for(self, condition):
+        deadline = time.monotonic() + 5
+        while not condition():
+            self.assertLess(time.monotonic(), deadline)
+            time.sleep(0.01)
+
+    def test_broker_errors_do_not_reach_the_request(self):
+        broker = mock.Mock(**{'publish.side_effect': ConnectionError("Redis is down.")})
+        with mock.patch('core.events.get_broker', return_value=broker), self.assertLogs('core.events', 'ERROR'):
+            # Outside of a transaction it publishes right away.
+            events.publish_on_commit('household:1', 'expense.saved', {'id': 1})
+        self.assertTrue(broker.publish.called)
+
+    @override_settings(EVENTS_REDIS_URL='redis://localhost:6379/0')
+    def test_redis_pubsub_is_only_used_by_the_listener(self):
+        pubsub = FakePubSub()
+        self.addCleanup(setattr, pubsub, 'stopped', True)
+        redis = mock.Mock(**{'StrictRedis.from_url.return_value.pubsub.return_value': pubsub})
+        with mock.patch.dict('sys.modules', redis=redis):
+            broker = events.RedisBroker()
+        broker.poll_interval = 0.01
+
+        subscription = broker.subscribe('household:1')
+        self.wait_for(lambda: pubsub.channels == {'household:1'})
+        pubsub.messages.append({'type': 'message', 'channel': b'household:1', 'data': b'{"event": "x"}'})
+        self.assertEqual(subscription.get(timeout=5), '{"event": "x"}')
+        subscription.close()
+        self.wait_for(lambda: not pubsub.channels)
+        self.assertEqual(pubsub.threads, {broker._listener.ident})
+
+
+class BenchmarkTests(TransactionTestCase):
+    """Measures outside of a test transaction, whose savepoints would add queries."""
+
+    def test_every_endpoint_has_a_benchmark_and_a_budget(self):
+        for name in benchmark.endpoint_names():
+            self.assertIn(name, benchmark.ENDPOINTS)
+            if benchmark.ENDPOINTS[name] is not None:
+                self.assertIn('queries', BUDGETS.get(name, {}), name)
+
+    def test_endpoints_keep_to_their_query_budgets(self):
+        dataset = benchmark.seed(households=2, roommates=2, categories=3, expenses=40)
+        results = {
+            name: benchmark.measure(name, spec, dataset, repeat=1)
+            for name, spec in benchmark.ENDPOINTS.items() if spec is not None
+        }
+        self.assertEqual(benchmark.check_budgets(results, BUDGETS), [])
+
+    def test_budget_violations(self):
+        results = {'expenses': {'status': 500, 'queries': 9}, 'expense_feed': None}
+        self.assertEqual(benchmark.check_budgets(results, {'expenses': {'queries': 3}}), [
+            "expenses: answered 500", "expenses: queries is 9, over the budget of 3"
+        ])
+
+    def test_percentile(self):
+        self.assertEqual(benchmark.percentile([5, 1, 4, 2, 3], 0.5), 3)
+        self.assertEqual(benchmark.percentile([5, 1, 4, 2, 3], 0.95), 5)
+
+
+@override_settings(PROFILING_ENABLED=True)
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        registry.reset()
+        self.addCleanup(registry.reset)
+        self.user = User.objects.create_user('ana')
+        Roommate.objects.create(household=Household.objects.create(name='casa'), user=self.user)
+        self.client.force_login(self.user)
+
+    def series(self, name):
+        return {dict(labels)['view']: histogram for labels, histogram in registry.series[name].items()}
+
+    def test_fingerprint(self):
+        self.assertEqual(
+            fingerprint("SELECT 1 FROM t WHERE a = 'x''y' AND b IN (1, 2.5, 3)"),
+            "SELECT ? FROM t WHERE a = ? AND b IN (...)"
+        )
+
+    def test_requests_are_recorded_by_view(self):
+        response = self.client.get(reverse('api:households'))
+        self.assertEqual(response.status_code, 200)
+        queries = self.series('paguenpo_http_request_queries')['api:households']
+        self.assertEqual(queries.count, 1)
+        self.assertGreater(queries.sum, 0)
+        self.assertEqual(self.series('paguenpo_http_response_size_bytes')['api:households'].sum, len(response.content))
+        self.assertEqual(self.series('paguenpo_http_response_encode_duration_seconds')['api:households'].count, 1)
+
+    @override_settings(PROFILING_SLOW_REQUEST=0)
+    def test_slow_requests_are_logged_with_their_queries(self):
+        with self.assertLogs('core.middleware', 'WARNING') as logs:
+            self.client.get(reverse('api:households'))
+        self.assertIn('Slow request GET', logs.output[0])
+        self.assertIn('SELECT', logs.output[0])
+
+    def test_metrics_are_for_staff_only(self):
+        self.client.get(reverse('api:households'))
+        self.assertEqual(self.client.get(reverse('api:metrics')).status_code, 403)
+        User.objects.filter(pk=self.user.pk).update(is_staff=True)
+        response = self.client.get(reverse('api:metrics'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/plain; version=0.0.4; charset=utf-8')
+        self.assertIn(
+            'paguenpo_http_request_queries_count{method="GET",view="api:households"} 1', response.content.decode()
+        )
+
+    @override_settings(PROFILING_ENABLED=False)
+    def test_disabled(self):
+        self.client.get(reverse('api:households'))
+        self.assertEqual(self.series('paguenpo_http_request_queries'), {})
+
+
+# A replica would not see the rows of the test transaction.
+@override_settings(DATABASE_REPLICAS=[])
+class BootstrapTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ana')
+        self.household = Household.objects.create(name='casa')
+        self.roommate = Roommate.objects.create(household=self.household, user=self.user)
+        self.category = Category.objects.create(name='luz')
+        self.client.force_login(self.user)
+        self.today = timezone.localdate()
+
+    def expense(self, roommate=None, **fields):
+        fields.setdefault('year', self.today.year)
+        fields.setdefault('month', self.today.month)
+        return Expense.objects.create(amount=10, roommate=roommate or self.roommate, category=self.category, **fields)
+
+    def bootstrap(self, **params):
+        response = self.client.get(reverse('api:bootstrap'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content.decode())
+
+    def test_everything_the_app_loads(self):
+        expense = self.expense()
+        self.expense(year=self.today.year - 1)
+        data = self.bootstrap()
+        self.assertEqual(data['user'], {'id': self.user.pk, 'name': 'ana'})
+        self.assertEqual([household['id'] for household in data['households']], [self.household.pk])
+        self.assertEqual(data['categories'], [{'id': self.category.pk, 'name': 'luz'}])
+        self.assertEqual((data['household'], data['year'], data['month']), (
+            self.household.pk, self.today.year, self.today.month
+        ))
+        self.assertEqual([row['id'] for row in data['expenses']], [expense.pk])
+
+    def test_queries_do_not_grow_with_the_rows(self):
+        # Once the memberships and categories are cached: the session, the user, the households and
+        # the expenses.
+        self.bootstrap()
+        with self.assertNumQueries(4):
+            self.bootstrap()
+        elsewhere = Household.objects.create(name='otra')
+        roommate = Roommate.objects.create(household=elsewhere, user=self.user)
+        for _ in range(3):
+            self.expense()
+            self.expense(roommate)
+        Category.objects.create(name='agua')
+        self.bootstrap(household=elsewhere.pk)
+        with self.assertNumQueries(4):
+            self.bootstrap(household=elsewhere.pk)
+
+    def test_fields_of_each_list(self):
+        self.expense()
+        data = self.bootstrap(**{'fields[expenses]': 'id,amount', 'fields[categories]': 'name'})
+        self.assertEqual(list(data['expenses'][0]), ['id', 'amount'])
+        self.assertEqual(data['categories'], [{'name': 'luz'}])
+        response = self.client.get(reverse('api:bootstrap'), {'fields[households]': 'secret'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_households_of_others(self):
+        response = self.client.get(reverse('api:bootstrap'), {'household': Household.objects.create(name='otra').pk})
+        self.assertEqual(response.status_code, 403)
+
+
+class StaticFilesTests(SimpleTestCase):
+
+    def setUp(self):
+        self.source = tempfile.mkdtemp()
+        self.root = tempfile.mkdtemp()
+        self.templates = tempfile.mkdtemp()
+        for directory in (self.source, self.root, self.templates):
+            self.addCleanup(shutil.rmtree, directory)
+        self.script = b'console.log("paguen po");\n' * 50
+        for name, content in (('app.js', self.script), ('small.css', b'body{}'), ('logo.png', b'\x89PNG' * 100)):
+            with open(os.path.join(self.source, name), 'wb') as static_file:
+                static_file.write(content)
+        settings = override_settings(
+            STATIC_ROOT=self.root, STATICFILES_DIRS=[self.source],
+            STATICFILES_FINDERS=['django.contrib.staticfiles.finders.FileSystemFinder'],
+            STATICFILES_STORAGE='core.storage.CompressedManifestStaticFilesStorage',
+            TEMPLATES=[{'BACKEND': 'django.template.backends.django.DjangoTemplates', 'DIRS': [self.templates]}],
+        )
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def collect(self):
+        call_command('collectstatic', interactive=False, verbosity=0)
+
+    def test_hashed_files_get_compressed_copies(self):
+        self.collect()
+        script = staticfiles_storage.stored_name('app.js')
+        self.assertRegex(script, r'^app\.[0-9a-f]{12}\.js$')
+        with open(os.path.join(self.root, script + '.gz'), 'rb') as compressed:
+            gzipped = compressed.read()
+        self.assertEqual(gzip.decompress(gzipped), self.script)
+        self.assertEqual(os.path.exists(os.path.join(self.root, script + '.br')), storage.brotli is not None)
+        for name in ('small.css', 'logo.png'):
+            self.assertFalse(os.path.exists(os.path.join(self.root, staticfiles_storage.stored_name(name) + '.gz')))
+        # Collecting again writes the same bytes.
+        self.collect()
+        with open(os.path.join(self.root, script + '.gz'), 'rb') as compressed:
+            self.assertEqual(compressed.read(), gzipped)
+
+    def write_template(self, content):
+        with open(os.path.join(self.templates, 'pagina.html'), 'w', encoding='utf-8') as template:
+            template.write(content)
+
+    def test_templates_must_use_the_static_tag(self):
+        self.write_template('<script src="/static/app.js"></script>\n')
+        self.assertEqual([error.id for error in checks.check_static_references(None)], ['core.E001'])
+        self.write_template('{% load static %}<script src="{% static \'app.js\' %}"></script>\n')
+        self.assertEqual(checks.check_static_references(None), [])
+
+    def test_static_paths_must_be_in_the_manifest(self):
+        self.write_template('{% load static %}<script src="{% static \'falta.js\' %}"></script>\n')
+        self.assertEqual(checks.check_static_references(None), [])
+        self.collect()
+        self.assertEqual([error.id for error in checks.check_static_references(None)], ['core.E002'])
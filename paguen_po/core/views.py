@@ -1,7 +1,42 @@
 # -*- coding: utf-8 -*-
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.shortcuts import render
+from django.http import Http404
 from django.http.response import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import PermissionDenied
+from rest_framework.renderers import BrowsableAPIRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from expenses import exporting
+from expenses.categories import get_catalogue
+from expenses.models import Expense
+from expenses.serializers import CategorySerializer, ExpenseSerializer
+from households import membership
+from households.models import Household
+from households.permissions import HouseholdMixin
+from households.serializers import HouseholdSerializer
+
+from . import files, tasks
+from .db import ReplicaReadsMixin
+from .metrics import registry
+from .models import Task
+from .renderers import FastJSONRenderer, PrometheusRenderer, Rows
+from .serializers import FIELDS_PARAM, TaskSerializer, requested_fields
+
+
+def task_response(task):
+    """Answers a request handed over to a background task with the task, to poll at its URL."""
+    response = Response(TaskSerializer(task).data, status=status.HTTP_202_ACCEPTED)
+    response['Location'] = reverse('api:task', kwargs={'uuid': task.uuid})
+    return response
 
 
 @login_required
@@ -17,3 +52,120 @@ def get_user_data(request):
             "name": request.user.username
         }
     })
+
+
+class Bootstrap(HouseholdMixin, ReplicaReadsMixin, APIView):
+    """Returns everything the app loads on start in one response: the user, their households, the
+    categories and the expenses of the current month in one household.
+
+    The household is the one given as `household`, or else the first one of the user. Each list
+    takes its own fields, as `fields[households]`, `fields[categories]` and `fields[expenses]`.
+    The response costs the same queries however many rows it holds: the households and the
+    expenses of the month are read with one query each, and the categories come from the
+    category catalogue.
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request):
+        household_ids = membership.household_ids(request.user.pk)
+        if 'household' in request.query_params:
+            household = self.get_household_id()
+            if household not in household_ids:
+                raise PermissionDenied()
+        else:
+            household = min(household_ids) if household_ids else None
+
+        households = HouseholdSerializer(Household.objects.filter(id__in=household_ids).order_by('id'), many=True)
+        category_fields = self._get_fields('categories', CategorySerializer.Meta.fields)
+        names, columns = exporting.columns_for(self._get_fields('expenses', ExpenseSerializer.Meta.fields))
+        today = timezone.localdate()
+        expenses = Expense.objects.filter(
+            household_id=household, year=today.year, month=today.month
+        ).order_by(*exporting.ORDERING).values_list(*columns) if household is not None else []
+
+        return Response(OrderedDict([
+            ('user', OrderedDict([('id', request.user.pk), ('name', request.user.username)])),
+            ('households', self._sparse(households.data, self._get_fields('households', households.child.fields))),
+            ('categories', self._sparse(get_catalogue().data, category_fields)),
+            ('household', household),
+            ('year', today.year),
+            ('month', today.month),
+            ('expenses', Rows(names, list(expenses))),
+        ]))
+
+    def _get_fields(self, section, available):
+        return requested_fields(self.request, list(available), '{}[{}]'.format(FIELDS_PARAM, section))
+
+    def _sparse(self, items, fields):
+        if fields is None:
+            return items
+        return [OrderedDict((name, item[name]) for name in fields) for item in items]
+
+
+class Metrics(APIView):
+    """Returns the request profile histograms in the Prometheus text format (staff only).
+
+    They are only recorded when PROFILING_ENABLED is True.
+    """
+    permission_classes = (permissions.IsAdminUser,)
+    renderer_classes = (PrometheusRenderer,)
+
+    def get(self, request):
+        # Passed to the Response: a Content-Type header set on it would be replaced by the renderer's.
+        return Response(registry.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+class TaskList(HouseholdMixin, generics.ListAPIView):
+    """Lists the latest background tasks the user can see, newest first.
+
+    They are the tasks the user asked for and those of their households; pass `household` to only
+    list the tasks of one of them.
+    """
+    serializer_class = TaskSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    limit = 50
+
+    def get_queryset(self):
+        queryset = tasks.visible_to(self.request.user)
+        if 'household' in self.request.query_params:
+            queryset = queryset.filter(household_id=self.get_household_id())
+        return queryset.order_by('-id')[:self.limit]
+
+
+class TaskDetail(generics.RetrieveAPIView):
+    """Returns the status of a background task, and its result once it finished.
+
+    Poll it until `status` is SUCCEEDED or FAILED.
+    """
+    serializer_class = TaskSerializer
+    permission_classes = (permissions.IsAuthenticated,)
+    lookup_field = 'uuid'
+
+    def get_queryset(self):
+        return tasks.visible_to(self.request.user)
+
+
+class TaskDownload(generics.RetrieveAPIView):
+    """Sends the file written by a background task, like an export, to those who can see the task.
+
+    Answers 404 when the task wrote no file, or once the file expired: PRIVATE_FILES_MAX_AGE seconds
+    after the task finished, whether or not it was pruned yet (see core.files).
+    """
+    permission_classes = (permissions.IsAuthenticated,)
+    lookup_field = 'uuid'
+
+    def get_queryset(self):
+        return tasks.visible_to(self.request.user).filter(
+            status=Task.STATUS.SUCCEEDED,
+            finished__gte=timezone.now() - timedelta(seconds=settings.PRIVATE_FILES_MAX_AGE)
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        result = TaskSerializer().get_result(self.get_object()) or {}
+        if not isinstance(result, dict) or 'file' not in result or not files.storage().exists(result['file']):
+            raise Http404("The task has no file to download.")
+        return files.download(
+            result['file'], result.get('filename', result['file'].rpartition('/')[2]),
+            result.get('content_type', 'application/octet-stream')
+        )
@@ -1,11 +1,71 @@
 # -*- coding: utf-8 -*-
 from django.contrib import admin
+from django.utils.dates import MONTHS
 
-from .models import Expense, Category
+from core.admin import ScalableAdminMixin
 
+from . import bulk, search
+from .models import Expense, Category, MonthlyRollup, RecurringExpense
 
-class ExpenseAdmin(admin.ModelAdmin):
-    list_display = ('amount', 'category', 'roommate', 'year', 'month')
+
+class YearFilter(admin.SimpleListFilter):
+    """Filters by year, listing the years of the rollups instead of scanning the expenses."""
+    title = 'año'
+    parameter_name = 'year'
+
+    def lookups(self, request, model_admin):
+        years = MonthlyRollup.objects.order_by('-year').values_list('year', flat=True).distinct()
+        return [(year, year) for year in years]
+
+    def queryset(self, request, queryset):
+        return queryset.filter(year=self.value()) if self.value() else queryset
+
+
+class MonthFilter(admin.SimpleListFilter):
+    title = 'mes'
+    parameter_name = 'month'
+
+    def lookups(self, request, model_admin):
+        return sorted(MONTHS.items())
+
+    def queryset(self, request, queryset):
+        return queryset.filter(month=self.value()) if self.value() else queryset
+
+
+class ExpenseAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    list_display = ('amount', 'description', 'category', 'roommate', 'year', 'month', 'status')
+    # Roommate.__str__ shows the household and the user.
+    list_select_related = ('category', 'roommate__household', 'roommate__user')
+    list_filter = ('status', YearFilter, MonthFilter)
+    search_fields = ('description',)
+    raw_id_fields = ('roommate',)
+    # Splits are set through the API, which checks the weights (see expenses.shares.set_split).
+    readonly_fields = ('split',)
+    actions = ('mark_paid', 'mark_pending')
+
+    def get_search_results(self, request, queryset, search_term):
+        """Searches the descriptions with the full-text index (see expenses.search)."""
+        if not search_term.strip():
+            return queryset, False
+        return search.match_text(queryset, search_term.strip()), False
+
+    def mark_paid(self, request, queryset):
+        updated = bulk.bulk_set_status(queryset, Expense.STATUS.PAID)
+        self.message_user(request, "{} gastos marcados como pagados.".format(updated))
+    mark_paid.short_description = "Marcar como pagados"
+
+    def mark_pending(self, request, queryset):
+        updated = bulk.bulk_set_status(queryset, Expense.STATUS.PENDING)
+        self.message_user(request, "{} gastos marcados como pendientes.".format(updated))
+    mark_pending.short_description = "Marcar como pendientes"
+
+
+class RecurringExpenseAdmin(admin.ModelAdmin):
+    list_display = ('household', 'amount', 'category', 'roommate', 'cadence', 'start_year', 'start_month', 'active')
+    list_filter = ('cadence', 'active')
+    list_select_related = ('household', 'category', 'roommate__household', 'roommate__user')
+    raw_id_fields = ('household', 'roommate')
 
 admin.site.register(Expense, ExpenseAdmin)
+admin.site.register(RecurringExpense, RecurringExpenseAdmin)
 admin.site.register(Category)
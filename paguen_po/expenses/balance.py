@@ -0,0 +1,120 @@
+# -*- coding: utf-8 -*-
+from collections import OrderedDict, defaultdict
+
+from django.db.models import Sum
+
+from .models import ExpenseShare, MonthlyRollup
+
+
+def split_evenly(total, roommate_ids):
+    """Splits an integer amount between roommates.
+
+    The remainder of the division is handed out one unit at a time, in roommate id order, so the
+    shares always add up to `total` and the result is deterministic.
+    """
+    roommate_ids = sorted(roommate_ids)
+    if not roommate_ids:
+        return {}
+    share, remainder = divmod(total, len(roommate_ids))
+    return {
+        roommate_id: share + (1 if position < remainder else 0)
+        for position, roommate_id in enumerate(roommate_ids)
+    }
+
+
+def settle(balances):
+    """Returns the transfers that bring every balance to zero.
+
+    `balances` maps a roommate id to what they paid minus what they owed, and must add up to zero.
+    Debtors and creditors are each sorted once, largest amount first, and matched in that order:
+    the current debtor pays the current creditor as much as both allow, and whichever of them is
+    settled is replaced by the next one. This greedy matching takes at most n - 1 transfers and runs
+    in O(n log n), but is not guaranteed to use the fewest transfers possible; finding those is
+    NP-hard.
+    """
+    debtors = sorted(
+        ([roommate_id, -amount] for roommate_id, amount in balances.items() if amount < 0),
+        key=lambda item: (-item[1], item[0])
+    )
+    creditors = sorted(
+        ([roommate_id, amount] for roommate_id, amount in balances.items() if amount > 0),
+        key=lambda item: (-item[1], item[0])
+    )
+    transfers = []
+    debtor, creditor = 0, 0
+    while debtor < len(debtors) and creditor < len(creditors):
+        amount = min(debtors[debtor][1], creditors[creditor][1])
+        transfers.append(OrderedDict([
+            ('from', debtors[debtor][0]),
+            ('to', creditors[creditor][0]),
+            ('amount', amount)
+        ]))
+        debtors[debtor][1] -= amount
+        creditors[creditor][1] -= amount
+        if debtors[debtor][1] == 0:
+            debtor += 1
+        if creditors[creditor][1] == 0:
+            creditor += 1
+    return transfers
+
+
+def household_balance(household_id, roommates, year=None, month=None):
+    """Returns the expense totals of a Household and the transfers that settle them.
+
+    `roommates` maps the id of every active Roommate of the Household to its user id. What was
+    paid comes from the monthly rollups, aggregated by roommate, category, year and month in a
+    single query, and what is owed from the expense shares, aggregated by roommate in another one.
+    """
+    period = {'household_id': household_id}
+    if year is not None:
+        period['year'] = year
+    if month is not None:
+        period['month'] = month
+    rows = MonthlyRollup.objects.filter(count__gt=0, **period).values(
+        'roommate_id', 'category_id', 'year', 'month'
+    ).annotate(total=Sum('amount')).order_by()
+    owed = dict(
+        ExpenseShare.objects.filter(**period).values('roommate_id').annotate(
+            total=Sum('amount')
+        ).order_by().values_list('roommate_id', 'total')
+    )
+
+    paid = defaultdict(int)
+    by_category = defaultdict(int)
+    by_month = defaultdict(int)
+    for row in rows:
+        paid[row['roommate_id']] += row['total']
+        by_category[row['category_id']] += row['total']
+        by_month[(row['year'], row['month'])] += row['total']
+
+    total = sum(paid.values())
+    balances = {
+        roommate_id: paid.get(roommate_id, 0) - owed.get(roommate_id, 0)
+        for roommate_id in set(paid) | set(owed) | set(roommates)
+    }
+
+    return OrderedDict([
+        ('household', household_id),
+        ('year', year),
+        ('month', month),
+        ('total', total),
+        ('roommates', [
+            OrderedDict([
+                ('roommate', roommate_id),
+                ('user', roommates.get(roommate_id)),
+                ('paid', paid.get(roommate_id, 0)),
+                ('owed', owed.get(roommate_id, 0)),
+                ('balance', balances[roommate_id])
+            ])
+            for roommate_id in sorted(balances)
+        ]),
+        ('categories', [
+            OrderedDict([('category', category_id), ('total', amount)])
+            for category_id, amount in sorted(by_category.items(), key=lambda item: -item[1])
+        ]),
+        ('months', [
+            OrderedDict([('year', key[0]), ('month', key[1]), ('total', amount)])
+            for key, amount in sorted(by_month.items())
+        ]),
+        ('transfers', settle(balances))
+    ])
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+"""Bulk write paths for expenses.
+
+bulk_create and QuerySet.update skip the model signals, so these helpers apply the same side
+effects (rollups, change log, version stamps, feed events) once per batch instead of once per row.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from core.conditional import bump_version
+from core.events import household_channel, publish_on_commit
+
+from . import changes, rollups, shares, versions
+from .models import Expense, ExpenseChange
+
+
+def bulk_create_expenses(expenses, household_id=None):
+    """Inserts expenses with one query per batch, updates the rollups, writes the shares, logs the
+    changes, marks the expenses of their households as changed and notifies each household's feed
+    with one event.
+
+    The expenses are added to `household_id` if given; otherwise each one must have its household.
+    """
+    if household_id is not None:
+        for expense in expenses:
+            expense.household_id = household_id
+    expenses = Expense.objects.bulk_create(expenses)
+    rollups.apply_deltas(rollups.merge_deltas(*(
+        (rollups.current_key(expense), expense.amount, 1) for expense in expenses
+    )))
+    shares.bulk_write_shares(expenses)
+    by_household = defaultdict(list)
+    for expense in expenses:
+        by_household[expense.household_id].append(expense)
+    # Only PostgreSQL returns the ids of bulk inserted rows.
+    changes.record_many(
+        ((expense.household_id, expense.pk) for expense in expenses if expense.pk is not None),
+        ExpenseChange.KIND.UPSERT
+    )
+    bump_version(*(versions.household_expenses(household) for household in by_household))
+    for household, created in by_household.items():
+        publish_on_commit(household_channel(household), 'expense.bulk_created', {
+            'count': len(created), 'ids': [expense.pk for expense in created if expense.pk is not None]
+        })
+    return expenses
+
+
+def bulk_set_status(queryset, status):
+    """Moves the expenses of a queryset to `status` with a single UPDATE, updates the rollups, logs
+    the changes, marks the expenses of their households as changed and notifies each household's
+    feed with one event. Returns how many expenses changed.
+
+    The matching rows are read and locked first, for their rollup deltas; the UPDATE then targets
+    exactly those rows. `status_changed` and `modified` are set as a save would.
+    """
+    now = timezone.now()
+    with transaction.atomic():
+        rows = list(queryset.exclude(status=status).select_for_update().order_by().values_list(
+            'id', *rollups.EXPENSE_FIELDS
+        ))
+        if not rows:
+            return 0
+        Expense.objects.filter(pk__in=[row[0] for row in rows]).update(
+            status=status, status_changed=now, modified=now
+        )
+        deltas = []
+        by_household = defaultdict(list)
+        for row in rows:
+            values = dict(zip(rollups.EXPENSE_FIELDS, row[1:]))
+            deltas.append((tuple(values[field] for field in rollups.KEY_FIELDS), -values['amount'], -1))
+            values['status'] = status
+            deltas.append((tuple(values[field] for field in rollups.KEY_FIELDS), values['amount'], 1))
+            by_household[values['household_id']].append(row[0])
+        rollups.apply_deltas(rollups.merge_deltas(*deltas))
+        changes.record_many(
+            ((household, expense_id) for household, ids in by_household.items() for expense_id in ids),
+            ExpenseChange.KIND.UPSERT
+        )
+    bump_version(*(versions.household_expenses(household) for household in by_household))
+    for household, ids in by_household.items():
+        publish_on_commit(household_channel(household), 'expense.bulk_status_changed', {
+            'status': status, 'count': len(ids), 'ids': ids
+        })
+    return len(rows)
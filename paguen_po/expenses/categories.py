@@ -0,0 +1,78 @@
+# -*- coding: utf-8 -*-
+"""In-process catalogue of the expense categories.
+
+Categories almost never change, so each process keeps a copy of them, keyed by the stamp of the
+versions.CATEGORIES scope (see core.conditional) that is bumped whenever one is saved or deleted.
+The stamp is checked at most every CATEGORY_CATALOGUE_CHECK seconds, and copies are reloaded once
+they are CATEGORY_CATALOGUE_MAX_AGE seconds old, which bounds how long a copy loaded while a change
+was being committed can be served.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from rest_framework.renderers import JSONRenderer
+
+from core.conditional import get_version
+
+from . import versions
+from .models import Category
+
+# Copies kept per process, for the stamps most recently seen.
+SIZE = 4
+
+
+class Catalogue(object):
+    """The categories as of one version: lookups by id and name, and the list pre-rendered as JSON."""
+
+    def __init__(self, categories):
+        self.loaded = time.monotonic()
+        self.names = OrderedDict(categories)
+        self.ids = {name.lower(): category_id for category_id, name in self.names.items()}
+        self.data = [OrderedDict([('id', category_id), ('name', name)]) for category_id, name in self.names.items()]
+        self.json = JSONRenderer().render(self.data)
+
+    def id_for(self, name):
+        """Returns the id of the category with this name, ignoring case, or None."""
+        return self.ids.get(name.lower())
+
+    def name_for(self, category_id):
+        """Returns the name of the category with this id, or None."""
+        return self.names.get(category_id)
+
+
+_lock = threading.Lock()
+_catalogues = OrderedDict()
+_current = {'stamp': None, 'checked': 0}
+
+
+def get_catalogue():
+    """Returns the Catalogue of the current categories."""
+    now = time.monotonic()
+    with _lock:
+        stamp, checked = _current['stamp'], _current['checked']
+    if stamp is None or now - checked > settings.CATEGORY_CATALOGUE_CHECK:
+        stamp = get_version(versions.CATEGORIES)
+        with _lock:
+            _current.update(stamp=stamp, checked=now)
+
+    with _lock:
+        catalogue = _catalogues.get(stamp)
+        if catalogue is not None and now - catalogue.loaded <= settings.CATEGORY_CATALOGUE_MAX_AGE:
+            _catalogues.move_to_end(stamp)
+            return catalogue
+
+    catalogue = Catalogue(Category.objects.order_by('id').values_list('id', 'name'))
+    with _lock:
+        _catalogues[stamp] = catalogue
+        _catalogues.move_to_end(stamp)
+        while len(_catalogues) > SIZE:
+            _catalogues.popitem(last=False)
+    return catalogue
+
+
+def invalidate():
+    """Makes the next lookup in this process check the version stamp."""
+    with _lock:
+        _current['stamp'] = None
@@ -0,0 +1,177 @@
+# -*- coding: utf-8 -*-
+"""Change log of expenses, used to sync clients incrementally.
+
+Every save or delete of an Expense appends an ExpenseChange to the log of its household. Clients
+keep the watermark of the last change they have seen, and later ask for the changes after it.
+
+Ids are handed out when a change is inserted, not when it commits, so a change may become visible
+after others with higher ids were read: a watermark made of ids alone would skip it for good. On
+PostgreSQL each change records the id of its transaction (see install), changes are read in
+(txid, id) order, and only those of transactions older than every transaction still running are
+read. Those are final: no change can show up before them later. Watermarks are "<txid>-<id>".
+
+Changes older than EXPENSES_CHANGES_RETENTION_DAYS are deleted by the prune_changes command. The
+SyncHorizon of a household keeps the position of its latest deleted change, and clients behind it
+must sync from scratch (see expired).
+"""
+from collections import OrderedDict, namedtuple
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connections, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .models import ExpenseChange, SyncHorizon
+
+FUNCTION = 'expenses_expensechange_txid'
+TRIGGER = 'expenses_expensechange_txid'
+
+
+class Watermark(namedtuple('Watermark', 'txid id')):
+    """The position of a change in the log of its household."""
+
+    def __str__(self):
+        return "{}-{}".format(self.txid, self.id)
+
+    @classmethod
+    def parse(cls, value):
+        """Reads a watermark. Plain ids, the watermarks before txids were recorded, come before
+        every change that has one. Raises ValueError on anything else.
+        """
+        txid, _, change_id = value.rpartition('-')
+        if not change_id.isdigit() or not (txid.isdigit() or txid == ''):
+            raise ValueError("Invalid watermark: {!r}".format(value))
+        return cls(int(txid or 0), int(change_id))
+
+
+START = Watermark(0, 0)
+
+
+def supported(connection):
+    return connection.vendor == 'postgresql'
+
+
+def install(cursor):
+    """Creates the trigger that records the transaction of each change."""
+    table = cursor.db.ops.quote_name(ExpenseChange._meta.db_table)
+    cursor.execute(
+        "CREATE OR REPLACE FUNCTION {}() RETURNS trigger AS $$ BEGIN "
+        "NEW.txid := txid_current(); RETURN NEW; "
+        "END $$ LANGUAGE plpgsql".format(FUNCTION)
+    )
+    cursor.execute("DROP TRIGGER IF EXISTS {} ON {}".format(TRIGGER, table))
+    cursor.execute(
+        "CREATE TRIGGER {} BEFORE INSERT ON {} FOR EACH ROW EXECUTE PROCEDURE {}()".format(TRIGGER, table, FUNCTION)
+    )
+
+
+def uninstall(cursor):
+    cursor.execute("DROP FUNCTION IF EXISTS {}() CASCADE".format(FUNCTION))
+
+
+def record(household_id, expense_ids, kind):
+    """Appends a change of the given kind for each expense id to the log of a household."""
+    record_many(((household_id, expense_id) for expense_id in expense_ids), kind)
+
+
+def record_many(pairs, kind):
+    """Appends a change of the given kind for each (household id, expense id) pair."""
+    ExpenseChange.objects.bulk_create(
+        ExpenseChange(household_id=household_id, expense_id=expense_id, kind=kind)
+        for household_id, expense_id in pairs
+    )
+
+
+def settled_txid(using):
+    """Returns the id of the oldest transaction still running on PostgreSQL, or None elsewhere.
+
+    Every change with a lower txid has been committed or rolled back.
+    """
+    connection = connections[using]
+    if not supported(connection):
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT txid_snapshot_xmin(txid_current_snapshot())")
+        return cursor.fetchone()[0]
+
+
+def settled_changes(household_id):
+    """Returns the changes of a household that no running transaction can come before."""
+    queryset = ExpenseChange.objects.filter(household_id=household_id)
+    # Read the oldest running transaction before the changes, so none commits in between unseen.
+    txid = settled_txid(queryset.db)
+    return queryset if txid is None else queryset.filter(txid__lt=txid)
+
+
+def after(watermark):
+    return Q(txid__gt=watermark.txid) | Q(txid=watermark.txid, id__gt=watermark.id)
+
+
+def horizon(household_id):
+    """Returns the position of the latest deleted change of a household, or START."""
+    return Watermark(*SyncHorizon.objects.filter(household_id=household_id).values_list(
+        'txid', 'change_id'
+    ).first() or START)
+
+
+def latest_watermark(household_id):
+    """Returns the watermark of the latest settled change of a household."""
+    latest = settled_changes(household_id).values_list('txid', 'id').order_by('-txid', '-id').first()
+    return max(Watermark(*latest) if latest else START, horizon(household_id))
+
+
+def expired(household_id, watermark):
+    """Tells whether changes after `watermark` were deleted from the log of a household."""
+    return watermark < horizon(household_id)
+
+
+def changes_since(household_id, watermark, limit):
+    """Returns the net changes of a household after `watermark`, reading at most `limit` changes.
+
+    Returns (kinds, new watermark, more), where `kinds` maps each changed expense id to the kind
+    of its last change, and `more` tells whether changes were left out because of the limit.
+    """
+    changes = list(settled_changes(household_id).filter(after(watermark)).order_by(
+        'txid', 'id'
+    ).values_list('txid', 'id', 'expense_id', 'kind')[:limit + 1])
+    more = len(changes) > limit
+    changes = changes[:limit]
+    kinds = OrderedDict((expense_id, kind) for _, _, expense_id, kind in changes)
+    return kinds, Watermark(*changes[-1][:2]) if changes else watermark, more
+
+
+def prune(days=None, batch_size=1000):
+    """Deletes the changes older than `days` days (EXPENSES_CHANGES_RETENTION_DAYS by default),
+    `batch_size` at a time, and moves the SyncHorizon of their households past them.
+
+    Returns how many changes were deleted.
+    """
+    cutoff = timezone.now() - timedelta(
+        days=settings.EXPENSES_CHANGES_RETENTION_DAYS if days is None else days
+    )
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            changes = list(ExpenseChange.objects.filter(created__lt=cutoff).order_by(
+                'created', 'id'
+            ).values_list('household_id', 'txid', 'id')[:batch_size])
+            if not changes:
+                return deleted
+            latest = {}
+            for household_id, txid, change_id in changes:
+                latest[household_id] = max(latest.get(household_id, START), Watermark(txid, change_id))
+            existing = set(
+                SyncHorizon.objects.filter(household_id__in=latest).values_list('household_id', flat=True)
+            )
+            for household_id in existing:
+                txid, change_id = latest[household_id]
+                SyncHorizon.objects.filter(
+                    Q(txid__lt=txid) | Q(txid=txid, change_id__lt=change_id), household_id=household_id
+                ).update(txid=txid, change_id=change_id)
+            SyncHorizon.objects.bulk_create(
+                SyncHorizon(household_id=household_id, txid=txid, change_id=change_id)
+                for household_id, (txid, change_id) in latest.items() if household_id not in existing
+            )
+            ExpenseChange.objects.filter(id__in=[change_id for _, _, change_id in changes]).delete()
+        deleted += len(changes)
@@ -0,0 +1,23 @@
+# -*- coding: utf-8 -*-
+"""System checks of the expenses app."""
+from collections import OrderedDict
+
+from django.core.checks import Error, register
+
+from .exporting import COLUMNS
+from .serializers import ExpenseSerializer
+
+
+@register()
+def check_export_columns(app_configs, **kwargs):
+    """The export must write the fields of ExpenseSerializer, in the same order."""
+    exported = tuple(OrderedDict((name.split('.')[0], None) for name, _ in COLUMNS))
+    if exported == tuple(ExpenseSerializer.Meta.fields):
+        return []
+    return [Error(
+        "The export columns {} are out of sync with the fields of ExpenseSerializer {}.".format(
+            exported, tuple(ExpenseSerializer.Meta.fields)
+        ),
+        hint="Update expenses.exporting.COLUMNS.",
+        id='expenses.E001',
+    )]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+"""Streaming export of expenses as CSV or NDJSON.
+
+Rows are read from a server-side cursor and written as they arrive, so neither the queryset nor
+the serialized list is ever held in memory. The rows carry the same fields as ExpenseSerializer,
+plus the keyset cursor that resumes the export right after them.
+"""
+import csv
+import json
+from collections import OrderedDict
+
+from .pagination import KeysetPagination, encode_cursor
+
+# Rows are written to the response in groups of this many.
+CHUNK_ROWS = 500
+
+# (output name, database column) for each exported value. Dotted names are nested like the
+# roommate in ExpenseSerializer, and flattened with an underscore in CSV headers. The fields must
+# match those of ExpenseSerializer; a system check makes sure (see expenses.checks).
+COLUMNS = (
+    ('id', 'id'),
+    ('amount', 'amount'),
+    ('description', 'description'),
+    ('category', 'category_id'),
+    ('roommate.household', 'household_id'),
+    ('roommate.user', 'roommate__user_id'),
+    ('year', 'year'),
+    ('month', 'month'),
+)
+
+ORDERING = KeysetPagination.ordering
+
+
+def columns_for(fields=None):
+    """Returns the output names and the database columns of the given ExpenseSerializer fields, all
+    of them by default, for building Rows.
+
+    The ordering columns left out are appended last, so keyset pagination can still read its
+    cursor from the rows; Rows ignores the values past its names.
+    """
+    selected = [(name, column) for name, column in COLUMNS if fields is None or name.split('.')[0] in fields]
+    columns = [column for _, column in selected]
+    columns.extend(field.lstrip('-') for field in ORDERING if field.lstrip('-') not in columns)
+    return [name for name, _ in selected], columns
+
+
+def export_rows(queryset):
+    """Yields an OrderedDict per expense in `queryset`, shaped like ExpenseSerializer's output."""
+    columns = [column for _, column in COLUMNS]
+    cursor_positions = [columns.index(field.lstrip('-')) for field in ORDERING]
+    for values in queryset.order_by(*ORDERING).values_list(*columns).iterator():
+        row = OrderedDict()
+        for (name, _), value in zip(COLUMNS, values):
+            if '.' in name:
+                parent, child = name.split('.')
+                row.setdefault(parent, OrderedDict())[child] = value
+            else:
+                row[name] = value
+        row['cursor'] = encode_cursor(values[position] for position in cursor_positions)
+        yield row
+
+
+def _chunks(lines):
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == CHUNK_ROWS:
+            yield ''.join(chunk)
+            chunk = []
+    if chunk:
+        yield ''.join(chunk)
+
+
+class Echo(object):
+    """File-like object whose write() returns the value instead of storing it."""
+
+    def write(self, value):
+        return value
+
+
+def write_csv(rows):
+    """Yields CSV text for `rows`, starting with a header line."""
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow([name.replace('.', '_') for name, _ in COLUMNS] + ['cursor'])
+        for row in rows:
+            yield writer.writerow([
+                value
+                for cell in row.values()
+                for value in (cell.values() if isinstance(cell, dict) else (cell,))
+            ])
+    return _chunks(lines())
+
+
+def write_ndjson(rows):
+    """Yields one JSON object per line for `rows`."""
+    return _chunks(json.dumps(row, separators=(',', ':')) + '\n' for row in rows)
+
+
+WRITERS = {
+    'csv': (write_csv, 'text/csv'),
+    'ndjson': (write_ndjson, 'application/x-ndjson'),
+}
@@ -0,0 +1,198 @@
+# -*- coding: utf-8 -*-
+"""Streaming import of expenses from CSV or NDJSON files.
+
+Rows are read one at a time and inserted in chunks, so memory use depends on the chunk size and
+not on the size of the file. Every chunk is inserted in its own transaction: a failing chunk does
+not undo the ones before it.
+
+Lines that cannot be read (bytes that are not UTF-8, malformed CSV, anything but a JSON object)
+are reported as errors of their row, like invalid values, and the import goes on.
+"""
+import codecs
+import csv
+import json
+import re
+from collections import OrderedDict
+from itertools import islice
+
+from django.db import transaction
+
+from households.models import Roommate
+
+from .bulk import bulk_create_expenses
+from .categories import get_catalogue
+from .models import Expense
+
+FORMATS = ('csv', 'ndjson')
+DESCRIPTION_LENGTH = Expense._meta.get_field('description').max_length
+# The largest value of a PositiveIntegerField on every supported database; a larger one would make
+# the database reject the whole chunk.
+MAX_INTEGER = 2147483647
+
+# Bytes that are not UTF-8 are decoded as lone surrogates (the surrogateescape error handler), which
+# valid UTF-8 never decodes to.
+UNDECODABLE = re.compile('[\udc80-\udcff]')
+
+
+def undecodable(values):
+    return any(UNDECODABLE.search(value) for value in values if isinstance(value, str))
+
+
+def row_error(message):
+    """Stands in for a row that cannot be read; ExpenseImporter reports it as the row's error."""
+    return ValueError({'row': message})
+
+
+def parse_csv(stream):
+    """Yields (line number, row) for each row of a binary CSV stream with a header line.
+
+    Rows that cannot be read are yielded as a ValueError (see row_error).
+    """
+    reader = csv.DictReader(codecs.iterdecode(stream, 'utf-8-sig', errors='surrogateescape'))
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as error:
+            yield reader.line_num, row_error("Not valid CSV: {}.".format(error))
+            continue
+        if undecodable(row.values()):
+            yield reader.line_num, row_error("Not valid UTF-8.")
+        else:
+            yield reader.line_num, row
+
+
+def parse_ndjson(stream):
+    """Yields (line number, row) for each non-empty line of a binary NDJSON stream.
+
+    Lines that cannot be read are yielded as a ValueError (see row_error).
+    """
+    for line_number, line in enumerate(codecs.iterdecode(stream, 'utf-8', errors='surrogateescape'), 1):
+        if not line.strip():
+            continue
+        if undecodable([line]):
+            yield line_number, row_error("Not valid UTF-8.")
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:
+            row = None
+        yield line_number, row if isinstance(row, dict) else row_error("Not a JSON object.")
+
+
+PARSERS = {
+    'csv': parse_csv,
+    'ndjson': parse_ndjson,
+}
+
+
+def guess_format(filename):
+    """Returns the import format matching a file name, or None."""
+    extension = filename.rsplit('.', 1)[-1].lower()
+    if extension in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    return None
+
+
+class ExpenseImporter(object):
+    """Imports expenses into a Household.
+
+    Each row needs `amount`, `year`, `month` and `roommate`, and may have `description`,
+    `category` (a category name) and `status`. The integers must be JSON integers or strings of
+    digits. A JSON number as `roommate` is a roommate id and a string is a username, or a roommate
+    id if it is made of digits and no roommate has it as username. Categories are looked up in the
+    category catalogue, and roommates in dictionaries built once when the importer is created.
+    """
+    chunk_size = 1000
+    max_errors = 1000
+
+    def __init__(self, household_id, chunk_size=None):
+        self.household_id = household_id
+        if chunk_size is not None:
+            self.chunk_size = chunk_size
+        self.categories = get_catalogue()
+        self.roommates = dict(Roommate.objects.filter(household_id=household_id).values_list(
+            'user__username', 'id'
+        ))
+        self.roommate_ids = set(self.roommates.values())
+
+    def run(self, rows):
+        """Imports the (line number, row) pairs in `rows`.
+
+        Returns a dict with the number of created and failed rows, and the errors of the first
+        `max_errors` failed rows.
+        """
+        result = OrderedDict([('created', 0), ('failed', 0), ('errors', [])])
+        rows = iter(rows)
+        while True:
+            chunk = list(islice(rows, self.chunk_size))
+            if not chunk:
+                return result
+            expenses = []
+            for line_number, row in chunk:
+                try:
+                    expenses.append(self.build_expense(row))
+                except ValueError as error:
+                    result['failed'] += 1
+                    if len(result['errors']) < self.max_errors:
+                        result['errors'].append(OrderedDict([('line', line_number), ('errors', error.args[0])]))
+            with transaction.atomic():
+                bulk_create_expenses(expenses, self.household_id)
+            result['created'] += len(expenses)
+
+    def build_expense(self, row):
+        """Returns an unsaved Expense for a row, or raises ValueError with a dict of field errors."""
+        if isinstance(row, ValueError):
+            raise row
+        errors = {}
+        values = {}
+
+        for field in ('amount', 'year', 'month'):
+            value = row.get(field)
+            if isinstance(value, str) and value.strip().isdecimal():
+                value = int(value)
+            # bool is an int, and floats would be truncated.
+            if isinstance(value, int) and not isinstance(value, bool) and 0 <= value <= MAX_INTEGER:
+                values[field] = value
+            else:
+                errors[field] = "A positive integer up to {} is required.".format(MAX_INTEGER)
+        if 'month' in values and not 1 <= values['month'] <= 12:
+            errors['month'] = "Must be between 1 and 12."
+
+        roommate = row.get('roommate')
+        values['roommate_id'] = self.find_roommate(roommate)
+        if values['roommate_id'] is None:
+            errors['roommate'] = "Unknown roommate {!r}.".format(roommate)
+
+        values['description'] = str(row.get('description') or '').strip()
+        if len(values['description']) > DESCRIPTION_LENGTH:
+            errors['description'] = "At most {} characters.".format(DESCRIPTION_LENGTH)
+
+        category = str(row.get('category') or '').strip()
+        values['category_id'] = self.categories.id_for(category) if category else None
+        if category and values['category_id'] is None:
+            errors['category'] = "Unknown category {!r}.".format(category)
+
+        values['status'] = row.get('status') or Expense.STATUS.PENDING
+        # JSON lists and objects are not hashable, and are no status either.
+        if not isinstance(values['status'], str) or values['status'] not in Expense.STATUS:
+            errors['status'] = "Unknown status {!r}.".format(values['status'])
+
+        if errors:
+            raise ValueError(errors)
+        return Expense(**values)
+
+    def find_roommate(self, value):
+        """Returns the id of the roommate a row names, or None."""
+        if isinstance(value, int) and not isinstance(value, bool):
+            return value if value in self.roommate_ids else None
+        if not isinstance(value, str):
+            return None
+        if value in self.roommates:
+            return self.roommates[value]
+        if value.isdecimal() and int(value) in self.roommate_ids:
+            return int(value)
+        return None
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses.importing import ExpenseImporter, PARSERS, guess_format
+from households.models import Household
+
+
+class Command(BaseCommand):
+    help = "Imports expenses into a household from a CSV or NDJSON file."
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV (with a header line) or NDJSON file to import.")
+        parser.add_argument('--household', type=int, required=True, help="Id of the household.")
+        parser.add_argument('--format', choices=sorted(PARSERS), help="Defaults to the file extension.")
+        parser.add_argument('--chunk-size', type=int, help="Rows inserted per transaction.")
+
+    def handle(self, *args, **options):
+        if not Household.objects.filter(pk=options['household']).exists():
+            raise CommandError("Household {} does not exist.".format(options['household']))
+        import_format = options['format'] or guess_format(options['path'])
+        if import_format is None:
+            raise CommandError("Cannot guess the format of {}, use --format.".format(options['path']))
+
+        importer = ExpenseImporter(options['household'], chunk_size=options['chunk_size'])
+        with open(options['path'], 'rb') as stream:
+            result = importer.run(PARSERS[import_format](stream))
+
+        for error in result['errors']:
+            self.stderr.write("line {}: {}".format(error['line'], error['errors']))
+        self.stdout.write("{} expenses imported, {} rows failed.".format(result['created'], result['failed']))
@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from expenses.recurring import materialize
+
+
+class Command(BaseCommand):
+    help = ("Creates the expenses of the recurring expenses due this month. Safe to run repeatedly; "
+            "meant to run daily from cron.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--year', type=int, help="Defaults to the current year.")
+        parser.add_argument('--month', type=int, help="Defaults to the current month.")
+        parser.add_argument(
+            '--months', type=int, default=1,
+            help="Also create the expenses due this many months back, to catch up on missed runs."
+        )
+        parser.add_argument('--chunk-size', type=int, default=500, help="Recurring expenses per transaction.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        year = options['year'] or today.year
+        month = options['month'] or today.month
+        if not 1 <= month <= 12:
+            raise CommandError("The month must be between 1 and 12.")
+        if options['months'] < 1:
+            raise CommandError("--months must be at least 1.")
+        created = materialize(year, month, options['months'], options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS("{} recurring expenses created.".format(created)))
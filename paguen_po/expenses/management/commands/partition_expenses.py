@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+
+from expenses import partitions
+
+
+class Command(BaseCommand):
+    help = ("Creates the monthly partitions of the expenses table for the coming months and, with --retain, "
+            "detaches the partitions of older months. Run it monthly.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--ahead', type=int, default=3, help="Months after the current one to create partitions for."
+        )
+        parser.add_argument(
+            '--retain', type=int,
+            help="Detach the partitions of months older than this many months before the current one, "
+                 "deleting their rollups and shares."
+        )
+        parser.add_argument('--archive-schema', help="Move the detached partitions to this schema.")
+        parser.add_argument(
+            '--convert', action='store_true',
+            help="Partition the expenses table first if it is not partitioned yet."
+        )
+
+    def handle(self, *args, **options):
+        if not partitions.supported(connection):
+            raise CommandError("Partitioning the expenses table needs PostgreSQL 11 or newer.")
+        today = timezone.localdate()
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                if not options['convert']:
+                    raise CommandError(
+                        "The expenses table is not partitioned: set EXPENSES_PARTITIONED and migrate, "
+                        "or pass --convert."
+                    )
+                partitions.convert(cursor)
+                self.stdout.write("Partitioned the expenses table.")
+
+            for months in range(options['ahead'] + 1):
+                year, month = partitions.add_months(today.year, today.month, months)
+                if partitions.create_partition(cursor, year, month):
+                    self.stdout.write("Created {}.".format(partitions.partition_name(year, month)))
+
+            if options['retain'] is not None:
+                oldest = partitions.add_months(today.year, today.month, -options['retain'])
+                for year, month in sorted(partitions.monthly_partitions(cursor)):
+                    if (year, month) < oldest:
+                        partitions.detach_partition(cursor, year, month, options['archive_schema'])
+                        self.stdout.write("Detached {} and dropped its rollups and shares.".format(
+                            partitions.partition_name(year, month)
+                        ))
+        self.stdout.write(self.style.SUCCESS("Expense partitions are up to date."))
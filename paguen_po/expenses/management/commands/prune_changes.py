@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from expenses import changes
+
+
+class Command(BaseCommand):
+    help = ("Deletes the expense changes older than the retention period. Clients that synced before them "
+            "fetch the full list again.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.EXPENSES_CHANGES_RETENTION_DAYS,
+            help="Only delete the changes made more than this many days ago."
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Changes deleted per transaction.")
+
+    def handle(self, *args, **options):
+        deleted = changes.prune(options['days'], options['batch_size'])
+        self.stdout.write(self.style.SUCCESS("{} changes pruned.".format(deleted)))
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses import rollups
+
+
+class Command(BaseCommand):
+    help = "Rebuilds the monthly expense rollups from scratch, or checks them for drift with --check."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--household', type=int, help="Only process this household id.")
+        parser.add_argument(
+            '--check', action='store_true',
+            help="Report the rollups that do not match the expenses instead of rebuilding them."
+        )
+
+    def handle(self, *args, **options):
+        household_id = options['household']
+        if not options['check']:
+            rollups.rebuild(household_id)
+            self.stdout.write(self.style.SUCCESS("Rollups rebuilt."))
+            return
+
+        drift = rollups.find_drift(household_id)
+        for key, expected, stored in drift:
+            self.stdout.write(
+                "household={} roommate={} category={} year={} month={} status={}: ".format(*key) +
+                "expected amount={} count={}, stored amount={} count={}".format(*(expected + stored))
+            )
+        if drift:
+            raise CommandError("{} rollups drifted from the expenses.".format(len(drift)))
+        self.stdout.write(self.style.SUCCESS("Rollups match the expenses."))
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from django.core.management.base import BaseCommand, CommandError
+
+from expenses import shares
+
+
+class Command(BaseCommand):
+    help = ("Splits the equally split expenses again between the current roommates of their households. "
+            "Run it after roommates join or leave a household.")
+
+    def add_arguments(self, parser):
+        parser.add_argument('--household', type=int, help="Only process this household id.")
+        parser.add_argument('--since', help="Only process the expenses from this month on, as YYYY-MM.")
+        parser.add_argument('--chunk-size', type=int, default=1000, help="Expenses per transaction.")
+
+    def handle(self, *args, **options):
+        since = None
+        if options['since']:
+            try:
+                since = tuple(int(part) for part in options['since'].split('-'))
+            except ValueError:
+                since = ()
+            if len(since) != 2 or not 1 <= since[1] <= 12:
+                raise CommandError("--since must be a month as YYYY-MM.")
+        count = shares.recompute(options['household'], since, options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS("Shares of {} expenses recomputed.".format(count)))
@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 11:31
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def build_rollups(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    MonthlyRollup = apps.get_model('expenses', 'MonthlyRollup')
+    rows = Expense.objects.values(
+        'roommate__household_id', 'roommate_id', 'category_id', 'year', 'month', 'status'
+    ).annotate(total=models.Sum('amount'), rows=models.Count('id')).order_by()
+    MonthlyRollup.objects.bulk_create(
+        (
+            MonthlyRollup(
+                household_id=row['roommate__household_id'], roommate_id=row['roommate_id'],
+                category_id=row['category_id'], year=row['year'], month=row['month'],
+                status=row['status'], amount=row['total'], count=row['rows']
+            )
+            for row in rows.iterator()
+        ),
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('households', '0001_initial'),
+        ('expenses', '0002_expense_keyset_idx'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MonthlyRollup',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(verbose_name='año')),
+                ('month', models.PositiveIntegerField(verbose_name='mes')),
+                ('status', models.CharField(choices=[('PENDING', 'pendiente'), ('PAID', 'pagado')], max_length=100, verbose_name='status')),
+                ('amount', models.BigIntegerField(default=0, verbose_name='monto')),
+                ('count', models.IntegerField(default=0, verbose_name='cantidad')),
+                ('category', models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.Category')),
+                ('household', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='households.Household')),
+                ('roommate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='households.Roommate')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='monthlyrollup',
+            unique_together=set([('household', 'roommate', 'category', 'year', 'month', 'status')]),
+        ),
+        migrations.RunPython(build_rollups, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 11:35
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('households', '0001_initial'),
+        ('expenses', '0003_monthlyrollup'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseChange',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('expense_id', models.IntegerField()),
+                ('kind', models.CharField(choices=[('UPSERT', 'guardado'), ('DELETE', 'borrado')], max_length=10)),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('household', models.ForeignKey(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, to='households.Household')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='created',
+            field=model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created'),
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='modified',
+            field=model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified'),
+        ),
+        migrations.AddIndex(
+            model_name='expensechange',
+            index=models.Index(fields=['household', 'id'], name='expensechange_sync_idx'),
+        ),
+    ]
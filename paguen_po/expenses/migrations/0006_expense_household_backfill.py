@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models, transaction
+
+import core.operations
+
+BATCH_SIZE = 10000
+
+
+def backfill_household(apps, schema_editor):
+    """Copies the household of each roommate into its expenses.
+
+    Runs over id ranges, each in its own short transaction, so rows are only locked for one batch
+    at a time and the table stays writable.
+    """
+    Expense = apps.get_model('expenses', 'Expense')
+    Roommate = apps.get_model('households', 'Roommate')
+    bounds = Expense.objects.aggregate(first=models.Min('id'), last=models.Max('id'))
+    if bounds['first'] is None:
+        return
+    household = models.Subquery(
+        Roommate.objects.filter(pk=models.OuterRef('roommate_id')).values('household_id')[:1]
+    )
+    for start in range(bounds['first'], bounds['last'] + 1, BATCH_SIZE):
+        with transaction.atomic():
+            Expense.objects.filter(
+                id__gte=start, id__lt=start + BATCH_SIZE, household__isnull=True
+            ).update(household_id=household)
+
+
+class Migration(migrations.Migration):
+    # Batches commit on their own and PostgreSQL builds indexes concurrently only outside of a
+    # transaction.
+    atomic = False
+
+    dependencies = [
+        ('households', '0001_initial'),
+        ('expenses', '0005_expense_household'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_household, migrations.RunPython.noop),
+        core.operations.AddIndexConcurrently(
+            model_name='expense',
+            index=models.Index(fields=['household', 'year', 'month', 'id'], name='expense_household_month_idx'),
+        ),
+        core.operations.AddIndexConcurrently(
+            model_name='expense',
+            index=models.Index(fields=['household', 'status'], name='expense_household_status_idx'),
+        ),
+        core.operations.AddIndexConcurrently(
+            model_name='expense',
+            index=models.Index(fields=['roommate', 'year', 'month'], name='expense_roommate_month_idx'),
+        ),
+        # Superseded by expense_household_month_idx, as expenses are always filtered by household.
+        migrations.RemoveIndex(
+            model_name='expense',
+            name='expense_keyset_idx',
+        ),
+    ]
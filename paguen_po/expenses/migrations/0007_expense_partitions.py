@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.db import migrations
+
+from expenses import partitions
+
+
+def partition_expenses(apps, schema_editor):
+    """Partitions the expenses table by month if EXPENSES_PARTITIONED is set."""
+    if not settings.EXPENSES_PARTITIONED:
+        return
+    if not partitions.supported(schema_editor.connection):
+        raise ImproperlyConfigured("EXPENSES_PARTITIONED needs PostgreSQL 11 or newer.")
+    with schema_editor.connection.cursor() as cursor:
+        if not partitions.is_partitioned(cursor):
+            partitions.convert(cursor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0006_expense_household_backfill'),
+    ]
+
+    operations = [
+        # The partitioned table has the same columns, so the reverse leaves it as it is.
+        migrations.RunPython(partition_expenses, migrations.RunPython.noop),
+    ]
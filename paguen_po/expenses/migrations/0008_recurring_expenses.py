@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 11:48
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('households', '0001_initial'),
+        ('expenses', '0007_expense_partitions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringExpense',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('created', model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created')),
+                ('modified', model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified')),
+                ('amount', models.PositiveIntegerField(verbose_name='monto')),
+                ('cadence', models.CharField(choices=[('MONTHLY', 'mensual'), ('BIMONTHLY', 'bimestral'), ('QUARTERLY', 'trimestral'), ('YEARLY', 'anual')], default='MONTHLY', max_length=20, verbose_name='frecuencia')),
+                ('start_year', models.PositiveIntegerField(verbose_name='año de inicio')),
+                ('start_month', models.PositiveIntegerField(verbose_name='mes de inicio')),
+                ('end_year', models.PositiveIntegerField(blank=True, null=True, verbose_name='año de término')),
+                ('end_month', models.PositiveIntegerField(blank=True, null=True, verbose_name='mes de término')),
+                ('active', models.BooleanField(default=True, verbose_name='activo')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to='expenses.Category')),
+                ('household', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='households.Household')),
+                ('roommate', models.ForeignKey(blank=True, help_text='Vacío para dividir el monto entre todos los roommates.', null=True, on_delete=django.db.models.deletion.CASCADE, to='households.Roommate')),
+            ],
+            options={
+                'abstract': False,
+            },
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='recurring',
+            field=models.ForeignKey(blank=True, editable=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='expenses.RecurringExpense'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='expense',
+            unique_together=set([('recurring', 'roommate', 'year', 'month')]),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 11:50
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from expenses.shares import apportion
+
+BATCH_SIZE = 1000
+
+
+def split_expenses(apps, schema_editor):
+    """Splits every existing expense equally between the active roommates of its household."""
+    Expense = apps.get_model('expenses', 'Expense')
+    ExpenseShare = apps.get_model('expenses', 'ExpenseShare')
+    Roommate = apps.get_model('households', 'Roommate')
+    weights = defaultdict(dict)
+    for roommate_id, household_id in Roommate.objects.filter(is_removed=False).values_list('id', 'household_id'):
+        weights[household_id][roommate_id] = 1
+
+    last_id = 0
+    while True:
+        chunk = list(Expense.objects.filter(id__gt=last_id).order_by('id').values_list(
+            'id', 'household_id', 'year', 'month', 'amount'
+        )[:BATCH_SIZE])
+        if not chunk:
+            return
+        last_id = chunk[-1][0]
+        ExpenseShare.objects.bulk_create(
+            ExpenseShare(
+                expense_id=expense_id, household_id=household_id, roommate_id=roommate_id,
+                year=year, month=month, weight=1, amount=share
+            )
+            for expense_id, household_id, year, month, amount in chunk
+            for roommate_id, share in sorted(apportion(amount, weights[household_id]).items())
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('households', '0001_initial'),
+        ('expenses', '0008_recurring_expenses'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExpenseShare',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('year', models.PositiveIntegerField(verbose_name='año')),
+                ('month', models.PositiveIntegerField(verbose_name='mes')),
+                ('weight', models.PositiveIntegerField(verbose_name='peso')),
+                ('amount', models.PositiveIntegerField(verbose_name='monto')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='expense',
+            name='split',
+            field=models.CharField(choices=[('EQUAL', 'partes iguales'), ('PERCENTAGE', 'porcentajes'), ('FIXED', 'montos fijos')], default='EQUAL', max_length=20, verbose_name='división'),
+        ),
+        migrations.AddField(
+            model_name='expenseshare',
+            name='expense',
+            field=models.ForeignKey(db_constraint=False, db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='shares', to='expenses.Expense'),
+        ),
+        migrations.AddField(
+            model_name='expenseshare',
+            name='household',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='households.Household'),
+        ),
+        migrations.AddField(
+            model_name='expenseshare',
+            name='roommate',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='households.Roommate'),
+        ),
+        migrations.AddIndex(
+            model_name='expenseshare',
+            index=models.Index(fields=['household', 'year', 'month', 'roommate'], name='expenseshare_balance_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='expenseshare',
+            unique_together=set([('expense', 'roommate')]),
+        ),
+        migrations.RunPython(split_expenses, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 11:55
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from expenses import search
+
+
+def install_search(apps, schema_editor):
+    """Indexes the descriptions for full-text search on PostgreSQL.
+
+    Existing expenses have no description yet, so there is nothing to backfill.
+    """
+    if not search.supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        search.install(cursor)
+        search.create_index(cursor)
+
+
+def uninstall_search(apps, schema_editor):
+    if not search.supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        search.uninstall(cursor)
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL builds indexes concurrently only outside of a transaction.
+    atomic = False
+
+    dependencies = [
+        ('expenses', '0009_expense_shares'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expense',
+            name='description',
+            field=models.CharField(blank=True, default='', max_length=255, verbose_name='descripción'),
+        ),
+        migrations.RunPython(install_search, uninstall_search),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 12:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from core.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL builds indexes concurrently only outside of a transaction.
+    atomic = False
+
+    dependencies = [
+        ('expenses', '0010_expense_description'),
+    ]
+
+    operations = [
+        # The same columns as expense_keyset_idx, which 0006 dropped because the API always filters
+        # by household. The admin filters months across all households, which
+        # expense_household_month_idx cannot serve as it leads with the household.
+        AddIndexConcurrently(
+            model_name='expense',
+            index=models.Index(fields=['year', 'month', 'id'], name='expense_month_idx'),
+        ),
+    ]
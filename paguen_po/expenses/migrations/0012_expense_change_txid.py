@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 12:40
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from core.operations import AddIndexConcurrently
+from expenses import changes
+
+
+def install_txid(apps, schema_editor):
+    """Records the transaction of each change on PostgreSQL.
+
+    Existing changes keep txid 0, so they come before every new one, in id order as they did.
+    """
+    if not changes.supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        changes.install(cursor)
+
+
+def uninstall_txid(apps, schema_editor):
+    if not changes.supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cursor:
+        changes.uninstall(cursor)
+
+
+class Migration(migrations.Migration):
+    # PostgreSQL builds indexes concurrently only outside of a transaction.
+    atomic = False
+
+    dependencies = [
+        ('households', '0002_active_roommates'),
+        ('expenses', '0011_expense_month_idx'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='expensechange',
+            name='txid',
+            field=models.BigIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(install_txid, uninstall_txid),
+        AddIndexConcurrently(
+            model_name='expensechange',
+            index=models.Index(fields=['household', 'txid', 'id'], name='expensechange_position_idx'),
+        ),
+        migrations.RemoveIndex(
+            model_name='expensechange',
+            name='expensechange_sync_idx',
+        ),
+        AddIndexConcurrently(
+            model_name='expensechange',
+            index=models.Index(fields=['created', 'id'], name='expensechange_created_idx'),
+        ),
+        migrations.CreateModel(
+            name='SyncHorizon',
+            fields=[
+                ('household', models.OneToOneField(db_constraint=False, on_delete=django.db.models.deletion.CASCADE, primary_key=True, serialize=False, to='households.Household')),
+                ('txid', models.BigIntegerField()),
+                ('change_id', models.BigIntegerField()),
+            ],
+        ),
+    ]
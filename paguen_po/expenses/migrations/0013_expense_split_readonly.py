@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 12:50
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0012_expense_change_txid'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='expense',
+            name='split',
+            field=models.CharField(choices=[('EQUAL', 'partes iguales'), ('PERCENTAGE', 'porcentajes'), ('FIXED', 'montos fijos')], default='EQUAL', editable=False, max_length=20, verbose_name='división'),
+        ),
+    ]
@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import copy
+import importlib
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+from expenses import partitions
+
+CHECK = 'expense_household_not_null'
+
+
+def backfill_household(apps, schema_editor):
+    """Fills the household of the expenses saved without one since 0006, by code that predates it."""
+    importlib.import_module('expenses.migrations.0006_expense_household_backfill').backfill_household(
+        apps, schema_editor
+    )
+
+
+def household_field(model, null):
+    """Returns a copy of the household field of the historical Expense model, nullable or not."""
+    field = copy.copy(model._meta.get_field('household'))
+    field.null = null
+    return field
+
+
+def set_not_null(apps, schema_editor):
+    """Makes the household of the expenses NOT NULL.
+
+    SET NOT NULL scans the whole table under an exclusive lock. On PostgreSQL a CHECK constraint
+    is validated first, which only blocks schema changes, so PostgreSQL 12 and newer can skip the
+    scan. Partitioned tables do not take NOT VALID constraints: each partition is scanned.
+    """
+    Expense = apps.get_model('expenses', 'Expense')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.alter_field(Expense, household_field(Expense, True), household_field(Expense, False))
+        return
+    table = schema_editor.quote_name(Expense._meta.db_table)
+    with schema_editor.connection.cursor() as cursor:
+        partitioned = partitions.is_partitioned(cursor)
+    if not partitioned:
+        schema_editor.execute("ALTER TABLE {} DROP CONSTRAINT IF EXISTS {}".format(table, CHECK))
+        schema_editor.execute(
+            "ALTER TABLE {} ADD CONSTRAINT {} CHECK (household_id IS NOT NULL) NOT VALID".format(table, CHECK)
+        )
+        schema_editor.execute("ALTER TABLE {} VALIDATE CONSTRAINT {}".format(table, CHECK))
+    schema_editor.execute("ALTER TABLE {} ALTER COLUMN household_id SET NOT NULL".format(table))
+    if not partitioned:
+        schema_editor.execute("ALTER TABLE {} DROP CONSTRAINT {}".format(table, CHECK))
+
+
+def drop_not_null(apps, schema_editor):
+    Expense = apps.get_model('expenses', 'Expense')
+    if schema_editor.connection.vendor != 'postgresql':
+        schema_editor.alter_field(Expense, household_field(Expense, False), household_field(Expense, True))
+        return
+    schema_editor.execute("ALTER TABLE {} ALTER COLUMN household_id DROP NOT NULL".format(
+        schema_editor.quote_name(Expense._meta.db_table)
+    ))
+
+
+class Migration(migrations.Migration):
+    # The backfill commits batch by batch, and each statement below takes its locks on its own.
+    atomic = False
+
+    dependencies = [
+        ('households', '0002_active_roommates'),
+        ('expenses', '0013_expense_split_readonly'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_household, migrations.RunPython.noop),
+        # AlterField would also drop and re-add the foreign key, validating it over the whole table.
+        migrations.SeparateDatabaseAndState(
+            database_operations=[migrations.RunPython(set_not_null, drop_not_null)],
+            state_operations=[
+                migrations.AlterField(
+                    model_name='expense',
+                    name='household',
+                    field=models.ForeignKey(db_index=False, editable=False, on_delete=django.db.models.deletion.CASCADE, to='households.Household'),
+                ),
+            ],
+        ),
+    ]
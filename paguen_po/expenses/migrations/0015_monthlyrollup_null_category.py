@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+INDEX = 'monthlyrollup_no_category_uniq'
+
+
+def merge_duplicates(apps, schema_editor):
+    """Adds up the rollups without category that share the rest of their key into one row.
+
+    unique_together does not stop them: NULL is not equal to NULL.
+    """
+    MonthlyRollup = apps.get_model('expenses', 'MonthlyRollup')
+    key = ('household_id', 'roommate_id', 'year', 'month', 'status')
+    duplicated = MonthlyRollup.objects.filter(category__isnull=True).values(*key).annotate(
+        rows=models.Count('id'), first=models.Min('id'), total=models.Sum('amount'), expenses=models.Sum('count')
+    ).filter(rows__gt=1)
+    for group in duplicated:
+        MonthlyRollup.objects.filter(pk=group['first']).update(amount=group['total'], count=group['expenses'])
+        MonthlyRollup.objects.filter(category__isnull=True, **{field: group[field] for field in key}).exclude(
+            pk=group['first']
+        ).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('expenses', '0014_expense_household_not_null'),
+    ]
+
+    operations = [
+        migrations.RunPython(merge_duplicates, migrations.RunPython.noop),
+        migrations.RunSQL(
+            ["CREATE UNIQUE INDEX {} ON expenses_monthlyrollup (household_id, roommate_id, year, month, status) "
+             "WHERE category_id IS NULL".format(INDEX)],
+            ["DROP INDEX {}".format(INDEX)],
+        ),
+    ]
@@ -1,6 +1,8 @@
 # -*- coding: utf-8 -*-
-from django.db import models
-from model_utils.models import StatusModel
+from django.core.exceptions import ValidationError
+from django.db import models, router, transaction
+from model_utils.fields import AutoCreatedField
+from model_utils.models import StatusModel, TimeStampedModel
 from model_utils import Choices
 
 
@@ -15,15 +17,230 @@ class Category(models.Model):
         return "{}".format(self.name)
 
 
-class Expense(StatusModel):
-    """An expense a user made for a given Household."""
+class Expense(StatusModel, TimeStampedModel):
+    """An expense a user made for a given Household.
+
+    The roommate paid it; what each roommate owes of it is stored in its ExpenseShares, following
+    its split rule (see expenses.shares).
+    """
     STATUS = Choices(
         ('PENDING', 'pendiente'),
         ('PAID', 'pagado')
     )
+    SPLIT = Choices(
+        ('EQUAL', 'partes iguales'),
+        ('PERCENTAGE', 'porcentajes'),
+        ('FIXED', 'montos fijos')
+    )
 
     amount = models.PositiveIntegerField("monto")
+    # Indexed for full-text search on PostgreSQL, see expenses.search.
+    description = models.CharField("descripción", max_length=255, blank=True, default='')
     category = models.ForeignKey("expenses.Category", null=True)
     roommate = models.ForeignKey("households.Roommate", on_delete=models.CASCADE)
+    # The household of the roommate, copied on save so expenses are filtered without a join. It
+    # leads the composite indexes below, so it needs no index of its own.
+    household = models.ForeignKey(
+        "households.Household", editable=False, db_index=False, on_delete=models.CASCADE
+    )
+    year = models.PositiveIntegerField("año")
+    month = models.PositiveIntegerField("mes")
+    recurring = models.ForeignKey(
+        "expenses.RecurringExpense", null=True, blank=True, editable=False, on_delete=models.SET_NULL
+    )
+    # Set with expenses.shares.set_split, which also gives the weights of the roommates.
+    split = models.CharField("división", max_length=20, choices=SPLIT, default=SPLIT.EQUAL, editable=False)
+
+    class Meta:
+        # A recurring expense is materialized at most once per roommate and month.
+        unique_together = ('recurring', 'roommate', 'year', 'month')
+        indexes = [
+            # Backs the keyset pagination of ExpensesList and the exports.
+            models.Index(fields=['household', 'year', 'month', 'id'], name='expense_household_month_idx'),
+            models.Index(fields=['household', 'status'], name='expense_household_status_idx'),
+            models.Index(fields=['roommate', 'year', 'month'], name='expense_roommate_month_idx'),
+            # Backs the year and month filters of the admin, newest first. Those span households, so
+            # expense_household_month_idx cannot serve them.
+            models.Index(fields=['year', 'month', 'id'], name='expense_month_idx'),
+        ]
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Expense, cls).from_db(db, field_names, values)
+        # Keep the values read from the database, so save can tell which fields were changed.
+        instance._loaded_values = dict(zip(field_names, values))
+        return instance
+
+    def fixed_amount_changed(self):
+        """Tells whether the amount of an expense split by fixed amounts changed without a new split."""
+        loaded = getattr(self, '_loaded_values', {})
+        return self.split == self.SPLIT.FIXED and getattr(self, 'split_weights', None) is None and \
+            'amount' in loaded and loaded['amount'] != self.amount
+
+    def clean(self):
+        if self.fixed_amount_changed():
+            raise ValidationError({'amount': "The fixed amounts of the split must be set again along with it."})
+
+    def save(self, *args, **kwargs):
+        if self.fixed_amount_changed():
+            raise ValueError("Set the split again (see expenses.shares.set_split) when changing the amount of "
+                             "an expense split by fixed amounts.")
+        if self.household_id is None or self.roommate_id != getattr(self, '_loaded_values', {}).get('roommate_id'):
+            household_id = self.household_id
+            self.household_id = self.roommate.household_id
+            updated = {'household'}
+            if household_id is not None and household_id != self.household_id and \
+                    getattr(self, 'split_weights', None) is None:
+                # Expenses moved to another household are split equally between its roommates.
+                self.split = self.SPLIT.EQUAL
+                updated.add('split')
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | updated
+        # Model signals are sent outside the transaction of the save; the rollups need the row they
+        # read before it (see rollups.previous_state) to be the one it replaces.
+        using = kwargs.get('using') or router.db_for_write(Expense, instance=self)
+        with transaction.atomic(using=using, savepoint=False):
+            super(Expense, self).save(*args, **kwargs)
+
+
+class RecurringExpense(TimeStampedModel):
+    """A template for an expense that repeats, like the rent or the internet bill.
+
+    The materialize_recurring command creates its Expenses every `cadence` months from the start
+    month on. They are paid by `roommate` or, if there is none, split evenly between the roommates
+    of the household, each paying their share.
+    """
+    CADENCE = Choices(
+        ('MONTHLY', 'mensual'),
+        ('BIMONTHLY', 'bimestral'),
+        ('QUARTERLY', 'trimestral'),
+        ('YEARLY', 'anual')
+    )
+    # Months between two expenses of each cadence.
+    CADENCE_MONTHS = {
+        CADENCE.MONTHLY: 1,
+        CADENCE.BIMONTHLY: 2,
+        CADENCE.QUARTERLY: 3,
+        CADENCE.YEARLY: 12,
+    }
+
+    household = models.ForeignKey("households.Household", on_delete=models.CASCADE)
+    amount = models.PositiveIntegerField("monto")
+    category = models.ForeignKey("expenses.Category", null=True, blank=True, on_delete=models.CASCADE)
+    roommate = models.ForeignKey(
+        "households.Roommate", null=True, blank=True, on_delete=models.CASCADE,
+        help_text="Vacío para dividir el monto entre todos los roommates."
+    )
+    cadence = models.CharField("frecuencia", max_length=20, choices=CADENCE, default=CADENCE.MONTHLY)
+    start_year = models.PositiveIntegerField("año de inicio")
+    start_month = models.PositiveIntegerField("mes de inicio")
+    end_year = models.PositiveIntegerField("año de término", null=True, blank=True)
+    end_month = models.PositiveIntegerField("mes de término", null=True, blank=True)
+    active = models.BooleanField("activo", default=True)
+
+    def __str__(self):
+        return "{} cada {}: {}".format(self.household_id, self.get_cadence_display(), self.amount)
+
+    def clean(self):
+        if self.roommate_id is not None and self.household_id is not None and \
+                self.roommate.household_id != self.household_id:
+            raise ValidationError({'roommate': "The roommate must belong to the household."})
+
+    def is_due(self, year, month):
+        """Tells whether an expense falls on the given month."""
+        months = (year * 12 + month) - (self.start_year * 12 + self.start_month)
+        if months < 0 or months % self.CADENCE_MONTHS[self.cadence]:
+            return False
+        return self.end_year is None or (year, month) <= (self.end_year, self.end_month or 12)
+
+
+class ExpenseShare(models.Model):
+    """The part of an Expense a roommate owes.
+
+    `weight` is what the split rule of the expense gives the roommate: 1 for equal splits, a
+    percentage, or a fixed amount; `amount` is the amount of the expense apportioned by weight.
+    The household and month are copied from the expense, so balances are plain aggregates. The
+    expenses table may be partitioned, so the foreign key to it has no database constraint.
+    """
+    expense = models.ForeignKey(
+        "expenses.Expense", related_name="shares", on_delete=models.CASCADE, db_constraint=False, db_index=False
+    )
+    household = models.ForeignKey("households.Household", on_delete=models.CASCADE, db_index=False)
+    roommate = models.ForeignKey("households.Roommate", on_delete=models.CASCADE)
+    year = models.PositiveIntegerField("año")
+    month = models.PositiveIntegerField("mes")
+    weight = models.PositiveIntegerField("peso")
+    amount = models.PositiveIntegerField("monto")
+
+    class Meta:
+        unique_together = ('expense', 'roommate')
+        indexes = [
+            models.Index(fields=['household', 'year', 'month', 'roommate'], name='expenseshare_balance_idx'),
+        ]
+
+    def __str__(self):
+        return "{} - {}: {}".format(self.expense_id, self.roommate_id, self.amount)
+
+
+class MonthlyRollup(models.Model):
+    """Sum and count of the expenses of a Household, per roommate, category, month and status.
+
+    Kept up to date incrementally as expenses change (see expenses.rollups), so reports can read
+    a handful of rows instead of scanning every expense of the household.
+    """
+    household = models.ForeignKey("households.Household", on_delete=models.CASCADE)
+    roommate = models.ForeignKey("households.Roommate", on_delete=models.CASCADE)
+    category = models.ForeignKey("expenses.Category", null=True, on_delete=models.CASCADE)
     year = models.PositiveIntegerField("año")
     month = models.PositiveIntegerField("mes")
+    status = models.CharField("status", max_length=100, choices=Expense.STATUS)
+    amount = models.BigIntegerField("monto", default=0)
+    count = models.IntegerField("cantidad", default=0)
+
+    class Meta:
+        # NULL categories never clash here; the partial index monthlyrollup_no_category_uniq (see
+        # migration 0015) keeps a single row without category per key.
+        unique_together = ('household', 'roommate', 'category', 'year', 'month', 'status')
+
+    def __str__(self):
+        return "{} {}-{}: {}".format(self.household_id, self.year, self.month, self.amount)
+
+
+class ExpenseChange(models.Model):
+    """A record that an Expense of a Household was saved or deleted.
+
+    Changes are ordered by (txid, id), and the position of the latest change a client has seen is
+    its sync watermark (see expenses.changes). On PostgreSQL a trigger sets `txid` to the id of the
+    transaction that made the change. Deleted expenses keep their change as a tombstone, which is
+    why `expense_id` is not a foreign key. Deleting a household logs the deletion of its expenses
+    while the household itself goes away, so the household has no database constraint either.
+    """
+    KIND = Choices(
+        ('UPSERT', 'guardado'),
+        ('DELETE', 'borrado')
+    )
+
+    id = models.BigAutoField(primary_key=True)
+    household = models.ForeignKey("households.Household", on_delete=models.CASCADE, db_constraint=False)
+    expense_id = models.IntegerField()
+    kind = models.CharField(max_length=10, choices=KIND)
+    txid = models.BigIntegerField(default=0, editable=False)
+    created = AutoCreatedField("created")
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['household', 'txid', 'id'], name='expensechange_position_idx'),
+            models.Index(fields=['created', 'id'], name='expensechange_created_idx'),
+        ]
+
+
+class SyncHorizon(models.Model):
+    """The position of the latest change of a Household deleted from the change log.
+
+    Clients whose watermark is behind it may have missed changes, and must sync from scratch.
+    """
+    household = models.OneToOneField(
+        "households.Household", on_delete=models.CASCADE, primary_key=True, db_constraint=False
+    )
+    txid = models.BigIntegerField()
+    change_id = models.BigIntegerField()
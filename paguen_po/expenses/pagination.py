@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+import base64
+import json
+from collections import OrderedDict
+from functools import reduce
+
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination, _positive_int
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+
+def encode_cursor(values):
+    """Returns an opaque, URL-safe token for the given ordering values."""
+    return base64.urlsafe_b64encode(json.dumps(list(values), separators=(',', ':')).encode('ascii')).decode('ascii')
+
+
+def decode_cursor(token, length):
+    """Returns the ordering values stored in a token built by encode_cursor.
+
+    Raises ValueError if the token is malformed.
+    """
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')).decode('ascii'))
+    except (TypeError, ValueError, UnicodeError):
+        raise ValueError("Malformed cursor.")
+    if not isinstance(values, list) or len(values) != length or \
+            not all(isinstance(value, int) for value in values):
+        raise ValueError("Malformed cursor.")
+    return values
+
+
+def seek_filter(ordering, values):
+    """Returns a Q object that matches the rows placed after `values` in the given ordering.
+
+    All the fields in `ordering` must share the same direction. For ('-year', '-month', '-id') and
+    values (y, m, i) this builds: year < y OR (year = y AND month < m) OR (year = y AND month = m AND id < i).
+
+    The result is also ANDed with year <= y, which the planner can use as an index range and to
+    skip partitions (see expenses.partitions) without having to reason about the OR.
+    """
+    names = [field.lstrip('-') for field in ordering]
+    lookup = 'lt' if ordering[0].startswith('-') else 'gt'
+    clauses = []
+    for position, name in enumerate(names):
+        clause = {"{}__{}".format(name, lookup): values[position]}
+        clause.update(zip(names[:position], values[:position]))
+        clauses.append(Q(**clause))
+    bound = Q(**{"{}__{}e".format(names[0], lookup): values[0]})
+    return bound & reduce(lambda left, right: left | right, clauses)
+
+
+def seek(queryset, token, ordering, invalid_cursor_message='Invalid cursor'):
+    """Filters `queryset` down to the rows placed after the cursor `token` in the given ordering.
+
+    Raises NotFound if the token is malformed.
+    """
+    try:
+        values = decode_cursor(token, len(ordering))
+    except ValueError:
+        raise NotFound(invalid_cursor_message)
+    return queryset.filter(seek_filter(ordering, values))
+
+
+class KeysetPagination(BasePagination):
+    """Keyset (a.k.a. seek) pagination over a unique ordering.
+
+    Pages are fetched with a WHERE clause that starts right after the last row of the previous
+    page instead of an OFFSET, so every page costs the same no matter how deep it is. The
+    ordering must be unique (end it with the primary key) and be backed by an index.
+    """
+    ordering = ('-year', '-month', '-id')
+    page_size = 100
+    max_page_size = 1000
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    invalid_cursor_message = 'Invalid cursor'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.columns = None
+        return self.paginate(queryset, request)
+
+    def paginate_values(self, queryset, request, columns):
+        """Like paginate_queryset, but returns the page as values_list tuples of `columns`.
+
+        The columns must include the ordering fields.
+        """
+        self.columns = list(columns)
+        return self.paginate(queryset.values_list(*columns), request)
+
+    def paginate(self, queryset, request):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+
+        token = request.query_params.get(self.cursor_query_param)
+        if token:
+            queryset = seek(queryset, token, self.ordering, self.invalid_cursor_message)
+
+        # Fetch one extra row to know whether there is a next page.
+        rows = list(queryset.order_by(*self.ordering)[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        self.page = rows[:self.page_size]
+        return self.page
+
+    def get_page_size(self, request):
+        try:
+            return _positive_int(
+                request.query_params[self.page_size_query_param],
+                strict=True,
+                cutoff=self.max_page_size
+            )
+        except (KeyError, ValueError):
+            return self.page_size
+
+    def get_next_link(self):
+        if not self.has_next:
+            return None
+        last = self.page[-1]
+        if self.columns is None:
+            values = [getattr(last, field.lstrip('-')) for field in self.ordering]
+        else:
+            values = [last[self.columns.index(field.lstrip('-'))] for field in self.ordering]
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, encode_cursor(values))
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data)
+        ]))
@@ -0,0 +1,180 @@
+# -*- coding: utf-8 -*-
+"""Monthly partitions of the expenses table on PostgreSQL.
+
+Opt-in with EXPENSES_PARTITIONED. The table is partitioned by range over (year, month), with a
+partition per month and a default one for months without their own. Queries that bound `year`
+and `month` only scan the partitions in range, so filter on them whenever they are known.
+Declarative partitioning with default partitions needs PostgreSQL 11 or newer.
+"""
+import re
+
+from django.db import transaction
+
+from core.conditional import bump_version
+
+from . import versions
+from .models import ExpenseChange, ExpenseShare, MonthlyRollup
+
+TABLE = 'expenses_expense'
+DEFAULT_PARTITION = TABLE + '_default'
+PARTITION_NAME = re.compile(r'^' + TABLE + r'_y(\d{4})m(\d{2})$')
+MINIMUM_VERSION = 110000
+
+
+def supported(connection):
+    return connection.vendor == 'postgresql' and connection.pg_version >= MINIMUM_VERSION
+
+
+def partition_name(year, month):
+    return '{}_y{:04d}m{:02d}'.format(TABLE, year, month)
+
+
+def next_month(year, month):
+    return (year + 1, 1) if month == 12 else (year, month + 1)
+
+
+def add_months(year, month, months):
+    index = year * 12 + month - 1 + months
+    return index // 12, index % 12 + 1
+
+
+def is_partitioned(cursor):
+    cursor.execute("SELECT relkind FROM pg_class WHERE oid = to_regclass(%s)", [TABLE])
+    row = cursor.fetchone()
+    return row is not None and row[0] == 'p'
+
+
+def monthly_partitions(cursor):
+    """Returns {(year, month): partition name} for the monthly partitions of the table."""
+    cursor.execute(
+        "SELECT child.relname FROM pg_inherits JOIN pg_class child ON child.oid = pg_inherits.inhrelid "
+        "WHERE pg_inherits.inhparent = %s::regclass",
+        [TABLE]
+    )
+    found = {}
+    for name, in cursor.fetchall():
+        match = PARTITION_NAME.match(name)
+        if match:
+            found[(int(match.group(1)), int(match.group(2)))] = name
+    return found
+
+
+def row_triggers(cursor, table):
+    """Returns the CREATE TRIGGER statements of the triggers of a table."""
+    cursor.execute(
+        "SELECT pg_get_triggerdef(oid) FROM pg_trigger WHERE tgrelid = %s::regclass AND NOT tgisinternal", [table]
+    )
+    return [definition for definition, in cursor.fetchall()]
+
+
+def retarget(definition, source, target):
+    """Points a CREATE INDEX or CREATE TRIGGER statement on `source` to `target`."""
+    return re.sub(r' ON (\S+\.)?{} '.format(source), ' ON {} '.format(target), definition, count=1)
+
+
+def create_partition(cursor, year, month):
+    """Creates the partition of a month, moving its rows out of the default partition.
+
+    The partition gets the triggers of the default partition (see expenses.search). Does nothing
+    if the partition already exists.
+    """
+    if (year, month) in monthly_partitions(cursor):
+        return False
+    name = cursor.db.ops.quote_name(partition_name(year, month))
+    end = next_month(year, month)
+    with transaction.atomic(using=cursor.db.alias):
+        cursor.execute("CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS)".format(name, TABLE))
+        for definition in row_triggers(cursor, DEFAULT_PARTITION):
+            cursor.execute(retarget(definition, DEFAULT_PARTITION, name))
+        cursor.execute(
+            "WITH moved AS (DELETE FROM {} WHERE year = %s AND month = %s RETURNING *) "
+            "INSERT INTO {} SELECT * FROM moved".format(DEFAULT_PARTITION, name),
+            [year, month]
+        )
+        cursor.execute(
+            "ALTER TABLE {} ATTACH PARTITION {} FOR VALUES FROM (%s, %s) TO (%s, %s)".format(TABLE, name),
+            [year, month, end[0], end[1]]
+        )
+    return True
+
+
+def detach_partition(cursor, year, month, archive_schema=None):
+    """Detaches the partition of a month, keeping it as a standalone table.
+
+    The table is moved to `archive_schema` if given. Its expenses are no longer visible to the
+    application, so what was derived from them goes too: the monthly rollups and expense shares of
+    the month are deleted, and every expense gets a deletion in the change log of its household.
+    """
+    quote_name = cursor.db.ops.quote_name
+    name = quote_name(partition_name(year, month))
+    with transaction.atomic(using=cursor.db.alias):
+        cursor.execute("SELECT DISTINCT household_id FROM {}".format(name))
+        household_ids = [household_id for household_id, in cursor.fetchall()]
+        cursor.execute(
+            "INSERT INTO {} (household_id, expense_id, kind, txid, created) "
+            "SELECT household_id, id, %s, 0, now() FROM {}".format(quote_name(ExpenseChange._meta.db_table), name),
+            [ExpenseChange.KIND.DELETE]
+        )
+        cursor.execute("ALTER TABLE {} DETACH PARTITION {}".format(TABLE, name))
+        for model in (MonthlyRollup, ExpenseShare):
+            cursor.execute(
+                "DELETE FROM {} WHERE year = %s AND month = %s".format(quote_name(model._meta.db_table)), [year, month]
+            )
+        bump_version(*(versions.household_expenses(household_id) for household_id in household_ids))
+        if archive_schema:
+            schema = cursor.db.ops.quote_name(archive_schema)
+            cursor.execute("CREATE SCHEMA IF NOT EXISTS {}".format(schema))
+            cursor.execute("ALTER TABLE {} SET SCHEMA {}".format(name, schema))
+
+
+def convert(cursor):
+    """Turns the expenses table into a partitioned table, copying every row.
+
+    The indexes and foreign keys of the table are recreated on the partitioned table under the
+    same names, and its triggers on every partition. The copy holds an exclusive lock on the
+    table until the transaction commits, so run it in a maintenance window on large tables.
+    """
+    old = TABLE + '_unpartitioned'
+    with transaction.atomic(using=cursor.db.alias):
+        cursor.execute("ALTER TABLE {} RENAME TO {}".format(TABLE, old))
+        # Free the name of the primary key, for the primary key of the partitioned table.
+        cursor.execute(
+            "SELECT indexrelid::regclass::text FROM pg_index WHERE indrelid = %s::regclass AND indisprimary", [old]
+        )
+        for primary_key, in cursor.fetchall():
+            cursor.execute("ALTER INDEX {} RENAME TO {}_pkey".format(primary_key, old))
+        cursor.execute(
+            "SELECT pg_get_indexdef(indexrelid) FROM pg_index WHERE indrelid = %s::regclass AND NOT indisprimary",
+            [old]
+        )
+        indexes = [definition for definition, in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint "
+            "WHERE conrelid = %s::regclass AND contype = 'f'",
+            [old]
+        )
+        foreign_keys = cursor.fetchall()
+        triggers = row_triggers(cursor, old)
+
+        # The primary key of a partitioned table must include the partition key.
+        cursor.execute(
+            "CREATE TABLE {} (LIKE {} INCLUDING DEFAULTS INCLUDING CONSTRAINTS) "
+            "PARTITION BY RANGE (year, month)".format(TABLE, old)
+        )
+        cursor.execute("ALTER TABLE {} ADD PRIMARY KEY (id, year, month)".format(TABLE))
+        cursor.execute("ALTER SEQUENCE {0}_id_seq OWNED BY {0}.id".format(TABLE))
+        cursor.execute("CREATE TABLE {} PARTITION OF {} DEFAULT".format(DEFAULT_PARTITION, TABLE))
+        for definition in triggers:
+            cursor.execute(retarget(definition, old, DEFAULT_PARTITION))
+        cursor.execute("SELECT DISTINCT year, month FROM {}".format(old))
+        for year, month in cursor.fetchall():
+            create_partition(cursor, year, month)
+        cursor.execute("INSERT INTO {} SELECT * FROM {}".format(TABLE, old))
+        cursor.execute("DROP TABLE {}".format(old))
+
+        for definition in indexes:
+            cursor.execute(retarget(definition, old, TABLE))
+        for name, definition in foreign_keys:
+            cursor.execute("ALTER TABLE {} ADD CONSTRAINT {} {}".format(
+                TABLE, cursor.db.ops.quote_name(name), definition
+            ))
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+"""Materialization of recurring expenses into Expenses."""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import F, Q
+
+from households.models import Roommate
+
+from .balance import split_evenly
+from .bulk import bulk_create_expenses
+from .models import Expense, RecurringExpense
+
+
+def month_window(year, month, months):
+    """Returns the (year, month) pairs of the `months` months ending on the given one, oldest first."""
+    index = year * 12 + month - 1
+    return [(position // 12, position % 12 + 1) for position in range(index - months + 1, index + 1)]
+
+
+def materialize(year, month, months=1, chunk_size=500):
+    """Creates the Expenses of the active recurring expenses due in the `months` months ending on
+    the given one, and returns how many were created.
+
+    Templates are processed in chunks of `chunk_size`, each in its own transaction. A chunk reads
+    the templates, roommates and existing expenses and inserts the new ones with a fixed number of
+    queries; updating the monthly rollups (see rollups.apply_deltas) then takes one more query per
+    rollup row the new expenses add to.
+
+    A month of a template that already has expenses is skipped, so it is safe to run it again; a
+    split template is not split again for roommates that joined since. Runs that overlap fail on
+    the unique constraint of Expense instead of duplicating expenses. Templates whose roommate is
+    not of their household (see RecurringExpense.clean) are skipped.
+    """
+    window = month_window(year, month, months)
+    first_year, first_month = window[0]
+    templates = RecurringExpense.objects.filter(
+        Q(start_year__lt=year) | Q(start_year=year, start_month__lte=month),
+        Q(end_year__isnull=True) | Q(end_year__gt=first_year) |
+        Q(end_year=first_year, end_month__isnull=True) | Q(end_year=first_year, end_month__gte=first_month),
+        Q(roommate__isnull=True) | Q(roommate__household_id=F('household_id')),
+        active=True
+    ).order_by('id')
+
+    created = 0
+    last_id = 0
+    while True:
+        chunk = list(templates.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return created
+        last_id = chunk[-1].id
+
+        roommates = defaultdict(list)
+        for roommate_id, household_id in Roommate.objects.filter(
+                household_id__in={template.household_id for template in chunk if template.roommate_id is None}
+        ).values_list('id', 'household_id'):
+            roommates[household_id].append(roommate_id)
+        existing = set(Expense.objects.filter(
+            recurring_id__in=[template.id for template in chunk], year__gte=first_year, year__lte=year
+        ).values_list('recurring_id', 'year', 'month').distinct())
+
+        expenses = []
+        for template in chunk:
+            if template.roommate_id is not None:
+                shares = {template.roommate_id: template.amount}
+            else:
+                shares = split_evenly(template.amount, roommates[template.household_id])
+            for expense_year, expense_month in window:
+                if not template.is_due(expense_year, expense_month) or \
+                        (template.id, expense_year, expense_month) in existing:
+                    continue
+                for roommate_id, amount in sorted(shares.items()):
+                    if not amount:
+                        continue
+                    expenses.append(Expense(
+                        amount=amount, category_id=template.category_id, roommate_id=roommate_id,
+                        household_id=template.household_id, year=expense_year, month=expense_month,
+                        recurring_id=template.id
+                    ))
+        if expenses:
+            with transaction.atomic():
+                bulk_create_expenses(expenses)
+            created += len(expenses)
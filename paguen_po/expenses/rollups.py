@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""Incremental maintenance of the MonthlyRollup table.
+
+Every change to an Expense is turned into a delta (amount, count) for the rollup rows it leaves
+and the one it enters. Paths that bypass model signals (bulk_create, update) must build their own
+deltas and call apply_deltas.
+"""
+from collections import defaultdict
+from itertools import islice
+
+from django.db import IntegrityError, router, transaction
+from django.db.models import Count, F, Sum
+
+from households.models import Roommate
+
+from .models import Expense, MonthlyRollup
+
+KEY_FIELDS = ('household_id', 'roommate_id', 'category_id', 'year', 'month', 'status')
+EXPENSE_FIELDS = ('household_id', 'roommate_id', 'category_id', 'year', 'month', 'status', 'amount')
+
+# Number of keys from which apply_deltas looks up the missing rollup rows all at once.
+BULK_KEYS = 20
+
+
+def current_key(expense):
+    """Returns the rollup key of an expense, as it is in memory."""
+    return tuple(getattr(expense, field) for field in KEY_FIELDS)
+
+
+def previous_state(expense):
+    """Returns (key, amount) for an expense as it is stored in the database, or None if it is not.
+
+    The row is read and locked rather than taken from the values the instance was loaded with, which
+    may be stale; run it in the transaction that saves or deletes the expense (see Expense.save).
+    """
+    if expense.pk is None:
+        return None
+    using = router.db_for_write(Expense, instance=expense)
+    values = Expense.objects.using(using).select_for_update().filter(pk=expense.pk).values(*EXPENSE_FIELDS).first()
+    if values is None:
+        return None
+    if values['household_id'] is None:
+        # Saved before the household column was backfilled.
+        values['household_id'] = Roommate.all_objects.values_list(
+            'household_id', flat=True
+        ).get(pk=values['roommate_id'])
+    key = tuple(values[field] for field in KEY_FIELDS)
+    return key, values['amount']
+
+
+def apply_deltas(deltas):
+    """Adds each (amount, count) delta in `deltas` to the rollup row of its key.
+
+    Missing rows are created for additions only: a removal whose row is gone (for example because
+    the roommate is being deleted along with its rollups) has nothing left to update. When there
+    are many keys, the missing rows are found with one query and inserted with one more.
+    """
+    deltas = {key: delta for key, delta in deltas.items() if delta[0] or delta[1]}
+    created = set()
+    if len(deltas) >= BULK_KEYS:
+        created = _create_missing(deltas)
+    for key, (amount, count) in deltas.items():
+        if key in created:
+            continue
+        lookup = dict(zip(KEY_FIELDS, key))
+        updated = MonthlyRollup.objects.filter(**lookup).update(
+            amount=F('amount') + amount, count=F('count') + count
+        )
+        if updated or count <= 0:
+            continue
+        try:
+            with transaction.atomic():
+                MonthlyRollup.objects.create(amount=amount, count=count, **lookup)
+        except IntegrityError:
+            # Someone else created the row in the meantime.
+            MonthlyRollup.objects.filter(**lookup).update(
+                amount=F('amount') + amount, count=F('count') + count
+            )
+
+
+def _create_missing(deltas):
+    """Inserts the rollup rows of the additions in `deltas` that have none, and returns their keys."""
+    existing = set(MonthlyRollup.objects.filter(
+        household_id__in={key[0] for key in deltas},
+        year__in={key[3] for key in deltas},
+        month__in={key[4] for key in deltas}
+    ).values_list(*KEY_FIELDS))
+    missing = [key for key, (_, count) in deltas.items() if count > 0 and key not in existing]
+    try:
+        with transaction.atomic():
+            MonthlyRollup.objects.bulk_create(
+                MonthlyRollup(amount=deltas[key][0], count=deltas[key][1], **dict(zip(KEY_FIELDS, key)))
+                for key in missing
+            )
+    except IntegrityError:
+        # Someone else created some of them in the meantime: add them up one by one.
+        return set()
+    return set(missing)
+
+
+def merge_deltas(*changes):
+    """Returns a deltas dict from (key, amount, count) triples, adding up the repeated keys."""
+    deltas = defaultdict(lambda: [0, 0])
+    for key, amount, count in changes:
+        deltas[key][0] += amount
+        deltas[key][1] += count
+    return deltas
+
+
+def expected_rows(household_id=None):
+    """Aggregates the expenses table into rollup rows, keyed like the rollups."""
+    expenses = Expense.objects.all()
+    if household_id is not None:
+        expenses = expenses.filter(household_id=household_id)
+    rows = expenses.values(*KEY_FIELDS).annotate(total=Sum('amount'), rows=Count('id')).order_by()
+    for row in rows.iterator():
+        yield tuple(row[field] for field in KEY_FIELDS), row['total'], row['rows']
+
+
+def rebuild(household_id=None, batch_size=1000):
+    """Recomputes the rollups from scratch, for one Household or all of them.
+
+    The rows are inserted `batch_size` at a time: bulk_create makes a list of whatever it is given,
+    so only one batch is held in memory.
+    """
+    with transaction.atomic():
+        rollups = MonthlyRollup.objects.all()
+        if household_id is not None:
+            rollups = rollups.filter(household_id=household_id)
+        rollups.delete()
+        rows = (
+            MonthlyRollup(amount=amount, count=count, **dict(zip(KEY_FIELDS, key)))
+            for key, amount, count in expected_rows(household_id)
+        )
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                return
+            MonthlyRollup.objects.bulk_create(batch)
+
+
+def find_drift(household_id=None):
+    """Returns (key, expected, stored) for every rollup that does not match the expenses table.
+
+    `expected` and `stored` are (amount, count) pairs; empty rows count as (0, 0).
+    """
+    expected = {key: (amount, count) for key, amount, count in expected_rows(household_id)}
+    rollups = MonthlyRollup.objects.all()
+    if household_id is not None:
+        rollups = rollups.filter(household_id=household_id)
+    stored = {}
+    for row in rollups.values_list(*(KEY_FIELDS + ('amount', 'count'))).iterator():
+        stored[row[:-2]] = (row[-2], row[-1])
+    drift = []
+    for key in set(expected) | set(stored):
+        expected_value = expected.get(key, (0, 0))
+        stored_value = stored.get(key, (0, 0))
+        if expected_value != stored_value:
+            drift.append((key, expected_value, stored_value))
+    return sorted(drift, key=lambda item: str(item[0]))
@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+"""Full-text and faceted search over expenses.
+
+On PostgreSQL the description of every expense is indexed in a `search_vector` tsvector column,
+filled by a trigger and backed by a GIN index (see install). The column is not part of the model:
+queries reach it through extra(). Other databases match the description with icontains.
+
+Facets are counted with one aggregate over (category, roommate, year, month) and rolled up in
+Python: there are few such groups per household, however many expenses match.
+"""
+from collections import OrderedDict, defaultdict
+
+from django.db import connections
+from django.db.models import Count, Q
+
+from . import partitions
+from .categories import get_catalogue
+
+CONFIG = 'spanish'
+COLUMN = 'search_vector'
+FUNCTION = 'expenses_expense_search_vector'
+TRIGGER = 'expenses_expense_search_vector'
+INDEX = 'expense_search_idx'
+
+
+def supported(connection):
+    return connection.vendor == 'postgresql'
+
+
+def create_trigger(cursor, table):
+    """Creates the trigger that fills the search vector of the rows of `table`."""
+    table = cursor.db.ops.quote_name(table)
+    cursor.execute("DROP TRIGGER IF EXISTS {} ON {}".format(TRIGGER, table))
+    cursor.execute(
+        "CREATE TRIGGER {} BEFORE INSERT OR UPDATE OF description ON {} "
+        "FOR EACH ROW EXECUTE PROCEDURE {}()".format(TRIGGER, table, FUNCTION)
+    )
+
+
+def install(cursor):
+    """Adds the search vector column, the function that computes it and its triggers.
+
+    A partitioned table cannot have BEFORE triggers of its own before PostgreSQL 13, so each
+    partition gets one; partitions.create_partition copies it to the partitions created later.
+    """
+    cursor.execute(
+        "SELECT 1 FROM information_schema.columns WHERE table_name = %s AND column_name = %s",
+        [partitions.TABLE, COLUMN]
+    )
+    if cursor.fetchone() is None:
+        cursor.execute("ALTER TABLE {} ADD COLUMN {} tsvector".format(partitions.TABLE, COLUMN))
+    cursor.execute(
+        "CREATE OR REPLACE FUNCTION {}() RETURNS trigger AS $$ BEGIN "
+        "NEW.{} := to_tsvector('{}', coalesce(NEW.description, '')); RETURN NEW; "
+        "END $$ LANGUAGE plpgsql".format(FUNCTION, COLUMN, CONFIG)
+    )
+    if partitions.is_partitioned(cursor):
+        tables = list(partitions.monthly_partitions(cursor).values()) + [partitions.DEFAULT_PARTITION]
+    else:
+        tables = [partitions.TABLE]
+    for table in tables:
+        create_trigger(cursor, table)
+
+
+def create_index(cursor):
+    """Creates the GIN index of the search vector, concurrently unless the table is partitioned.
+
+    Partitioned tables cannot build indexes concurrently; each partition gets its own copy.
+    """
+    concurrently = '' if partitions.is_partitioned(cursor) else ' CONCURRENTLY'
+    cursor.execute("CREATE INDEX{} IF NOT EXISTS {} ON {} USING gin ({})".format(
+        concurrently, INDEX, partitions.TABLE, COLUMN
+    ))
+
+
+def uninstall(cursor):
+    """Drops the search vector column, its index, the function and its triggers."""
+    cursor.execute("DROP FUNCTION IF EXISTS {}() CASCADE".format(FUNCTION))
+    cursor.execute("ALTER TABLE {} DROP COLUMN IF EXISTS {}".format(partitions.TABLE, COLUMN))
+
+
+def match_text(queryset, text):
+    """Filters `queryset` down to the expenses whose description matches `text`."""
+    if not supported(connections[queryset.db]):
+        return queryset.filter(description__icontains=text)
+    return queryset.extra(
+        where=["{}.{} @@ plainto_tsquery(%s, %s)".format(partitions.TABLE, COLUMN)],
+        params=[CONFIG, text]
+    )
+
+
+def filter_expenses(queryset, text=None, category=None, roommate=None, amount_range=(None, None),
+                    since=None, until=None):
+    """Filters expenses by every given criterion.
+
+    `category` is a category id or name, `roommate` a roommate id or username, `amount_range` a
+    (minimum, maximum) pair where either may be None, and `since` and `until` inclusive (year,
+    month) pairs.
+    """
+    if text:
+        queryset = match_text(queryset, text)
+    if category is not None:
+        category_id = int(category) if str(category).isdigit() else get_catalogue().id_for(category)
+        if category_id is None:
+            return queryset.none()
+        queryset = queryset.filter(category_id=category_id)
+    if roommate is not None:
+        if str(roommate).isdigit():
+            queryset = queryset.filter(roommate_id=int(roommate))
+        else:
+            queryset = queryset.filter(roommate__user__username=roommate)
+    if amount_range[0] is not None:
+        queryset = queryset.filter(amount__gte=amount_range[0])
+    if amount_range[1] is not None:
+        queryset = queryset.filter(amount__lte=amount_range[1])
+    if since is not None:
+        queryset = queryset.filter(Q(year__gt=since[0]) | Q(year=since[0], month__gte=since[1]))
+    if until is not None:
+        queryset = queryset.filter(Q(year__lt=until[0]) | Q(year=until[0], month__lte=until[1]))
+    return queryset
+
+
+def facets(queryset):
+    """Returns the number of expenses in `queryset` in total, per category, per roommate and per
+    month, with one query.
+    """
+    by_category = defaultdict(int)
+    by_roommate = defaultdict(int)
+    usernames = {}
+    by_month = defaultdict(int)
+    rows = queryset.values_list(
+        'category_id', 'roommate_id', 'roommate__user__username', 'year', 'month'
+    ).annotate(count=Count('id')).order_by()
+    for category_id, roommate_id, username, year, month, count in rows:
+        by_category[category_id] += count
+        by_roommate[roommate_id] += count
+        usernames[roommate_id] = username
+        by_month[(year, month)] += count
+
+    catalogue = get_catalogue()
+    return OrderedDict([
+        ('count', sum(by_category.values())),
+        ('categories', [
+            OrderedDict([('category', category_id), ('name', catalogue.name_for(category_id)), ('count', count)])
+            for category_id, count in sorted(by_category.items(), key=lambda item: (-item[1], item[0] or 0))
+        ]),
+        ('roommates', [
+            OrderedDict([('roommate', roommate_id), ('username', usernames[roommate_id]), ('count', count)])
+            for roommate_id, count in sorted(by_roommate.items(), key=lambda item: (-item[1], item[0]))
+        ]),
+        ('months', [
+            OrderedDict([('year', year), ('month', month), ('count', count)])
+            for (year, month), count in sorted(by_month.items(), reverse=True)
+        ]),
+    ])
@@ -1,21 +1,74 @@
 # -*- coding: utf-8 -*-
 from rest_framework import serializers
 
+from core.serializers import SparseFieldsetMixin
 from households.serializers import RoommateSerializer
 
 from .models import Category, Expense
 
 
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(SparseFieldsetMixin, serializers.ModelSerializer):
 
     class Meta:
         model = Category
         fields = ('id', 'name')
 
 
-class ExpenseSerializer(serializers.ModelSerializer):
+class ExpenseSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     roommate = RoommateSerializer(read_only=True)
 
     class Meta:
         model = Expense
-        fields = ('amount', 'category', 'roommate', 'year', 'month')
+        fields = ('id', 'amount', 'description', 'category', 'roommate', 'year', 'month')
+
+
+class SettleSerializer(serializers.Serializer):
+    """Which expenses of a Household to move to a status, and the status, PAID by default.
+
+    Every given filter must match: the month (`year` and optionally `month`), the `roommate` who
+    paid, and a list of expense `ids`.
+    """
+    household = serializers.IntegerField()
+    status = serializers.ChoiceField(choices=Expense.STATUS, default=Expense.STATUS.PAID)
+    year = serializers.IntegerField(required=False)
+    month = serializers.IntegerField(required=False, min_value=1, max_value=12)
+    roommate = serializers.IntegerField(required=False)
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False)
+
+    def validate(self, data):
+        if 'month' in data and 'year' not in data:
+            raise serializers.ValidationError({'year': "Required when a month is given."})
+        if 'ids' in data and not data['ids']:
+            # Form data parses a missing list as an empty one.
+            if 'ids' in self.initial_data:
+                raise serializers.ValidationError({'ids': "Must not be empty."})
+            del data['ids']
+        return data
+
+
+class SplitSerializer(serializers.Serializer):
+    """The split rule of an expense and the weight of each roommate, by roommate id: a percentage
+    or a fixed amount. Equal splits take no weights and are made between the active roommates.
+
+    The roommates must be active roommates of the household given in the `roommates` context.
+    """
+    household = serializers.IntegerField()
+    split = serializers.ChoiceField(choices=Expense.SPLIT)
+    weights = serializers.DictField(child=serializers.IntegerField(min_value=0), required=False)
+
+    def validate(self, data):
+        roommates = self.context['roommates']
+        if data['split'] == Expense.SPLIT.EQUAL:
+            data['weights'] = {roommate_id: 1 for roommate_id in roommates}
+            return data
+        if not data.get('weights'):
+            raise serializers.ValidationError({'weights': "Required unless the split is equal."})
+        weights = {}
+        for roommate, weight in data['weights'].items():
+            if not str(roommate).isdigit() or int(roommate) not in roommates:
+                raise serializers.ValidationError({
+                    'weights': "{} is not a roommate of the household.".format(roommate)
+                })
+            weights[int(roommate)] = weight
+        data['weights'] = weights
+        return data
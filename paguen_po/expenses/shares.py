@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""What each roommate owes of each expense.
+
+Every split rule comes down to a weight per roommate: 1 for equal splits, a percentage, or a
+fixed amount. set_split sets the rule of an expense and its weights (the API does it at
+gastos/<id>/division/). The amount of the expense is apportioned by weight and stored in
+ExpenseShares when the expense is saved, so balances read plain aggregates. Percentages follow
+changes to the amount, while fixed amounts must be set again along with it (see Expense.save).
+Equal splits are made between the roommates of the household at the time, and made again by a
+background task for the expenses of the month a roommate joins or leaves and later ones (see
+households.signals); the recompute_shares command does it on demand.
+"""
+from collections import defaultdict
+
+from django.db import transaction
+
+from households.models import Roommate
+
+from .models import Expense, ExpenseShare
+
+
+def apportion(total, weights):
+    """Splits an integer amount in proportion to the weights of a {roommate id: weight} dict.
+
+    Uses the largest remainder method: everyone gets the floor of their exact share, and the units
+    left over go to the largest remainders, ties going to the lowest roommate id. The amounts
+    always add up to `total`, and equal weights give the same result as balance.split_evenly.
+    """
+    weight_sum = sum(weights.values())
+    if not weight_sum:
+        return {}
+    amounts = {}
+    remainders = []
+    for roommate_id, weight in weights.items():
+        amounts[roommate_id], remainder = divmod(total * weight, weight_sum)
+        remainders.append((-remainder, roommate_id))
+    for _, roommate_id in sorted(remainders)[:total - sum(amounts.values())]:
+        amounts[roommate_id] += 1
+    return amounts
+
+
+def set_split(expense, rule, weights):
+    """Sets the split rule of an unsaved change to an expense, with a {roommate id: weight} dict.
+
+    Percentages must add up to 100 and fixed amounts to the amount of the expense. Raises
+    ValueError otherwise. The shares are written when the expense is saved.
+    """
+    if rule not in Expense.SPLIT:
+        raise ValueError("Unknown split rule {!r}.".format(rule))
+    if any(weight < 0 for weight in weights.values()) or not any(weights.values()):
+        raise ValueError("Weights must be positive.")
+    if rule == Expense.SPLIT.PERCENTAGE and sum(weights.values()) != 100:
+        raise ValueError("Percentages must add up to 100.")
+    if rule == Expense.SPLIT.FIXED and sum(weights.values()) != expense.amount:
+        raise ValueError("Fixed amounts must add up to the amount of the expense.")
+    if rule == Expense.SPLIT.EQUAL:
+        weights = {roommate_id: 1 for roommate_id in weights}
+    expense.split = rule
+    expense.split_weights = dict(weights)
+
+
+def build_shares(expense, weights):
+    """Returns the unsaved ExpenseShares of an expense for a {roommate id: weight} dict."""
+    return [
+        ExpenseShare(
+            expense_id=expense.pk, household_id=expense.household_id, roommate_id=roommate_id,
+            year=expense.year, month=expense.month, weight=weights[roommate_id], amount=amount
+        )
+        for roommate_id, amount in sorted(apportion(expense.amount, weights).items())
+    ]
+
+
+def equal_weights(household_ids):
+    """Returns {household id: {roommate id: 1}} for the active roommates of each household."""
+    weights = defaultdict(dict)
+    for roommate_id, household_id in Roommate.objects.filter(
+            household_id__in=household_ids).values_list('id', 'household_id'):
+        weights[household_id][roommate_id] = 1
+    return weights
+
+
+def write_shares(expense, keep_weights=True):
+    """Replaces the shares of a saved expense.
+
+    Uses the weights given to set_split if any, else the weights of the current shares when
+    `keep_weights` is true, and otherwise splits the expense equally.
+    """
+    weights = getattr(expense, 'split_weights', None)
+    if weights is None and keep_weights:
+        weights = dict(ExpenseShare.objects.filter(expense_id=expense.pk).values_list('roommate_id', 'weight'))
+    if not weights:
+        weights = equal_weights([expense.household_id])[expense.household_id]
+    ExpenseShare.objects.filter(expense_id=expense.pk).delete()
+    ExpenseShare.objects.bulk_create(build_shares(expense, weights))
+    expense.split_weights = None
+
+
+def bulk_write_shares(expenses):
+    """Writes the shares of newly inserted expenses, with one query to read the roommates and one
+    to insert the shares. Expenses without an id (see bulk.py) are skipped.
+    """
+    expenses = [expense for expense in expenses if expense.pk is not None]
+    weights = equal_weights({expense.household_id for expense in expenses})
+    ExpenseShare.objects.bulk_create(
+        share
+        for expense in expenses
+        for share in build_shares(expense, getattr(expense, 'split_weights', None) or weights[expense.household_id])
+    )
+
+
+def recompute(household_id=None, since=None, chunk_size=1000):
+    """Splits the equally split expenses again between the current roommates of their households.
+
+    Limited to a household and to the expenses from the (year, month) `since` on, if given. Each
+    chunk of expenses is replaced in its own transaction. Returns how many expenses were split.
+    """
+    expenses = Expense.objects.filter(split=Expense.SPLIT.EQUAL)
+    if household_id is not None:
+        expenses = expenses.filter(household_id=household_id)
+    if since is not None:
+        expenses = expenses.filter(year__gte=since[0]).exclude(year=since[0], month__lt=since[1])
+    expenses = expenses.only('id', 'amount', 'household', 'year', 'month').order_by('id')
+
+    recomputed = 0
+    last_id = 0
+    while True:
+        chunk = list(expenses.filter(id__gt=last_id)[:chunk_size])
+        if not chunk:
+            return recomputed
+        last_id = chunk[-1].id
+        weights = equal_weights({expense.household_id for expense in chunk})
+        with transaction.atomic():
+            ExpenseShare.objects.filter(expense_id__in=[expense.id for expense in chunk]).delete()
+            ExpenseShare.objects.bulk_create(
+                share for expense in chunk for share in build_shares(expense, weights[expense.household_id])
+            )
+        recomputed += len(chunk)
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+from django.dispatch import receiver
+
+from core.conditional import bump_version, now_and_on_commit
+from core.events import household_channel, publish_on_commit
+
+from . import categories, changes, rollups, shares, versions
+from .models import Category, Expense, ExpenseChange
+from .serializers import ExpenseSerializer
+
+
+@receiver(pre_save, sender=Expense)
+@receiver(pre_delete, sender=Expense)
+def remember_previous_state(sender, instance, raw=False, **kwargs):
+    """Stores where the expense is counted before it is saved or deleted."""
+    if not raw:
+        instance._previous_state = rollups.previous_state(instance)
+
+
+@receiver(post_save, sender=Expense)
+def expense_saved(sender, instance, raw=False, **kwargs):
+    """Moves the expense out of its previous rollup and into its current one, writes its shares
+    if they changed, logs the change, marks its household's expenses as changed and notifies the
+    household's feed.
+    """
+    if raw:
+        return
+    current = rollups.current_key(instance)
+    deltas = [(current, instance.amount, 1)]
+    event = 'expense.created'
+    previous = getattr(instance, '_previous_state', None)
+    if previous is not None:
+        key, amount = previous
+        deltas.append((key, -amount, -1))
+        event = 'expense.status_changed' if key[5] != current[5] else 'expense.updated'
+        if key[0] != current[0]:
+            # The expense moved to another household: it is gone from the previous one.
+            changes.record(key[0], [instance.pk], ExpenseChange.KIND.DELETE)
+            publish_on_commit(household_channel(key[0]), 'expense.deleted', {'id': instance.pk})
+    rollups.apply_deltas(rollups.merge_deltas(*deltas))
+    if previous is None:
+        shares.write_shares(instance, keep_weights=False)
+    elif getattr(instance, 'split_weights', None) is not None or previous[1] != instance.amount or \
+            previous[0][0] != current[0] or previous[0][3:5] != current[3:5]:
+        shares.write_shares(instance, keep_weights=previous[0][0] == current[0])
+    changes.record(current[0], [instance.pk], ExpenseChange.KIND.UPSERT)
+    bump_version(*{versions.household_expenses(key[0]) for key, _, _ in deltas})
+    publish_on_commit(household_channel(current[0]), event, ExpenseSerializer(instance).data)
+    instance._loaded_values = {field: getattr(instance, field) for field in rollups.EXPENSE_FIELDS}
+
+
+@receiver(post_delete, sender=Expense)
+def expense_deleted(sender, instance, **kwargs):
+    """Takes the expense out of its rollup, leaves a tombstone in the change log, marks its
+    household's expenses as changed and notifies the household's feed.
+    """
+    previous = getattr(instance, '_previous_state', None)
+    if previous is not None:
+        key, amount = previous
+        rollups.apply_deltas({key: (-amount, -1)})
+        changes.record(key[0], [instance.pk], ExpenseChange.KIND.DELETE)
+        bump_version(versions.household_expenses(key[0]))
+        publish_on_commit(household_channel(key[0]), 'expense.deleted', {'id': instance.pk})
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def bump_categories_version(sender, **kwargs):
+    bump_version(versions.CATEGORIES)
+    now_and_on_commit(categories.invalidate)
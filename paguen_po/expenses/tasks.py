@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Background tasks of the expenses (see core.tasks)."""
+import tempfile
+
+from django.core.files import File
+from django.utils import timezone
+
+from core import files
+from core.tasks import task
+
+from . import exporting, rollups, shares
+from .importing import ExpenseImporter, PARSERS
+from .models import Expense
+
+
+# Chunks are committed as they are imported, so a retry would import them twice.
+@task('expenses.import', max_attempts=1)
+def import_expenses(household_id, path, import_format):
+    """Imports a private file (see core.files), then deletes it, whether the import succeeded or not."""
+    try:
+        with files.storage().open(path, 'rb') as upload:
+            return ExpenseImporter(household_id).run(PARSERS[import_format](upload))
+    finally:
+        files.delete(path)
+
+
+@task('expenses.export')
+def export_expenses(household_id, export_format):
+    """Writes all the expenses of a Household to a private file (see core.files).
+
+    Roommates download it from the task (see core.views.TaskDownload) until it is pruned.
+    """
+    writer, _ = exporting.WRITERS[export_format]
+    rows = exporting.export_rows(Expense.objects.filter(household_id=household_id))
+    with tempfile.TemporaryFile() as output:
+        for chunk in writer(rows):
+            output.write(chunk.encode('utf-8'))
+        name = files.save('exports', export_format, File(output))
+    return {
+        'file': name,
+        'filename': 'gastos-{}-{:%Y%m%d%H%M%S}.{}'.format(household_id, timezone.now(), export_format),
+        'content_type': exporting.WRITERS[export_format][1],
+    }
+
+
+@task('expenses.rebuild_rollups')
+def rebuild_rollups(household_id):
+    rollups.rebuild(household_id)
+
+
+@task('expenses.recompute_shares')
+def recompute_shares(household_id, since=None):
+    """Splits the equally split expenses of a Household again, from the [year, month] `since` on."""
+    return {'expenses': shares.recompute(household_id, tuple(since) if since else None)}
@@ -1,3 +1,979 @@
-from django.test import TestCase
+# -*- coding: utf-8 -*-
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+from urllib.parse import parse_qs, urlsplit
 
-# Create your tests here.
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.exceptions import ValidationError
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import CommandError, call_command
+from django.core.urlresolvers import reverse
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Sum
+from django.test import SimpleTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APITestCase, APITransactionTestCase
+
+from core import events, files
+from core.conditional import bump_version
+from core.models import Task
+from households.models import Household, Roommate
+
+from . import categories, changes, checks, exporting, pagination, partitions, rollups, shares, versions
+from .recurring import materialize
+from .serializers import CategorySerializer, ExpenseSerializer
+from .admin import ExpenseAdmin
+from .balance import settle, split_evenly
+from .importing import ExpenseImporter, parse_csv, parse_ndjson
+from .models import Category, Expense, ExpenseChange, ExpenseShare, MonthlyRollup, RecurringExpense
+
+
+class HouseholdFixture(object):
+    """Two roommates of a household, the first one logged in."""
+
+    def setUp(self):
+        super(HouseholdFixture, self).setUp()
+        cache.clear()
+        self.user = User.objects.create_user('ana', password='secreta')
+        self.other = User.objects.create_user('beto', password='secreta')
+        self.household = Household.objects.create(name='casa')
+        self.roommate = Roommate.objects.create(household=self.household, user=self.user)
+        self.other_roommate = Roommate.objects.create(household=self.household, user=self.other)
+        self.category = Category.objects.create(name='luz')
+        self.client.force_login(self.user)
+
+    def expense(self, amount=10, year=2017, month=1, roommate=None, **fields):
+        fields.setdefault('category', self.category)
+        return Expense.objects.create(
+            amount=amount, year=year, month=month, roommate=roommate or self.roommate, **fields
+        )
+
+
+class KeysetCursorTests(SimpleTestCase):
+
+    def test_cursor_round_trip(self):
+        token = pagination.encode_cursor([2017, 3, 42])
+        self.assertEqual(pagination.decode_cursor(token, 3), [2017, 3, 42])
+
+    def test_malformed_cursors(self):
+        for token in ('zzz', pagination.encode_cursor([2017, 3]), pagination.encode_cursor(['2017', 3, 42])):
+            with self.assertRaises(ValueError):
+                pagination.decode_cursor(token, 3)
+
+    def test_seek_filter_is_bounded_by_the_leading_field(self):
+        # The bound lets the planner use an index range and skip partitions.
+        seek = str(pagination.seek_filter(('-year', '-month', '-id'), [2017, 3, 42]))
+        self.assertIn("('year__lte', 2017)", seek)
+        self.assertIn("('year__lt', 2017)", seek)
+        self.assertIn("('id__lt', 42)", seek)
+
+
+class KeysetPaginationTests(HouseholdFixture, APITestCase):
+
+    def test_pages_follow_the_ordering_without_gaps(self):
+        for year in (2016, 2017):
+            for month in range(1, 13):
+                self.expense(year=year, month=month)
+                self.expense(year=year, month=month, roommate=self.other_roommate)
+        url = '{}?household={}&page_size=7'.format(reverse('api:expenses'), self.household.id)
+        seen, queries = [], []
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            queries.append(len(context))
+            seen.extend((expense['year'], expense['month'], expense['id']) for expense in response.data['results'])
+            url = response.data['next']
+        self.assertEqual(len(seen), 48)
+        self.assertEqual(seen, sorted(seen, reverse=True))
+        # Deep pages cost as much as the second one (the first also caches the membership), and
+        # roommates are not fetched row by row.
+        self.assertEqual(len(set(queries[1:])), 1)
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('api:expenses'), {'household': self.household.id, 'cursor': 'zzz'})
+        self.assertEqual(response.status_code, 404)
+
+
+class PartitionNameTests(SimpleTestCase):
+
+    def test_months(self):
+        self.assertEqual(partitions.next_month(2017, 12), (2018, 1))
+        self.assertEqual(partitions.add_months(2017, 11, 3), (2018, 2))
+        self.assertEqual(partitions.add_months(2017, 1, -1), (2016, 12))
+
+    def test_names(self):
+        name = partitions.partition_name(2017, 3)
+        self.assertEqual(name, 'expenses_expense_y2017m03')
+        self.assertEqual(partitions.PARTITION_NAME.match(name).groups(), ('2017', '03'))
+        self.assertIsNone(partitions.PARTITION_NAME.match(partitions.DEFAULT_PARTITION))
+
+    def test_retarget(self):
+        definition = "CREATE TRIGGER t BEFORE INSERT ON public.expenses_expense_default FOR EACH ROW EXECUTE f()"
+        self.assertEqual(
+            partitions.retarget(definition, partitions.DEFAULT_PARTITION, 'expenses_expense_y2017m03'),
+            "CREATE TRIGGER t BEFORE INSERT ON expenses_expense_y2017m03 FOR EACH ROW EXECUTE f()"
+        )
+
+
+class PartitionPruningTests(HouseholdFixture, APITestCase):
+    """Partitions the expenses table within the test transaction, which rolls it back."""
+
+    def setUp(self):
+        if not partitions.supported(connection):
+            self.skipTest("Partitioning needs PostgreSQL 11 or newer.")
+        super(PartitionPruningTests, self).setUp()
+        with connection.cursor() as cursor:
+            if not partitions.is_partitioned(cursor):
+                partitions.convert(cursor)
+            for year, month in ((2017, 1), (2017, 2), (2018, 1)):
+                partitions.create_partition(cursor, year, month)
+
+    def plan(self, queryset):
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN ' + sql, params)
+            return '\n'.join(row for row, in cursor.fetchall())
+
+    def test_seek_skips_later_partitions(self):
+        for year, month in ((2017, 1), (2017, 2), (2018, 1)):
+            self.expense(year=year, month=month)
+        queryset = Expense.objects.filter(household=self.household).filter(
+            pagination.seek_filter(('-year', '-month', '-id'), [2017, 2, 0])
+        )
+        plan = self.plan(queryset)
+        self.assertIn(partitions.partition_name(2017, 1), plan)
+        self.assertNotIn(partitions.partition_name(2018, 1), plan)
+        self.assertEqual(queryset.count(), 1)
+
+    def test_new_partition_takes_its_rows_from_the_default_one(self):
+        expense = self.expense(year=2019, month=5)
+        with connection.cursor() as cursor:
+            self.assertTrue(partitions.create_partition(cursor, 2019, 5))
+            self.assertFalse(partitions.create_partition(cursor, 2019, 5))
+            cursor.execute("SELECT id FROM {}".format(partitions.partition_name(2019, 5)))
+            self.assertEqual(cursor.fetchall(), [(expense.id,)])
+        plan = self.plan(Expense.objects.filter(year=2019, month=5))
+        self.assertNotIn(partitions.DEFAULT_PARTITION, plan)
+
+    def test_detached_months_leave_nothing_behind(self):
+        expense = self.expense(year=2017, month=1)
+        kept = self.expense(year=2017, month=2)
+        with connection.cursor() as cursor:
+            partitions.detach_partition(cursor, 2017, 1)
+        self.assertEqual(list(Expense.objects.all()), [kept])
+        for model in (MonthlyRollup, ExpenseShare):
+            self.assertEqual(set(model.objects.values_list('month', flat=True)), {2}, model)
+        self.assertEqual(
+            ExpenseChange.objects.filter(expense_id=expense.id).latest('id').kind, ExpenseChange.KIND.DELETE
+        )
+        self.assertEqual(rollups.find_drift(), [])
+
+
+class RollupTests(HouseholdFixture, APITestCase):
+
+    def rollup(self, **key):
+        return MonthlyRollup.objects.filter(household=self.household, **key).values_list('amount', 'count').get()
+
+    def test_deltas_follow_every_change(self):
+        expense = self.expense(amount=10)
+        self.expense(amount=5)
+        self.assertEqual(self.rollup(roommate=self.roommate, month=1), (15, 2))
+
+        expense = Expense.objects.get(pk=expense.pk)
+        expense.amount = 20
+        expense.status = Expense.STATUS.PAID
+        expense.roommate = self.other_roommate
+        expense.save()
+        self.assertEqual(self.rollup(roommate=self.roommate, month=1), (5, 1))
+        self.assertEqual(self.rollup(roommate=self.other_roommate, status=Expense.STATUS.PAID), (20, 1))
+
+        expense.month = 3
+        expense.save()
+        self.assertEqual(self.rollup(roommate=self.other_roommate, month=1), (0, 0))
+        self.assertEqual(self.rollup(roommate=self.other_roommate, month=3), (20, 1))
+
+        Expense.objects.only('id').get(pk=expense.pk).delete()
+        self.assertEqual(self.rollup(roommate=self.other_roommate, month=3), (0, 0))
+        self.assertEqual(rollups.find_drift(), [])
+
+    def test_stale_instances_move_what_is_stored(self):
+        expense = self.expense(amount=10)
+        stale = Expense.objects.get(pk=expense.pk)
+        fresh = Expense.objects.get(pk=expense.pk)
+        fresh.month = 2
+        fresh.amount = 20
+        fresh.save()
+        # Loaded as 10 in January, it moves the expense back from February.
+        stale.amount = 30
+        stale.save()
+        self.assertEqual(self.rollup(month=1), (30, 1))
+        self.assertEqual(self.rollup(month=2), (0, 0))
+        self.assertEqual(rollups.find_drift(), [])
+
+    def test_drift_is_found_and_rebuilt(self):
+        self.expense(amount=10)
+        # Bulk updates bypass the signals.
+        Expense.objects.update(amount=99)
+        self.assertEqual(len(rollups.find_drift(self.household.id)), 1)
+        with self.assertRaises(CommandError):
+            call_command('rebuild_rollups', check=True, stdout=StringIO())
+        call_command('rebuild_rollups', stdout=StringIO())
+        self.assertEqual(rollups.find_drift(), [])
+        self.assertEqual(self.rollup(roommate=self.roommate), (99, 1))
+
+    def test_rebuild_inserts_in_batches(self):
+        for month in (1, 2, 3):
+            self.expense(month=month)
+        MonthlyRollup.objects.all().delete()
+        with mock.patch.object(MonthlyRollup.objects, 'bulk_create', wraps=MonthlyRollup.objects.bulk_create) as bulk:
+            rollups.rebuild(self.household.id, batch_size=2)
+        self.assertEqual([len(call[0][0]) for call in bulk.call_args_list], [2, 1])
+        self.assertEqual(rollups.find_drift(), [])
+
+    def test_single_rollup_without_category(self):
+        self.expense(category=None)
+        self.expense(category=None)
+        self.assertEqual(self.rollup(roommate=self.roommate, category=None), (20, 2))
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            MonthlyRollup.objects.create(
+                household=self.household, roommate=self.roommate, category=None, year=2017, month=1,
+                status=Expense.STATUS.PENDING, amount=1, count=1
+            )
+
+
+class ApportionTests(SimpleTestCase):
+
+    def test_amounts_add_up(self):
+        for total in (0, 1, 10, 999, 1001):
+            for weights in ({1: 1, 2: 1, 3: 1}, {1: 33, 2: 33, 3: 34}, {1: 1, 2: 2}, {5: 7}):
+                self.assertEqual(sum(shares.apportion(total, weights).values()), total)
+
+    def test_largest_remainder(self):
+        self.assertEqual(shares.apportion(100, {1: 30, 2: 70}), {1: 30, 2: 70})
+        self.assertEqual(shares.apportion(10, {1: 1, 2: 2}), {1: 3, 2: 7})
+        # Ties go to the lowest roommate id, as in split_evenly.
+        self.assertEqual(shares.apportion(10, {3: 1, 1: 1, 2: 1}), {1: 4, 2: 3, 3: 3})
+        self.assertEqual(shares.apportion(10, {3: 1, 1: 1, 2: 1}), split_evenly(10, [1, 2, 3]))
+
+    def test_no_weights(self):
+        self.assertEqual(shares.apportion(5, {}), {})
+        self.assertEqual(shares.apportion(5, {1: 0}), {})
+
+
+class SettleTests(SimpleTestCase):
+
+    def check_settles(self, balances, transfers):
+        left = dict(balances)
+        for transfer in transfers:
+            self.assertGreater(transfer['amount'], 0)
+            left[transfer['from']] += transfer['amount']
+            left[transfer['to']] -= transfer['amount']
+        self.assertEqual(set(left.values()), {0})
+        self.assertLessEqual(len(transfers), max(len(balances) - 1, 0))
+
+    def test_largest_amounts_are_matched_first(self):
+        balances = {1: -70, 2: -30, 3: 60, 4: 40}
+        transfers = settle(balances)
+        self.assertEqual(
+            [(transfer['from'], transfer['to'], transfer['amount']) for transfer in transfers],
+            [(1, 3, 60), (1, 4, 10), (2, 4, 30)]
+        )
+        self.check_settles(balances, transfers)
+
+    def test_settled_balances(self):
+        self.assertEqual(settle({}), [])
+        self.assertEqual(settle({1: 0, 2: 0}), [])
+
+    def test_many_roommates(self):
+        balances = {roommate_id: (roommate_id * 37) % 101 - 50 for roommate_id in range(1, 40)}
+        balances[40] = -sum(balances.values())
+        self.check_settles(balances, settle(balances))
+
+
+class ShareTests(HouseholdFixture, APITestCase):
+
+    def owed(self, expense):
+        return dict(ExpenseShare.objects.filter(expense=expense).values_list('roommate_id', 'amount'))
+
+    def test_equal_split_by_default(self):
+        expense = self.expense(amount=101)
+        self.assertEqual(self.owed(expense), {self.roommate.id: 51, self.other_roommate.id: 50})
+
+    def test_percentages_follow_the_amount(self):
+        expense = self.expense(amount=101)
+        shares.set_split(expense, Expense.SPLIT.PERCENTAGE, {self.roommate.id: 25, self.other_roommate.id: 75})
+        expense.save()
+        self.assertEqual(self.owed(expense), {self.roommate.id: 25, self.other_roommate.id: 76})
+        expense.amount = 200
+        expense.save()
+        self.assertEqual(self.owed(expense), {self.roommate.id: 50, self.other_roommate.id: 150})
+
+    def test_fixed_amounts_are_set_along_with_the_amount(self):
+        expense = self.expense(amount=200)
+        with self.assertRaises(ValueError):
+            shares.set_split(expense, Expense.SPLIT.FIXED, {self.roommate.id: 10})
+        shares.set_split(expense, Expense.SPLIT.FIXED, {self.other_roommate.id: 200})
+        expense.save()
+        self.assertEqual(self.owed(expense), {self.other_roommate.id: 200})
+        expense = Expense.objects.get(pk=expense.pk)
+        expense.amount = 300
+        with self.assertRaises(ValueError):
+            expense.save()
+
+    def test_split_endpoint(self):
+        expense = self.expense(amount=1000)
+        url = reverse('api:expense_split', kwargs={'pk': expense.pk})
+        response = self.client.post(url, {
+            'household': self.household.id, 'split': Expense.SPLIT.PERCENTAGE,
+            'weights': {str(self.roommate.id): 70, str(self.other_roommate.id): 30}
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.owed(expense), {self.roommate.id: 700, self.other_roommate.id: 300})
+        response = self.client.post(url, {
+            'household': self.household.id, 'split': Expense.SPLIT.FIXED,
+            'weights': {str(self.roommate.id): 1500, '0': 500}
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_recompute_after_a_roommate_joins(self):
+        expense = self.expense(amount=90, month=3)
+        earlier = self.expense(amount=90, month=1)
+        third = Roommate.objects.create(household=self.household, user=User.objects.create_user('carla'))
+        call_command('recompute_shares', '--since', '2017-02', stdout=StringIO())
+        self.assertEqual(self.owed(expense), {self.roommate.id: 30, self.other_roommate.id: 30, third.id: 30})
+        self.assertEqual(len(self.owed(earlier)), 2)
+
+
+class WatermarkTests(SimpleTestCase):
+
+    def test_parse(self):
+        self.assertEqual(changes.Watermark.parse('12-34'), changes.Watermark(12, 34))
+        self.assertEqual(str(changes.Watermark(12, 34)), '12-34')
+        # Plain ids come from before txids were recorded.
+        self.assertEqual(changes.Watermark.parse('7'), changes.Watermark(0, 7))
+        for value in ('', 'abc', '1-', '-1-2', '1-a'):
+            with self.assertRaises(ValueError):
+                changes.Watermark.parse(value)
+
+    def test_order(self):
+        self.assertLess(changes.Watermark(0, 99), changes.Watermark(1, 1))
+        self.assertLess(changes.Watermark(1, 1), changes.Watermark(1, 2))
+
+
+class UnsettledChangeTests(HouseholdFixture, APITestCase):
+
+    def test_changes_of_running_transactions_are_not_read(self):
+        if not changes.supported(connection):
+            self.skipTest("Transaction ids are only recorded on PostgreSQL.")
+        self.expense()
+        # The test runs in a transaction that has not committed.
+        self.assertTrue(ExpenseChange.objects.filter(household_id=self.household.id).exists())
+        self.assertFalse(changes.settled_changes(self.household.id).exists())
+        self.assertEqual(changes.latest_watermark(self.household.id), changes.START)
+
+
+class SyncTests(HouseholdFixture, APITransactionTestCase):
+    """Commits every change, so PostgreSQL treats them as settled."""
+
+    def sync(self, since=None):
+        params = {'household': self.household.id}
+        if since is not None:
+            params['since'] = since
+        response = self.client.get(reverse('api:expense_changes'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.data
+
+    def test_changes_since_a_watermark(self):
+        updated = self.expense()
+        watermark = self.sync()['next']
+        created = self.expense()
+        updated.amount = 5
+        updated.save()
+        deleted = self.expense()
+        deleted_id = deleted.id
+        deleted.delete()
+
+        data = self.sync(watermark)
+        self.assertEqual({expense['id'] for expense in data['upserts']}, {updated.id, created.id})
+        self.assertEqual(data['deletes'], [deleted_id])
+        self.assertFalse(data['reset'])
+        self.assertEqual(self.sync(data['next'])['upserts'], [])
+
+        # Moved to another household: deleted from this one.
+        elsewhere = Roommate.objects.create(household=Household.objects.create(name='otra'), user=self.user)
+        updated.roommate = elsewhere
+        updated.save()
+        self.assertEqual(self.sync(data['next'])['deletes'], [updated.id])
+
+    def test_invalid_watermark(self):
+        response = self.client.get(reverse('api:expense_changes'), {'household': self.household.id, 'since': 'abc'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_pruned_changes_reset_the_client(self):
+        self.expense()
+        behind = self.sync()['next']
+        self.expense()
+        current = self.sync()['next']
+        ExpenseChange.objects.update(created=timezone.now() - timedelta(days=40))
+        recent = self.expense()
+        self.assertEqual(changes.prune(30, batch_size=1), 2)
+
+        data = self.sync(behind)
+        self.assertTrue(data['reset'])
+        self.assertEqual(data['next'], str(changes.latest_watermark(self.household.id)))
+        data = self.sync(current)
+        self.assertFalse(data['reset'])
+        self.assertEqual([expense['id'] for expense in data['upserts']], [recent.id])
+        self.assertTrue(self.sync('0')['reset'])
+
+
+class RecurringTests(HouseholdFixture, APITestCase):
+
+    def recurring(self, **fields):
+        fields.setdefault('household', self.household)
+        return RecurringExpense.objects.create(
+            amount=101, category=self.category, start_year=2017, start_month=1, **fields
+        )
+
+    def test_split_templates_are_materialized_once(self):
+        template = self.recurring(cadence=RecurringExpense.CADENCE.BIMONTHLY)
+        self.assertEqual(materialize(2017, 4, months=4), 4)
+        self.assertEqual(
+            sorted(Expense.objects.values_list('month', 'roommate_id', 'amount')),
+            [(1, self.roommate.id, 51), (1, self.other_roommate.id, 50),
+             (3, self.roommate.id, 51), (3, self.other_roommate.id, 50)]
+        )
+        self.assertTrue(all(expense.recurring_id == template.id for expense in Expense.objects.all()))
+        self.assertEqual(MonthlyRollup.objects.filter(month=3).aggregate(total=Sum('amount'))['total'], 101)
+        # Running it again creates nothing.
+        self.assertEqual(materialize(2017, 4, months=4), 0)
+
+    def test_templates_stop_at_their_end(self):
+        self.recurring(roommate=self.roommate, end_year=2017, end_month=2)
+        call_command('materialize_recurring', year=2017, month=3, months=3, stdout=StringIO())
+        self.assertEqual(sorted(Expense.objects.values_list('month', flat=True)), [1, 2])
+
+    def test_roommate_must_belong_to_the_household(self):
+        elsewhere = Household.objects.create(name='otra')
+        template = self.recurring(household=elsewhere, roommate=self.roommate)
+        with self.assertRaises(ValidationError):
+            template.full_clean()
+        self.assertEqual(materialize(2017, 1), 0)
+        self.assertFalse(Expense.objects.exists())
+
+
+class SearchTests(HouseholdFixture, APITestCase):
+
+    def setUp(self):
+        super(SearchTests, self).setUp()
+        self.agua = Category.objects.create(name='agua')
+        self.light = self.expense(amount=100, month=1, description='cuenta de la luz')
+        self.later_light = self.expense(amount=50, month=3, description='luz de marzo', roommate=self.other_roommate)
+        self.water = self.expense(amount=30, month=3, description='cuenta del agua', category=self.agua)
+
+    def search(self, **params):
+        params.setdefault('household', self.household.id)
+        response = self.client.get(reverse('api:expenses_search'), params)
+        self.assertEqual(response.status_code, 200, response.content)
+        return json.loads(response.content.decode())
+
+    def ids(self, **params):
+        return [row['id'] for row in self.search(**params)['results']]
+
+    def test_text_and_filters(self):
+        self.assertEqual(self.ids(q='luz'), [self.later_light.id, self.light.id])
+        self.assertEqual(self.ids(category='AGUA'), [self.water.id])
+        self.assertEqual(self.ids(category=self.category.id, roommate='beto'), [self.later_light.id])
+        self.assertEqual(self.ids(min_amount=40, max_amount=60), [self.later_light.id])
+        self.assertEqual(self.ids(since='2017-02', until='2017-03'), [self.water.id, self.later_light.id])
+        self.assertEqual(self.ids(category='gas'), [])
+
+    def test_facets_count_every_match(self):
+        data = self.search(q='cuenta', page_size=1)
+        self.assertEqual(len(data['results']), 1)
+        self.assertEqual(data['facets'], {
+            'count': 2,
+            'categories': [
+                {'category': self.category.id, 'name': 'luz', 'count': 1},
+                {'category': self.agua.id, 'name': 'agua', 'count': 1},
+            ],
+            'roommates': [{'roommate': self.roommate.id, 'username': 'ana', 'count': 2}],
+            'months': [{'year': 2017, 'month': 3, 'count': 1}, {'year': 2017, 'month': 1, 'count': 1}],
+        })
+        # Only the first page has them.
+        cursor = parse_qs(urlsplit(data['next']).query)['cursor'][0]
+        self.assertIsNone(self.search(q='cuenta', page_size=1, cursor=cursor)['facets'])
+
+    def test_invalid_parameters(self):
+        for params in ({'min_amount': 'x'}, {'since': '2017'}, {'until': '2017-13'}):
+            params['household'] = self.household.id
+            self.assertEqual(self.client.get(reverse('api:expenses_search'), params).status_code, 400, params)
+
+
+class BulkSettleTests(HouseholdFixture, APITestCase):
+
+    def settle(self, **data):
+        data.setdefault('household', self.household.id)
+        return self.client.post(reverse('api:expenses_settle'), data, format='json')
+
+    def test_settles_the_matching_expenses(self):
+        january = self.expense(month=1)
+        self.expense(month=2)
+        other = self.expense(month=1, roommate=self.other_roommate)
+        response = self.settle(year=2017, month=1, roommate=self.roommate.id)
+        self.assertEqual(response.data, {'status': 'PAID', 'updated': 1})
+        self.assertEqual(Expense.objects.get(pk=january.pk).status, Expense.STATUS.PAID)
+        self.assertEqual(Expense.objects.get(pk=other.pk).status, Expense.STATUS.PENDING)
+        self.assertEqual(rollups.find_drift(), [])
+        self.assertEqual(ExpenseChange.objects.filter(expense_id=january.pk).count(), 2)
+        # Settled already.
+        self.assertEqual(self.settle(year=2017, month=1, roommate=self.roommate.id).data['updated'], 0)
+        self.assertEqual(self.settle(status='PENDING').data['updated'], 1)
+
+    def test_only_expenses_of_the_household(self):
+        elsewhere = Roommate.objects.create(household=Household.objects.create(name='otra'), user=self.other)
+        foreign = self.expense(roommate=elsewhere)
+        mine = self.expense()
+        self.assertEqual(self.settle(ids=[foreign.pk, mine.pk]).data['updated'], 1)
+        self.assertEqual(Expense.objects.get(pk=foreign.pk).status, Expense.STATUS.PENDING)
+
+    def test_invalid_filters(self):
+        self.assertEqual(self.settle(month=1).status_code, 400)
+        self.assertEqual(self.settle(ids=[]).status_code, 400)
+        self.assertEqual(self.settle(status='LOST').status_code, 400)
+
+    def test_admin_actions(self):
+        expense = self.expense()
+        User.objects.filter(pk=self.user.pk).update(is_staff=True, is_superuser=True)
+        response = self.client.post(reverse('admin:expenses_expense_changelist'), {
+            'action': 'mark_paid', '_selected_action': [expense.pk]
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(Expense.objects.get(pk=expense.pk).status, Expense.STATUS.PAID)
+        self.assertEqual(rollups.find_drift(), [])
+
+
+class AdminChangeListTests(HouseholdFixture, APITestCase):
+
+    def setUp(self):
+        super(AdminChangeListTests, self).setUp()
+        User.objects.filter(pk=self.user.pk).update(is_staff=True, is_superuser=True)
+        patcher = mock.patch.object(ExpenseAdmin, 'list_per_page', 2)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def changelist(self, query='', **params):
+        response = self.client.get(reverse('admin:expenses_expense_changelist') + query, params)
+        self.assertEqual(response.status_code, 200)
+        return response.context['cl']
+
+    def test_pages_follow_the_last_row_shown(self):
+        ids = [self.expense(month=month, description='gasto {}'.format(month)).pk for month in range(1, 6)]
+        changelist = self.changelist()
+        self.assertEqual([expense.pk for expense in changelist.result_list], ids[:-3:-1])
+        self.assertIsNone(changelist.first_page_url)
+        self.assertEqual(changelist.next_page_url, '?pk__lt={}'.format(ids[3]))
+
+        second = self.changelist(changelist.next_page_url)
+        self.assertEqual([expense.pk for expense in second.result_list], [ids[2], ids[1]])
+        self.assertIsNotNone(second.first_page_url)
+        last = self.changelist(second.next_page_url)
+        self.assertEqual([expense.pk for expense in last.result_list], [ids[0]])
+        self.assertIsNone(last.next_page_url)
+
+    def test_sorting_by_a_column_uses_numbered_pages(self):
+        for month in range(1, 4):
+            self.expense(month=month)
+        changelist = self.changelist(o='1')
+        self.assertFalse(changelist.keyset)
+        self.assertIsNone(changelist.next_page_url)
+
+    def test_queries_do_not_grow_with_the_rows(self):
+        self.expense()
+        url = reverse('admin:expenses_expense_changelist')
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url, {'year': 2017})
+        queries = len(context)
+        elsewhere = Roommate.objects.create(household=Household.objects.create(name='otra'), user=self.other)
+        for month in range(2, 5):
+            self.expense(month=month, roommate=elsewhere, category=Category.objects.create(name='c{}'.format(month)))
+        self.client.get(url)
+        with self.assertNumQueries(queries):
+            self.client.get(url, {'year': 2017})
+
+    def test_year_and_month_filters(self):
+        self.expense(year=2016, month=5)
+        march = self.expense(year=2017, month=3)
+        changelist = self.changelist()
+        year_filter = changelist.filter_specs[1]
+        self.assertEqual([choice['display'] for choice in year_filter.choices(changelist)][1:], [2017, 2016])
+        self.assertEqual([expense.pk for expense in self.changelist(year=2017, month=3).result_list], [march.pk])
+
+    def test_large_tables_are_estimated(self):
+        self.expense()
+        with mock.patch('core.admin.estimate_count', return_value=10 ** 7):
+            changelist = self.changelist()
+        self.assertTrue(changelist.count_estimated)
+        self.assertEqual(changelist.result_count, 10 ** 7)
+        with mock.patch('core.admin.estimate_count', return_value=None):
+            self.assertEqual(self.changelist().result_count, 1)
+
+
+class ExpenseListTests(HouseholdFixture, APITestCase):
+
+    def list(self, **params):
+        accept = params.pop('accept', 'application/json')
+        params.setdefault('household', self.household.id)
+        response = self.client.get(reverse('api:expenses'), params, HTTP_ACCEPT=accept)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(response.content.decode())
+
+    def test_rows_match_the_serializer(self):
+        self.expense(description='luz')
+        self.expense(month=2, category=None, roommate=self.other_roommate)
+        expected = ExpenseSerializer(Expense.objects.order_by('-year', '-month', '-id'), many=True).data
+        self.assertEqual(self.list()['results'], json.loads(json.dumps(expected)))
+
+    def test_columnar(self):
+        first = self.expense()
+        second = self.expense(month=2, amount=20)
+        results = self.list(accept='application/vnd.paguenpo.columnar+json')['results']
+        self.assertEqual(results['id'], [second.id, first.id])
+        self.assertEqual(results['amount'], [20, 10])
+        self.assertEqual(results['roommate.user'], [self.user.id, self.user.id])
+
+    def test_sparse_fields(self):
+        expense = self.expense()
+        self.assertEqual(self.list(fields='id,amount')['results'], [{'id': expense.id, 'amount': 10}])
+        self.assertEqual(
+            self.list(fields='roommate', accept='application/vnd.paguenpo.columnar+json')['results'],
+            {'roommate.household': [self.household.id], 'roommate.user': [self.user.id]}
+        )
+
+    def test_unknown_fields(self):
+        response = self.client.get(reverse('api:expenses'), {'household': self.household.id, 'fields': 'id,secret'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('secret', response.data['fields'])
+
+
+class CatalogueTests(HouseholdFixture, APITestCase):
+
+    def setUp(self):
+        super(CatalogueTests, self).setUp()
+        categories._catalogues.clear()
+        categories.invalidate()
+
+    def test_lookups_make_no_queries_once_loaded(self):
+        catalogue = categories.get_catalogue()
+        with self.assertNumQueries(0):
+            self.assertIs(categories.get_catalogue(), catalogue)
+        self.assertEqual(catalogue.id_for('LUZ'), self.category.id)
+        self.assertEqual(catalogue.name_for(self.category.id), 'luz')
+        self.assertIsNone(catalogue.id_for('agua'))
+
+    def test_saved_categories_are_seen_at_once(self):
+        categories.get_catalogue()
+        agua = Category.objects.create(name='agua')
+        self.assertEqual(categories.get_catalogue().id_for('agua'), agua.id)
+        agua.delete()
+        self.assertIsNone(categories.get_catalogue().id_for('agua'))
+
+    @override_settings(CATEGORY_CATALOGUE_CHECK=60)
+    def test_changes_of_other_processes_are_seen_after_the_check_interval(self):
+        categories.get_catalogue()
+        # Changed elsewhere: the stamp moves, but this process was not told.
+        Category.objects.filter(pk=self.category.pk).update(name='electricidad')
+        bump_version(versions.CATEGORIES)
+        self.assertEqual(categories.get_catalogue().name_for(self.category.id), 'luz')
+        with override_settings(CATEGORY_CATALOGUE_CHECK=0):
+            self.assertEqual(categories.get_catalogue().name_for(self.category.id), 'electricidad')
+
+    @override_settings(CATEGORY_CATALOGUE_MAX_AGE=0)
+    def test_copies_expire(self):
+        categories.get_catalogue()
+        Category.objects.filter(pk=self.category.pk).update(name='electricidad')
+        time.sleep(0.01)
+        self.assertEqual(categories.get_catalogue().name_for(self.category.id), 'electricidad')
+
+    def test_list_matches_the_serializer(self):
+        Category.objects.create(name='agua')
+        response = self.client.get(reverse('api:categories'))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            json.loads(response.content.decode()),
+            json.loads(json.dumps(CategorySerializer(Category.objects.order_by('id'), many=True).data))
+        )
+        names = self.client.get(reverse('api:categories'), {'fields': 'name'}).data
+        self.assertEqual(names, [{'name': 'luz'}, {'name': 'agua'}])
+
+
+class ConditionalGetTests(HouseholdFixture, APITestCase):
+
+    def get(self, url, etag=None, **params):
+        headers = {'HTTP_IF_NONE_MATCH': etag} if etag else {}
+        return self.client.get(url, params, **headers)
+
+    def test_expenses_answer_304_until_they_change(self):
+        expense = self.expense()
+        url = reverse('api:expenses')
+        first = self.get(url, household=self.household.id)
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(self.get(url, first['ETag'], household=self.household.id).status_code, 304)
+        # Every page and representation has its own tag.
+        self.assertEqual(self.get(url, first['ETag'], household=self.household.id, page_size=1).status_code, 200)
+
+        time.sleep(0.01)
+        expense.amount = 20
+        expense.save()
+        changed = self.get(url, first['ETag'], household=self.household.id)
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], first['ETag'])
+
+    def test_households_of_other_users_do_not_matter(self):
+        url = reverse('api:expenses')
+        first = self.get(url, household=self.household.id)
+        time.sleep(0.01)
+        Expense.objects.create(
+            amount=5, year=2017, month=1,
+            roommate=Roommate.objects.create(household=Household.objects.create(name='otra'), user=self.other)
+        )
+        self.assertEqual(self.get(url, first['ETag'], household=self.household.id).status_code, 304)
+
+    def test_categories(self):
+        url = reverse('api:categories')
+        first = self.get(url)
+        self.assertEqual(self.get(url, first['ETag']).status_code, 304)
+        time.sleep(0.01)
+        Category.objects.create(name='agua')
+        self.assertEqual(self.get(url, first['ETag']).status_code, 200)
+
+
+class ImportTests(HouseholdFixture, APITestCase):
+
+    def ndjson(self, *rows):
+        return parse_ndjson([(json.dumps(row) + '\n').encode() for row in rows])
+
+    def row(self, **values):
+        row = {'amount': 10, 'year': 2017, 'month': 1, 'roommate': 'ana', 'category': 'luz'}
+        row.update(values)
+        return row
+
+    def test_errors_are_reported_by_line(self):
+        lines = [
+            b"amount,category,roommate,year,month\n",
+            b"10,luz,ana,2017,1\n",
+            b"-1,agua,nadie,2017,13\n",
+            b"5,,beto,2017,2\n",
+            b"\xff,luz,ana,2017,1\n",
+        ]
+        result = ExpenseImporter(self.household.id, chunk_size=2).run(parse_csv(lines))
+        self.assertEqual((result['created'], result['failed']), (2, 2))
+        self.assertEqual([error['line'] for error in result['errors']], [3, 5])
+        self.assertEqual(set(result['errors'][0]['errors']), {'amount', 'category', 'roommate', 'month'})
+        self.assertEqual(result['errors'][1]['errors'], {'row': "Not valid UTF-8."})
+        self.assertEqual(Expense.objects.filter(household=self.household).count(), 2)
+        self.assertEqual(MonthlyRollup.objects.get(year=2017, month=1).amount, 10)
+
+    def test_values_of_any_json_type_are_reported(self):
+        rows = self.ndjson(
+            self.row(status=['PAID']), self.row(status={'PAID': True}), self.row(amount=1.5),
+            self.row(month=True), self.row(status='PAID'),
+        )
+        result = ExpenseImporter(self.household.id).run(rows)
+        self.assertEqual((result['created'], result['failed']), (1, 4))
+        self.assertEqual(
+            [list(error['errors']) for error in result['errors']], [['status'], ['status'], ['amount'], ['month']]
+        )
+        self.assertEqual(Expense.objects.get().status, Expense.STATUS.PAID)
+
+    def test_out_of_range_integers_fail_their_row_only(self):
+        rows = self.ndjson(self.row(amount=2 ** 31), self.row(year='99999999999'), self.row(amount=2 ** 31 - 1))
+        result = ExpenseImporter(self.household.id).run(rows)
+        self.assertEqual((result['created'], result['failed']), (1, 2))
+        self.assertEqual([list(error['errors']) for error in result['errors']], [['amount'], ['year']])
+
+    def test_import_endpoint(self):
+        upload = SimpleUploadedFile('gastos.ndjson', b'{"amount": 10, "roommate": "beto", "year": 2017, "month": 3}\n')
+        response = self.client.post(reverse('api:expenses_import'), {'household': self.household.id, 'file': upload})
+        self.assertEqual(response.status_code, 201, response.data)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 0))
+        self.assertEqual(Expense.objects.get().roommate, self.other_roommate)
+
+
+class FeedTests(HouseholdFixture, APITransactionTestCase):
+    """Commits every change, so the events are published."""
+
+    def setUp(self):
+        super(FeedTests, self).setUp()
+        self.broker = events.InProcessBroker()
+        patcher = mock.patch('core.events._broker', self.broker)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def feed(self):
+        response = self.client.get(reverse('api:expense_feed'), {'household': self.household.id})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        self.addCleanup(response.close)
+        stream = iter(response.streaming_content)
+        self.assertEqual(next(stream), b'retry: 5000\n\n')
+        return response, stream
+
+    @override_settings(EVENTS_KEEPALIVE=0.01)
+    def test_events_of_committed_changes(self):
+        response, stream = self.feed()
+        self.assertEqual(next(stream), b': keepalive\n\n')
+        expense = self.expense(amount=25)
+        lines = next(stream).decode().splitlines()
+        self.assertEqual(lines[0], 'event: expense.created')
+        self.assertEqual(json.loads(lines[1][len('data: '):])['amount'], 25)
+
+        # Events of other households are not sent.
+        elsewhere = Roommate.objects.create(household=Household.objects.create(name='otra'), user=self.other)
+        self.expense(roommate=elsewhere)
+        expense_id = expense.id
+        expense.delete()
+        while True:
+            chunk = next(stream)
+            if not chunk.startswith(b':'):
+                break
+        self.assertEqual(chunk.decode(), 'event: expense.deleted\ndata: {{"id": {}}}\n\n'.format(expense_id))
+
+    def test_closing_the_stream_unsubscribes(self):
+        response, stream = self.feed()
+        self.assertEqual(list(self.broker._subscriptions), [events.household_channel(self.household.id)])
+        response.close()
+        self.assertEqual(dict(self.broker._subscriptions), {})
+
+    def test_only_roommates_follow_it(self):
+        self.client.force_login(User.objects.create_user('carla'))
+        response = self.client.get(reverse('api:expense_feed'), {'household': self.household.id})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(dict(self.broker._subscriptions), {})
+
+
+class ExportTests(HouseholdFixture, APITestCase):
+
+    def export(self, export_format='ndjson', **params):
+        params.setdefault('household', self.household.id)
+        response = self.client.get(reverse('api:expenses_export', kwargs={'export_format': export_format}), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_rows_match_the_api_newest_first(self):
+        old = self.expense(year=2017, month=1, description='luz')
+        new = self.expense(year=2017, month=2, roommate=self.other_roommate)
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [new.id, old.id])
+        listed = self.client.get(reverse('api:expenses'), {'household': self.household.id}).data['results']
+        for row, expense in zip(rows, listed):
+            self.assertEqual({name: row[name] for name in expense}, json.loads(json.dumps(expense)))
+
+    @mock.patch('expenses.exporting.CHUNK_ROWS', 2)
+    def test_interrupted_exports_resume_after_the_last_row(self):
+        ids = [self.expense(month=month).id for month in (1, 2, 3, 4, 5)]
+        rows = [json.loads(line) for line in self.export().splitlines()]
+        self.assertEqual([row['id'] for row in rows], ids[::-1])
+        rest = [json.loads(line) for line in self.export(cursor=rows[1]['cursor']).splitlines()]
+        self.assertEqual([row['id'] for row in rest], ids[2::-1])
+
+    def test_csv(self):
+        expense = self.expense(description='cuenta, "grande"')
+        lines = self.export('csv').splitlines()
+        self.assertEqual(lines[0], 'id,amount,description,category,roommate_household,roommate_user,year,month,cursor')
+        self.assertTrue(lines[1].startswith('{},10,"cuenta, ""grande""",{},{},{},2017,1,'.format(
+            expense.id, self.category.id, self.household.id, self.user.id
+        )))
+
+    def test_columns_are_checked_against_the_serializer(self):
+        self.assertEqual(checks.check_export_columns(None), [])
+        with mock.patch('expenses.checks.COLUMNS', exporting.COLUMNS[:-1]):
+            self.assertEqual([error.id for error in checks.check_export_columns(None)], ['expenses.E001'])
+
+    def test_only_roommates_export(self):
+        self.client.force_login(User.objects.create_user('carla'))
+        response = self.client.get(
+            reverse('api:expenses_export', kwargs={'export_format': 'csv'}), {'household': self.household.id}
+        )
+        self.assertEqual(response.status_code, 403)
+
+
+class BackgroundFileTests(HouseholdFixture, APITestCase):
+
+    def setUp(self):
+        super(BackgroundFileTests, self).setUp()
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        settings = override_settings(PRIVATE_MEDIA_ROOT=directory, PRIVATE_MEDIA_ACCEL_REDIRECT=None)
+        settings.enable()
+        self.addCleanup(settings.disable)
+
+    def run_tasks(self):
+        call_command('run_tasks', '--burst', stdout=StringIO())
+
+    def export(self):
+        self.expense(description='cuenta de la luz')
+        response = self.client.get(
+            reverse('api:expenses_export', kwargs={'export_format': 'csv'}),
+            {'household': self.household.id, 'background': '1'}
+        )
+        self.assertEqual(response.status_code, 202)
+        self.run_tasks()
+        return self.client.get(response['Location']).data
+
+    def test_exports_are_downloaded_by_roommates_only(self):
+        task = self.export()
+        self.assertEqual(task['status'], 'SUCCEEDED')
+        # Named after a random uuid, outside MEDIA_ROOT.
+        self.assertRegex(task['result']['file'], r'^exports/[0-9a-f]{32}\.csv$')
+        self.assertTrue(files.storage().exists(task['result']['file']))
+        response = self.client.get(task['download'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'cuenta de la luz', b''.join(response.streaming_content))
+        self.assertIn('attachment', response['Content-Disposition'])
+
+        self.client.force_login(User.objects.create_user('carla'))
+        self.assertEqual(self.client.get(task['download']).status_code, 404)
+
+    def test_exports_expire(self):
+        task = self.export()
+        Task.objects.filter(uuid=task['id']).update(finished=timezone.now() - timedelta(days=2))
+        self.assertEqual(self.client.get(task['download']).status_code, 404)
+        os.utime(
+            files.storage().path(task['result']['file']),
+            (time.time() - 2 * 24 * 60 * 60,) * 2
+        )
+        self.assertEqual(files.prune(), 1)
+        self.assertFalse(files.storage().exists(task['result']['file']))
+
+    def test_accel_redirect(self):
+        task = self.export()
+        with override_settings(PRIVATE_MEDIA_ACCEL_REDIRECT='/private/'):
+            response = self.client.get(task['download'])
+        self.assertEqual(response['X-Accel-Redirect'], '/private/' + task['result']['file'])
+        self.assertEqual(response.content, b'')
+
+    def test_uploads_are_deleted_even_if_the_import_fails(self):
+        upload = SimpleUploadedFile('gastos.csv', b"amount,category,roommate,year,month\n10,luz,ana,2017,1\n")
+        response = self.client.post(reverse('api:expenses_import'), {
+            'household': self.household.id, 'file': upload, 'background': '1'
+        })
+        self.assertEqual(response.status_code, 202)
+        path = json.loads(Task.objects.get(name='expenses.import').arguments)['path']
+        self.assertRegex(path, r'^imports/[0-9a-f]{32}\.csv$')
+        self.assertFalse(files.storage().path(path).startswith(settings.MEDIA_ROOT))
+        with mock.patch('expenses.tasks.ExpenseImporter.run', side_effect=RuntimeError("Failed on purpose.")), \
+                self.assertLogs('core.tasks', 'ERROR'):
+            self.run_tasks()
+        self.assertEqual(files.storage().listdir('imports'), ([], []))
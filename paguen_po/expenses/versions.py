@@ -0,0 +1,9 @@
+# -*- coding: utf-8 -*-
+"""Version scopes of the expenses resources (see core.conditional)."""
+
+CATEGORIES = 'categories'
+
+
+def household_expenses(household_id):
+    """Scope of the expenses of a Household."""
+    return 'expenses:{}'.format(household_id)
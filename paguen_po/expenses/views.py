@@ -1,30 +1,342 @@
 # -*- coding: utf-8 -*-
-from rest_framework import generics, permissions
+import json
+from collections import OrderedDict
 
+from django.conf import settings
+from django.db import connections, transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404
+from rest_framework import generics, permissions, status
+from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
+from rest_framework.renderers import BrowsableAPIRenderer, JSONRenderer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from core import files, tasks
+from core.conditional import ConditionalGetMixin
+from core.db import ReplicaReadsMixin
+from core.events import get_broker, household_channel
+from core.renderers import ColumnarJSONRenderer, EventStreamRenderer, FastJSONRenderer, Rows
+from core.serializers import requested_fields
+from core.views import task_response
 from households.models import Roommate
+from households.permissions import HouseholdMixin, IsHouseholdMember
 
+from . import bulk, categories, changes, exporting, search, shares, versions
+from .importing import ExpenseImporter, PARSERS, guess_format
 from .models import Category, Expense
-from .serializers import CategorySerializer, ExpenseSerializer
+from .pagination import KeysetPagination, seek
+from .serializers import CategorySerializer, ExpenseSerializer, SettleSerializer, SplitSerializer
+
+
+def household_expenses(household_id):
+    """Returns the expenses of a Household, loading just what ExpenseSerializer needs.
 
+    The roommate is joined in the same query and only the serialized columns are loaded, so
+    serializing any number of them costs a single query.
+    """
+    return Expense.objects.filter(
+        household_id=household_id
+    ).select_related(
+        'roommate'
+    ).only(
+        'id', 'amount', 'description', 'category', 'year', 'month', 'roommate__household', 'roommate__user'
+    )
 
-class CategoryList(generics.ListCreateAPIView):
-    """Lists all Categories or creates a new one."""
+
+class CategoryList(ReplicaReadsMixin, ConditionalGetMixin, generics.ListCreateAPIView):
+    """Lists all Categories or creates a new one.
+
+    The list is served from the category catalogue, as JSON rendered once per version.
+    """
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = (permissions.IsAuthenticated,)
 
+    def get_version_scope(self):
+        return versions.CATEGORIES
+
+    def list(self, request, *args, **kwargs):
+        catalogue = categories.get_catalogue()
+        fields = requested_fields(request, CategorySerializer.Meta.fields)
+        if fields is not None:
+            return Response([OrderedDict((name, item[name]) for name in fields) for item in catalogue.data])
+        if isinstance(request.accepted_renderer, JSONRenderer):
+            return HttpResponse(catalogue.json, content_type=request.accepted_renderer.media_type)
+        return Response(catalogue.data)
 
-class ExpensesList(generics.ListAPIView):
-    """Lists all expenses for a given Household"""
+
+class ExpensesList(HouseholdMixin, ReplicaReadsMixin, ConditionalGetMixin, generics.ListAPIView):
+    """Lists all expenses for a given Household, newest first, one page at a time.
+
+    JSON responses are built from values_list tuples instead of going through ExpenseSerializer,
+    with the same shape. Ask for `application/vnd.paguenpo.columnar+json` to get each field as an
+    array instead. The browsable API still renders the serializer's output. Pass `fields` to only
+    get some of them, e.g. `fields=id,amount`.
+    """
     serializer_class = ExpenseSerializer
-    permission_classes = (permissions.IsAuthenticated,)
+    permission_classes = (IsHouseholdMember,)
+    pagination_class = KeysetPagination
+    renderer_classes = (FastJSONRenderer, ColumnarJSONRenderer, BrowsableAPIRenderer)
+
+    def get_version_scope(self):
+        return versions.household_expenses(self.get_household_id())
 
     def get_queryset(self):
         """This view should return a list of all the expense for the currently authenticated user's
         household.
         """
-        household = self.request.query_params.get('household', None)
-        if household is not None and Roommate.objects.filter(
-                user=self.request.user, household_id=household).exists():
-            return Expense.objects.filter(roommate__household_id=household)
-        return Expense.objects.none()
+        return household_expenses(self.get_household_id())
+
+    def list(self, request, *args, **kwargs):
+        if not isinstance(request.accepted_renderer, FastJSONRenderer):
+            return super(ExpensesList, self).list(request, *args, **kwargs)
+        names, columns = exporting.columns_for(requested_fields(request, ExpenseSerializer.Meta.fields))
+        rows = self.paginator.paginate_values(self.get_queryset(), request, columns)
+        return self.get_paginated_response(Rows(names, rows))
+
+
+class ExpenseSearch(HouseholdMixin, APIView):
+    """Searches the expenses of a Household, newest first, and counts them per category, roommate
+    and month.
+
+    Accepts `q` (words of the description), `category` (an id or name), `roommate` (an id or
+    username), `min_amount` and `max_amount`, and `since` and `until` (inclusive months as
+    YYYY-MM). Results are paginated like the expense list, and take `fields` like it; the facets
+    cover every match and are only computed for the first page.
+    """
+    permission_classes = (IsHouseholdMember,)
+    renderer_classes = (FastJSONRenderer, BrowsableAPIRenderer)
+
+    def get(self, request):
+        params = request.query_params
+        expenses = search.filter_expenses(
+            Expense.objects.filter(household_id=self.get_household_id()),
+            text=params.get('q', '').strip(),
+            category=params.get('category') or None,
+            roommate=params.get('roommate') or None,
+            amount_range=(self._get_int_param('min_amount'), self._get_int_param('max_amount')),
+            since=self._get_month_param('since'),
+            until=self._get_month_param('until'),
+        )
+        names, columns = exporting.columns_for(requested_fields(request, ExpenseSerializer.Meta.fields))
+        paginator = KeysetPagination()
+        rows = paginator.paginate_values(expenses, request, columns)
+        return Response(OrderedDict([
+            ('next', paginator.get_next_link()),
+            ('facets', None if params.get(paginator.cursor_query_param) else search.facets(expenses)),
+            ('results', Rows(names, rows)),
+        ]))
+
+    def _get_int_param(self, name):
+        value = self.request.query_params.get(name)
+        try:
+            return int(value) if value else None
+        except ValueError:
+            raise ValidationError({name: "A valid integer is required."})
+
+    def _get_month_param(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            year, month = (int(part) for part in value.split('-'))
+        except ValueError:
+            raise ValidationError({name: "A month as YYYY-MM is required."})
+        if not 1 <= month <= 12:
+            raise ValidationError({name: "A month as YYYY-MM is required."})
+        return year, month
+
+
+class ExpenseChanges(HouseholdMixin, APIView):
+    """Returns the expenses of a Household saved or deleted after a sync watermark.
+
+    Pass the `next` value of the previous response as `since`, and keep asking while `more` is
+    true. Without `since` only the current watermark is returned: read it before fetching the
+    full list, then sync from it. When `reset` is true the changes after `since` were pruned:
+    fetch the full list again and sync from `next`. The upserted expenses take `fields` like the
+    expense list.
+    """
+    permission_classes = (IsHouseholdMember,)
+    limit = 1000
+
+    def get(self, request):
+        household = self.get_household_id()
+        since = request.query_params.get('since')
+        if since is not None:
+            try:
+                watermark = changes.Watermark.parse(since)
+            except ValueError:
+                raise ValidationError({'since': "A valid watermark is required."})
+        if since is None or changes.expired(household, watermark):
+            return Response(OrderedDict([
+                ('next', str(changes.latest_watermark(household))),
+                ('more', False),
+                ('reset', since is not None),
+                ('upserts', []),
+                ('deletes', [])
+            ]))
+
+        kinds, watermark, more = changes.changes_since(household, watermark, self.limit)
+        # The expenses as they are now settle what happened to each: changes of one expense made by
+        # overlapping transactions need not be in the order they committed.
+        expenses = household_expenses(household).filter(id__in=list(kinds)) if kinds else []
+        found = {expense.id for expense in expenses}
+        return Response(OrderedDict([
+            ('next', str(watermark)),
+            ('more', more),
+            ('reset', False),
+            ('upserts', ExpenseSerializer(expenses, many=True, context={'request': request}).data),
+            # Expenses saved and then deleted or moved away count as deleted.
+            ('deletes', [expense_id for expense_id in kinds if expense_id not in found])
+        ]))
+
+
+class ExpenseFeed(HouseholdMixin, APIView):
+    """Streams the expense events of a Household as Server-Sent Events.
+
+    Events are pushed as their transactions commit. A comment is sent every EVENTS_KEEPALIVE
+    seconds so proxies keep idle connections open. Clients that reconnect can catch up with
+    /api/gastos/changes/.
+
+    The stream reads nothing from the database, so the connections of the request are closed
+    before it starts: persistent connections (CONN_MAX_AGE) would otherwise stay held for as
+    long as the client listens.
+    """
+    permission_classes = (IsHouseholdMember,)
+    renderer_classes = (EventStreamRenderer,)
+
+    def get(self, request):
+        subscription = get_broker().subscribe(household_channel(self.get_household_id()))
+        for connection in connections.all():
+            if not connection.in_atomic_block:
+                connection.close()
+        response = StreamingHttpResponse(self.stream(subscription), content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        # Stop nginx from buffering the stream.
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    def stream(self, subscription):
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                message = subscription.get(timeout=settings.EVENTS_KEEPALIVE)
+                if message is None:
+                    yield ': keepalive\n\n'
+                    continue
+                event = json.loads(message)
+                yield 'event: {}\ndata: {}\n\n'.format(event['event'], json.dumps(event['data']))
+        finally:
+            subscription.close()
+
+
+class ExpenseExport(HouseholdMixin, APIView):
+    """Streams all the expenses of a Household as CSV or NDJSON, newest first.
+
+    Every row ends with a cursor; passing the last one received as the `cursor` query parameter
+    resumes an interrupted export right after that row. With `background=1` the file is written
+    by a background task instead, whose result has its URL.
+    """
+    permission_classes = (IsHouseholdMember,)
+
+    def get(self, request, export_format):
+        household = self.get_household_id()
+        if request.query_params.get('background'):
+            return task_response(tasks.enqueue(
+                'expenses.export', household, request.user, export_format=export_format
+            ))
+        queryset = Expense.objects.filter(household_id=household)
+        token = request.query_params.get('cursor')
+        if token:
+            queryset = seek(queryset, token, exporting.ORDERING)
+
+        writer, content_type = exporting.WRITERS[export_format]
+        response = StreamingHttpResponse(writer(exporting.export_rows(queryset)), content_type=content_type)
+        response['Content-Disposition'] = 'attachment; filename="gastos-{}.{}"'.format(household, export_format)
+        return response
+
+
+class ExpenseImport(HouseholdMixin, APIView):
+    """Imports expenses into a Household from an uploaded CSV or NDJSON file.
+
+    Expects a multipart request with the `household` id and the `file`. The format is taken from
+    the `format` field or, failing that, from the file extension. With `background=1` the file
+    is imported by a background task instead, whose result is the same.
+    """
+    permission_classes = (IsHouseholdMember,)
+    parser_classes = (MultiPartParser,)
+
+    def post(self, request):
+        household = self.get_household_id()
+        upload = request.data.get('file')
+        if upload is None:
+            raise ValidationError({'file': "No file was submitted."})
+        import_format = request.data.get('format') or guess_format(upload.name)
+        if import_format not in PARSERS:
+            raise ValidationError({'format': "Must be one of: {}.".format(", ".join(PARSERS))})
+
+        if request.data.get('background'):
+            path = files.save('imports', import_format, upload)
+            return task_response(tasks.enqueue(
+                'expenses.import', household, request.user, path=path, import_format=import_format
+            ))
+        result = ExpenseImporter(household).run(PARSERS[import_format](upload))
+        return Response(result, status=status.HTTP_201_CREATED if result['created'] else status.HTTP_200_OK)
+
+
+class ExpenseSettle(HouseholdMixin, APIView):
+    """Moves the matching expenses of a Household to a status, PAID by default, in one UPDATE.
+
+    Expects the `household` id and optionally the `year`, `month`, `roommate` and expense `ids`
+    to match (see SettleSerializer). Returns how many expenses changed status.
+    """
+    permission_classes = (IsHouseholdMember,)
+    # Lookup of each optional filter of SettleSerializer.
+    LOOKUPS = (('year', 'year'), ('month', 'month'), ('roommate', 'roommate_id'), ('ids', 'id__in'))
+
+    def post(self, request):
+        serializer = SettleSerializer(data=request.data)
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        lookups = {'household_id': self.get_household_id()}
+        for field, lookup in self.LOOKUPS:
+            if field in data:
+                lookups[lookup] = data[field]
+        updated = bulk.bulk_set_status(Expense.objects.filter(**lookups), data['status'])
+        return Response(OrderedDict([('status', data['status']), ('updated', updated)]))
+
+
+class ExpenseSplit(HouseholdMixin, APIView):
+    """Sets how an expense of a Household is split between its roommates.
+
+    Expects the `household` id, the `split` rule and, unless it is EQUAL, the `weights` of the
+    roommates (see SplitSerializer). Percentages must add up to 100 and fixed amounts to the
+    amount of the expense. Returns the rule and the resulting shares.
+    """
+    permission_classes = (IsHouseholdMember,)
+
+    def post(self, request, pk):
+        household = self.get_household_id()
+        roommates = set(Roommate.objects.filter(household_id=household).values_list('id', flat=True))
+        serializer = SplitSerializer(data=request.data, context={'roommates': roommates})
+        serializer.is_valid(raise_exception=True)
+        data = serializer.validated_data
+        with transaction.atomic():
+            expense = get_object_or_404(Expense.objects.select_for_update(), household_id=household, pk=pk)
+            try:
+                shares.set_split(expense, data['split'], data['weights'])
+            except ValueError as error:
+                raise ValidationError({'weights': str(error)})
+            expense.save()
+        return Response(OrderedDict([
+            ('id', expense.pk),
+            ('split', expense.split),
+            ('shares', [
+                OrderedDict([('roommate', roommate_id), ('weight', weight), ('amount', amount)])
+                for roommate_id, weight, amount in expense.shares.order_by('roommate_id').values_list(
+                    'roommate_id', 'weight', 'amount'
+                )
+            ])
+        ]))
@@ -1,16 +1,30 @@
 from django.contrib import admin
 
+from core.admin import ScalableAdminMixin
+
 from .models import Household, Roommate
 
 
 class HouseholdRoommateInline(admin.TabularInline):
     model = Household.users.through
     extra = 0
+    raw_id_fields = ('user',)
 
 
 class HouseholdAdmin(admin.ModelAdmin):
     inlines = (HouseholdRoommateInline,)
+    search_fields = ('name',)
+
+
+class RoommateAdmin(ScalableAdminMixin, admin.ModelAdmin):
+    # Roommate.__str__ shows the household and the user.
+    list_select_related = ('household', 'user')
+    raw_id_fields = ('household', 'user')
+
+    def get_readonly_fields(self, request, obj=None):
+        # See Roommate: the household is set once.
+        return ('household',) if obj is not None else ()
 
 
 admin.site.register(Household, HouseholdAdmin)
-admin.site.register(Roommate)
+admin.site.register(Roommate, RoommateAdmin)
@@ -3,3 +3,6 @@ from django.apps import AppConfig
 
 class HouseholdsConfig(AppConfig):
     name = 'households'
+
+    def ready(self):
+        from . import signals  # noqa
@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from households import purge
+
+
+class Command(BaseCommand):
+    help = ("Deletes for good the households removed long ago, with all their rows, and the removed roommates "
+            "nothing refers to anymore.")
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.HOUSEHOLDS_PURGE_AFTER_DAYS,
+            help="Only purge what was removed more than this many days ago."
+        )
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows deleted per transaction.")
+
+    def handle(self, *args, **options):
+        deleted = purge.purge(options['days'], options['batch_size'])
+        for name, count in deleted.items():
+            if count:
+                self.stdout.write("{}: {} deleted".format(name, count))
+        self.stdout.write(self.style.SUCCESS("{} rows purged.".format(sum(deleted.values()))))
@@ -0,0 +1,45 @@
+# -*- coding: utf-8 -*-
+"""Cache of the households each user belongs to.
+
+Authorization checks run on every API request, so the set of household ids of a user is kept in
+the cache configured by MEMBERSHIP_CACHE and dropped whenever one of their roommates or
+households changes (see households.signals).
+"""
+from django.conf import settings
+from django.core.cache import caches
+
+from .models import Household
+
+
+def _cache():
+    return caches[settings.MEMBERSHIP_CACHE]
+
+
+def _cache_key(user_id):
+    return 'households:membership:{}'.format(user_id)
+
+
+def household_ids(user_id):
+    """Returns the ids of the active households where the user is an active roommate."""
+    cache = _cache()
+    key = _cache_key(user_id)
+    ids = cache.get(key)
+    if ids is None:
+        ids = frozenset(Household.objects.of_user(user_id).values_list('id', flat=True))
+        cache.set(key, ids, settings.MEMBERSHIP_CACHE_TIMEOUT)
+    return ids
+
+
+def is_member(user_id, household_id):
+    """Returns True if the user is an active roommate of the household."""
+    return household_id in household_ids(user_id)
+
+
+def version_scope(user_id):
+    """Version scope of the households of a user (see core.conditional)."""
+    return 'households:{}'.format(user_id)
+
+
+def invalidate(user_ids):
+    """Drops the cached households of the given users."""
+    _cache().delete_many([_cache_key(user_id) for user_id in user_ids])
@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.5 on 2026-10-18 12:08
+from __future__ import unicode_literals
+
+from django.db import migrations
+import django.utils.timezone
+import model_utils.fields
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('households', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='household',
+            name='created',
+            field=model_utils.fields.AutoCreatedField(default=django.utils.timezone.now, editable=False, verbose_name='created'),
+        ),
+        migrations.AddField(
+            model_name='household',
+            name='modified',
+            field=model_utils.fields.AutoLastModifiedField(default=django.utils.timezone.now, editable=False, verbose_name='modified'),
+        ),
+        # Partial indexes of the active roommates, for the membership lookups and the roommates of a
+        # household. Django 1.11 indexes cannot have a condition, hence the raw SQL.
+        migrations.RunSQL(
+            ["CREATE INDEX roommate_active_user_idx ON households_roommate (user_id, household_id) "
+             "WHERE NOT is_removed"],
+            ["DROP INDEX roommate_active_user_idx"],
+        ),
+        migrations.RunSQL(
+            ["CREATE INDEX roommate_active_household_idx ON households_roommate (household_id) WHERE NOT is_removed"],
+            ["DROP INDEX roommate_active_household_idx"],
+        ),
+    ]
@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_removed_at(apps, schema_editor):
+    """Takes the last change of the rows removed so far as the time they were removed."""
+    for name in ('Household', 'Roommate'):
+        apps.get_model('households', name).objects.filter(is_removed=True).update(removed_at=F('modified'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('households', '0002_active_roommates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='household',
+            name='removed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='eliminado'),
+        ),
+        migrations.AddField(
+            model_name='roommate',
+            name='removed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True, verbose_name='eliminado'),
+        ),
+        migrations.RunPython(backfill_removed_at, migrations.RunPython.noop),
+    ]
@@ -1,23 +1,117 @@
 # -*- coding: utf-8 -*-
 from django.conf import settings
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.utils import timezone
 
+from model_utils.managers import SoftDeletableManagerMixin, SoftDeletableQuerySet
 from model_utils.models import SoftDeletableModel, TimeStampedModel
 
 
-class Household(SoftDeletableModel):
-    """A Households that contains Users and Expenses."""
+class RemovableQuerySet(SoftDeletableQuerySet):
+    """Soft deletes its rows one at a time, so the signals that keep the membership cache and the
+    version stamps in sync (see households.signals) run for each of them.
+    """
+
+    def delete(self):
+        """Returns (count, {model label: count}), as QuerySet.delete does."""
+        count = 0
+        for instance in self:
+            instance.delete()
+            count += 1
+        return count, {self.model._meta.label: count}
+
+
+class HouseholdQuerySet(RemovableQuerySet):
+
+    def of_user(self, user_id):
+        """Returns the households where the user is an active roommate.
+
+        Use it instead of `user.household_set`: the many-to-many relation also follows the
+        roommates that were removed.
+        """
+        return self.filter(roommate__user_id=user_id, roommate__is_removed=False)
+
+
+class ActiveManager(SoftDeletableManagerMixin, models.Manager):
+    """Default manager of removable models: leaves out the removed rows.
+
+    Reverse relations (e.g. `household.roommate_set`) use it too. Use `all_objects` to reach the
+    removed rows.
+    """
+
+
+class RemovableModel(SoftDeletableModel):
+    """A soft deletable model that records when it was removed.
+
+    `removed_at` follows `is_removed` on every save, whether the row is removed by delete() or in
+    the admin, so purges can tell how long ago it was removed. `modified` cannot: any later save
+    of the removed row moves it.
+    """
+    removed_at = models.DateTimeField("eliminado", null=True, blank=True, editable=False)
+
+    class Meta:
+        abstract = True
+
+    def save(self, *args, **kwargs):
+        if self.is_removed != (self.removed_at is not None):
+            self.removed_at = timezone.now() if self.is_removed else None
+            if kwargs.get('update_fields') is not None:
+                kwargs['update_fields'] = set(kwargs['update_fields']) | {'removed_at'}
+        super(RemovableModel, self).save(*args, **kwargs)
+
+    def delete(self, using=None, soft=True, *args, **kwargs):
+        """Returns (count, {model label: count}) on soft deletes too, as Model.delete does."""
+        deleted = super(RemovableModel, self).delete(using, soft, *args, **kwargs)
+        return deleted if not soft else (1, {self._meta.label: 1})
+
+
+class Household(RemovableModel, TimeStampedModel):
+    """A Households that contains Users and Expenses.
+
+    Removed households are purged for good by the purge_removed command.
+    """
     name = models.CharField("alias", max_length=100)
+    # Follows removed roommates too: see HouseholdQuerySet.of_user.
     users = models.ManyToManyField(settings.AUTH_USER_MODEL, blank=True, through="Roommate")
 
+    objects = ActiveManager.from_queryset(HouseholdQuerySet)()
+    all_objects = models.Manager()
+
     def __str__(self):
         return "{}".format(self.name)
 
 
-class Roommate(SoftDeletableModel, TimeStampedModel):
-    """A user in a Household."""
+class Roommate(RemovableModel, TimeStampedModel):
+    """A user in a Household.
+
+    The household of a roommate cannot change: its expenses, shares and rollups belong to it. A
+    user who moves gets a new roommate in the other household.
+    """
     household = models.ForeignKey("Household", on_delete=models.CASCADE)
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
 
+    objects = ActiveManager.from_queryset(RemovableQuerySet)()
+    all_objects = models.Manager()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super(Roommate, cls).from_db(db, field_names, values)
+        instance._loaded_household_id = dict(zip(field_names, values)).get('household_id')
+        return instance
+
+    def household_changed(self):
+        loaded = getattr(self, '_loaded_household_id', None)
+        return loaded is not None and loaded != self.household_id
+
+    def clean(self):
+        if self.household_changed():
+            raise ValidationError({'household': "A roommate cannot move to another household."})
+
+    def save(self, *args, **kwargs):
+        if self.household_changed():
+            raise ValueError("A roommate cannot move to another household; add a new roommate there instead.")
+        super(Roommate, self).save(*args, **kwargs)
+
     def __str__(self):
         return "{} - {}".format(self.household.name, self.user.username)
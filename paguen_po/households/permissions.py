@@ -0,0 +1,40 @@
+# -*- coding: utf-8 -*-
+from rest_framework import permissions
+
+from . import membership
+
+
+class HouseholdMixin(object):
+    """Reads the id of the Household a request is about.
+
+    The id is taken from the `household_url_kwarg` URL argument when the view sets one, and from
+    the `household` query parameter or request field otherwise.
+    """
+    household_url_kwarg = None
+
+    def get_household_id(self):
+        """Returns the id of the requested Household as an int, or None if it is missing or invalid."""
+        if self.household_url_kwarg is not None:
+            household = self.kwargs.get(self.household_url_kwarg)
+        else:
+            household = self.request.query_params.get('household')
+            if household is None:
+                household = self.request.data.get('household')
+        try:
+            return int(household)
+        except (TypeError, ValueError):
+            return None
+
+
+class IsHouseholdMember(permissions.IsAuthenticated):
+    """Allows access only to the roommates of the Household the request is about.
+
+    The view must provide get_household_id() (see HouseholdMixin). Membership is read from the
+    membership cache, so the check costs no queries once the cache is warm.
+    """
+
+    def has_permission(self, request, view):
+        if not super(IsHouseholdMember, self).has_permission(request, view):
+            return False
+        household_id = view.get_household_id()
+        return household_id is not None and membership.is_member(request.user.pk, household_id)
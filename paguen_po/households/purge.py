@@ -0,0 +1,87 @@
+# -*- coding: utf-8 -*-
+"""Hard deletion of the households and roommates removed long ago.
+
+Removing a household or a roommate only flags it, so its rows stay in the hot tables. Once it has
+been removed for HOUSEHOLDS_PURGE_AFTER_DAYS (going by its `removed_at` time), purge() deletes it
+for good, in batches that each commit on their own so no lock is held for long.
+
+A removed household goes away with everything it owns. A removed roommate of an active household
+is kept while anything still refers to it: its expenses are part of the household's history.
+"""
+from collections import OrderedDict
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils import timezone
+
+from core.models import Task
+from expenses.models import Expense, ExpenseChange, ExpenseShare, MonthlyRollup, RecurringExpense, SyncHorizon
+
+from .models import Household, Roommate
+
+
+def delete_in_batches(queryset, batch_size, raw=False):
+    """Deletes the rows of `queryset`, `batch_size` at a time. Returns how many were deleted.
+
+    With `raw` each batch is a plain DELETE that skips signals and cascades, for rows that nothing
+    refers to anymore and whose signals would only do useless work.
+    """
+    model = queryset.model
+    deleted = 0
+    while True:
+        ids = list(queryset.values_list('pk', flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            batch = model._base_manager.filter(pk__in=ids)
+            if raw:
+                batch._raw_delete(batch.db)
+            else:
+                batch.delete()
+        deleted += len(ids)
+
+
+def removed_households(cutoff):
+    """Returns the households removed before `cutoff` that no background task is working on."""
+    return Household.all_objects.filter(is_removed=True, removed_at__lt=cutoff).exclude(
+        id__in=Task.objects.filter(status=Task.STATUS.RUNNING, household__isnull=False).values('household_id')
+    )
+
+
+def removed_roommates(cutoff):
+    """Returns the roommates of active households removed before `cutoff` that nothing refers to."""
+    references = [
+        model.objects.filter(roommate_id=OuterRef('pk'))
+        for model in (Expense, ExpenseShare, MonthlyRollup, RecurringExpense)
+    ]
+    return Roommate.all_objects.filter(
+        is_removed=True, removed_at__lt=cutoff, household__is_removed=False
+    ).annotate(
+        **{'referenced_{}'.format(number): Exists(reference) for number, reference in enumerate(references)}
+    ).filter(
+        **{'referenced_{}'.format(number): False for number in range(len(references))}
+    )
+
+
+def purge(days=None, batch_size=1000):
+    """Deletes the households and roommates removed more than `days` days ago
+    (HOUSEHOLDS_PURGE_AFTER_DAYS by default).
+
+    The rows of each household are deleted table by table, children first. Returns how many
+    rows were deleted, by model name.
+    """
+    cutoff = timezone.now() - timedelta(days=settings.HOUSEHOLDS_PURGE_AFTER_DAYS if days is None else days)
+    household_ids = list(removed_households(cutoff).values_list('id', flat=True))
+    deleted = OrderedDict()
+    for model, raw in ((ExpenseShare, False), (MonthlyRollup, False), (ExpenseChange, False), (SyncHorizon, False),
+                       (Expense, True), (RecurringExpense, False), (Task, False), (Roommate, False),
+                       (Household, False)):
+        if model is Household:
+            queryset = Household.all_objects.filter(id__in=household_ids)
+        else:
+            queryset = model._base_manager.filter(household_id__in=household_ids)
+        deleted[model.__name__] = delete_in_batches(queryset, batch_size, raw)
+    deleted[Roommate.__name__] += delete_in_batches(removed_roommates(cutoff), batch_size)
+    return deleted
@@ -1,9 +1,11 @@
 # -*- coding: utf-8 -*-
 from rest_framework import serializers
+
+from core.serializers import SparseFieldsetMixin
 from .models import Household, Roommate
 
 
-class HouseholdSerializer(serializers.ModelSerializer):
+class HouseholdSerializer(SparseFieldsetMixin, serializers.ModelSerializer):
     class Meta:
         model = Household
         fields = ('id', 'name')
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from core import tasks
+from core.conditional import bump_version, now_and_on_commit
+
+from . import membership
+from .models import Household, Roommate
+
+
+@receiver(post_save, sender=Roommate)
+@receiver(post_delete, sender=Roommate)
+def invalidate_roommate_membership(sender, instance, **kwargs):
+    """A roommate was added, changed or removed: its user's households changed."""
+    now_and_on_commit(lambda: membership.invalidate([instance.user_id]))
+    bump_version(membership.version_scope(instance.user_id))
+
+
+@receiver(post_save, sender=Household)
+@receiver(post_delete, sender=Household)
+def invalidate_household_membership(sender, instance, created=False, **kwargs):
+    """A household was changed, removed or restored: the households of all its users changed."""
+    if not created:
+        user_ids = list(Roommate.all_objects.filter(household_id=instance.pk).values_list('user_id', flat=True))
+        now_and_on_commit(lambda: membership.invalidate(user_ids))
+        bump_version(*(membership.version_scope(user_id) for user_id in user_ids))
+
+
+@receiver(post_save, sender=Roommate)
+def split_household_expenses(sender, instance, created=False, raw=False, **kwargs):
+    """A roommate joined or left: split the household's equally split expenses from that month on
+    again. Earlier expenses stay split between the roommates of the household at the time.
+    """
+    if raw or not (created or instance.is_removed):
+        return
+    today = timezone.localdate()
+    tasks.enqueue('expenses.recompute_shares', instance.household_id, since=[today.year, today.month])
@@ -1,3 +1,194 @@
+# -*- coding: utf-8 -*-
+from datetime import timedelta
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
 from django.test import TestCase
+from django.utils import timezone
+
+from core import tasks
+from core.models import Task
+from expenses.models import Category, Expense, ExpenseChange, ExpenseShare, MonthlyRollup
+
+from . import membership, purge
+from .models import Household, Roommate
+
+
+class HouseholdTestCase(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user('ana')
+        self.other = User.objects.create_user('beto')
+        self.household = Household.objects.create(name='casa')
+        self.roommate = Roommate.objects.create(household=self.household, user=self.user)
+        self.other_roommate = Roommate.objects.create(household=self.household, user=self.other)
+
+    def age(self, model, *pks):
+        """Removes the rows with the given ids 100 days ago."""
+        model.all_objects.filter(pk__in=pks).update(removed_at=timezone.now() - timedelta(days=100))
+
+
+class RemovalTests(HouseholdTestCase):
+
+    def test_delete_returns_counts(self):
+        self.assertEqual(self.roommate.delete(), (1, {'households.Roommate': 1}))
+        self.assertEqual(Household.objects.filter(pk=self.household.pk).delete(), (1, {'households.Household': 1}))
+        self.assertEqual(Household.objects.filter(pk=self.household.pk).delete(), (0, {'households.Household': 0}))
+
+    def test_removed_at_follows_is_removed(self):
+        self.household.delete()
+        removed_at = Household.all_objects.get(pk=self.household.pk).removed_at
+        self.assertIsNotNone(removed_at)
+        # Later saves keep the time it was removed.
+        household = Household.all_objects.get(pk=self.household.pk)
+        household.name = 'otra'
+        household.save()
+        self.assertEqual(Household.all_objects.get(pk=self.household.pk).removed_at, removed_at)
+        household.is_removed = False
+        household.save(update_fields=['is_removed'])
+        self.assertIsNone(Household.objects.get(pk=self.household.pk).removed_at)
+
+    def test_removed_rows_are_left_out(self):
+        elsewhere = Household.objects.create(name='otra')
+        roommate = Roommate.objects.create(household=elsewhere, user=self.user)
+        self.assertEqual(set(membership.household_ids(self.user.pk)), {self.household.pk, elsewhere.pk})
+        Roommate.objects.filter(pk=roommate.pk).delete()
+        self.assertEqual(set(membership.household_ids(self.user.pk)), {self.household.pk})
+        self.assertEqual(list(Household.objects.of_user(self.user.pk)), [self.household])
+        self.assertEqual(Roommate.all_objects.count(), 3)
+        self.household.delete()
+        self.assertEqual(list(membership.household_ids(self.user.pk)), [])
+        self.assertFalse(Household.objects.filter(pk=self.household.pk).exists())
+
+    def test_roommates_cannot_move(self):
+        roommate = Roommate.objects.get(pk=self.roommate.pk)
+        roommate.household = Household.objects.create(name='otra')
+        with self.assertRaises(ValueError):
+            roommate.save()
+
+
+class PurgeTests(HouseholdTestCase):
+
+    def setUp(self):
+        super(PurgeTests, self).setUp()
+        self.category = Category.objects.create(name='luz')
+
+    def expense(self, roommate):
+        return Expense.objects.create(amount=10, roommate=roommate, category=self.category, year=2017, month=1)
+
+    def test_purges_removed_households_with_their_rows(self):
+        self.expense(self.roommate)
+        self.household.delete()
+        self.age(Household, self.household.pk)
+        Task.objects.all().delete()
+        call_command('purge_removed', batch_size=1, stdout=StringIO())
+        self.assertFalse(Household.all_objects.filter(pk=self.household.pk).exists())
+        self.assertFalse(Roommate.all_objects.filter(household_id=self.household.pk).exists())
+        for model in (Expense, ExpenseShare, MonthlyRollup, ExpenseChange):
+            self.assertFalse(model.objects.filter(household_id=self.household.pk).exists(), model)
+
+    def test_goes_by_the_time_of_removal(self):
+        self.household.delete()
+        # Modified long ago, removed recently.
+        Household.all_objects.filter(pk=self.household.pk).update(modified=timezone.now() - timedelta(days=100))
+        self.assertEqual(purge.purge(30)['Household'], 0)
+        self.age(Household, self.household.pk)
+        Household.all_objects.filter(pk=self.household.pk).update(modified=timezone.now())
+        Task.objects.all().delete()
+        self.assertEqual(purge.purge(30)['Household'], 1)
+
+    def test_skips_households_with_running_tasks(self):
+        self.household.delete()
+        self.age(Household, self.household.pk)
+        Task.objects.all().delete()
+        tasks.enqueue('expenses.rebuild_rollups', self.household.pk)
+        tasks.claim('worker')
+        self.assertEqual(purge.purge(30)['Household'], 0)
+
+    def test_keeps_removed_roommates_with_expenses(self):
+        self.expense(self.other_roommate)
+        elsewhere = Household.objects.create(name='otra')
+        unused = Roommate.objects.create(household=elsewhere, user=self.user)
+        self.other_roommate.delete()
+        unused.delete()
+        self.age(Roommate, self.other_roommate.pk, unused.pk)
+        self.assertEqual(purge.purge(30)['Roommate'], 1)
+        self.assertFalse(Roommate.all_objects.filter(pk=unused.pk).exists())
+        self.assertTrue(Roommate.all_objects.filter(pk=self.other_roommate.pk).exists())
+
+
+class BalanceTests(HouseholdTestCase):
+
+    def setUp(self):
+        super(BalanceTests, self).setUp()
+        self.category = Category.objects.create(name='luz')
+        self.client.force_login(self.user)
+
+    def balance(self, **params):
+        response = self.client.get(reverse('api:household_balance', kwargs={'pk': self.household.pk}), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_paid_owed_and_transfers(self):
+        Expense.objects.create(amount=100, roommate=self.roommate, category=self.category, year=2017, month=1)
+        Expense.objects.create(amount=31, roommate=self.other_roommate, year=2017, month=2)
+        data = self.balance()
+        self.assertEqual(data['total'], 131)
+        self.assertEqual(
+            [(row['user'], row['paid'], row['owed'], row['balance']) for row in data['roommates']],
+            [(self.user.pk, 100, 66, 34), (self.other.pk, 31, 65, -34)]
+        )
+        self.assertEqual(data['transfers'], [{'from': self.other_roommate.pk, 'to': self.roommate.pk, 'amount': 34}])
+        self.assertEqual(
+            data['categories'], [{'category': self.category.pk, 'total': 100}, {'category': None, 'total': 31}]
+        )
+        self.assertEqual([month['month'] for month in data['months']], [1, 2])
+
+        january = self.balance(year=2017, month=1)
+        self.assertEqual(january['total'], 100)
+        self.assertEqual(
+            january['transfers'], [{'from': self.other_roommate.pk, 'to': self.roommate.pk, 'amount': 50}]
+        )
+
+    def test_only_roommates_see_it(self):
+        self.client.force_login(User.objects.create_user('carla'))
+        response = self.client.get(reverse('api:household_balance', kwargs={'pk': self.household.pk}))
+        self.assertEqual(response.status_code, 403)
+
+    def test_invalid_period(self):
+        response = self.client.get(reverse('api:household_balance', kwargs={'pk': self.household.pk}), {'year': 'x'})
+        self.assertEqual(response.status_code, 400)
+
+
+class MembershipTests(HouseholdTestCase):
+
+    def test_cached_after_the_first_check(self):
+        self.assertTrue(membership.is_member(self.user.pk, self.household.pk))
+        with self.assertNumQueries(0):
+            self.assertTrue(membership.is_member(self.user.pk, self.household.pk))
+            self.assertFalse(membership.is_member(self.user.pk, self.household.pk + 1))
+
+    def test_joining_and_leaving_invalidate_it(self):
+        elsewhere = Household.objects.create(name='otra')
+        self.assertFalse(membership.is_member(self.user.pk, elsewhere.pk))
+        roommate = Roommate.objects.create(household=elsewhere, user=self.user)
+        self.assertTrue(membership.is_member(self.user.pk, elsewhere.pk))
+        roommate.delete()
+        self.assertFalse(membership.is_member(self.user.pk, elsewhere.pk))
+
+    def test_removing_the_household_invalidates_it_for_every_roommate(self):
+        self.assertTrue(membership.is_member(self.other.pk, self.household.pk))
+        self.household.delete()
+        self.assertFalse(membership.is_member(self.user.pk, self.household.pk))
+        self.assertFalse(membership.is_member(self.other.pk, self.household.pk))
 
-# Create your tests here.
+    def test_permission_follows_the_cache(self):
+        self.client.force_login(self.other)
+        url = reverse('api:household_balance', kwargs={'pk': self.household.pk})
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.other_roommate.delete()
+        self.assertEqual(self.client.get(url).status_code, 403)
@@ -1,19 +1,57 @@
 # -*- coding: utf-8 -*-
 from rest_framework import generics
 from rest_framework import permissions
+from rest_framework.exceptions import ValidationError
+from rest_framework.response import Response
+from rest_framework.views import APIView
 
+from core.conditional import ConditionalGetMixin
+from core.db import ReplicaReadsMixin
+from expenses.balance import household_balance
+
+from . import membership
+from .models import Household, Roommate
+from .permissions import HouseholdMixin, IsHouseholdMember
 from .serializers import HouseholdSerializer
 
 
-class HouseholdList(generics.ListCreateAPIView):
+class HouseholdList(ReplicaReadsMixin, ConditionalGetMixin, generics.ListCreateAPIView):
     """Lists all households for a given user."""
     serializer_class = HouseholdSerializer
     permission_classes = (permissions.IsAuthenticated, )
 
+    def get_version_scope(self):
+        return membership.version_scope(self.request.user.pk)
+
     def get_queryset(self):
         """
         This view should return a list of all the purchases
         for the currently authenticated user.
         """
-        user = self.request.user
-        return user.household_set.all()
+        return Household.objects.filter(id__in=membership.household_ids(self.request.user.pk))
+
+
+class HouseholdBalance(HouseholdMixin, APIView):
+    """Returns what each roommate paid and owes in a Household, and the transfers that settle it.
+
+    The results can be limited to a period with the `year` and `month` query parameters.
+    """
+    permission_classes = (IsHouseholdMember, )
+    household_url_kwarg = 'pk'
+
+    def get(self, request, pk):
+        household = self.get_household_id()
+        roommates = dict(Roommate.objects.filter(household_id=household).values_list('id', 'user_id'))
+        return Response(household_balance(
+            household,
+            roommates,
+            year=self._get_int_param('year'),
+            month=self._get_int_param('month')
+        ))
+
+    def _get_int_param(self, name):
+        value = self.request.query_params.get(name)
+        try:
+            return int(value) if value is not None else None
+        except ValueError:
+            raise ValidationError({name: "A valid integer is required."})